@@ -1,5 +1,6 @@
 from django.contrib import admin
 from . import models
+from .deletion import delete_listings
 from django.forms import ModelForm, ValidationError
 from django.utils.safestring import mark_safe
 from django import forms
@@ -69,13 +70,25 @@ class CarsListingAdmin(admin.ModelAdmin):
         "color"
     )
 
+    def delete_queryset(self, request, queryset):
+        # "Delete selected": batched, with the image files removed by the worker
+        delete_listings(queryset)
+
 
 # ---------- ListingImage ----------
 @admin.register(models.ListingImage)
 class ListingImageAdmin(admin.ModelAdmin):
-    list_display = ("id", "listing", "uploaded_at")
+    list_display = ("id", "listing", "processing_status", "uploaded_at")
     search_fields = ("listing__title",)
-    list_filter = ("uploaded_at",)
+    list_filter = ("processing_status", "uploaded_at")
+
+
+# ---------- ImageJob ----------
+@admin.register(models.ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "image", "status", "attempts", "run_after", "updated_at")
+    list_filter = ("status", "kind")
+    readonly_fields = ("last_error",)
 
 
 # ---------- Inquiry ----------
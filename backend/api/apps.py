@@ -5,3 +5,7 @@ class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = "Car Dealer CRM"
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
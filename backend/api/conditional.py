@@ -0,0 +1,52 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .versions import version_time
+
+
+# ---------- Conditional GET (ETag / Last-Modified) ----------
+
+def weak_etag(*parts):
+    # Weak: nginx gzips the body, and a strong ETag would no longer match it
+    return 'W/"%s"' % hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:32]
+
+
+def versions_modified(versions):
+    """Latest time any of ``versions`` was bumped, or None if one predates timestamped tokens."""
+    times = [version_time(version) for version in versions]
+    return None if None in times else max(times, default=None)
+
+
+class ConditionalMixin:
+    """
+    View mixin answering If-None-Match / If-Modified-Since with a 304
+    before the view (or the response cache) does any work.
+    ``get_validators()`` returns ``(etag, last_modified)`` or None.
+    """
+
+    def get_validators(self, request, action, **kwargs):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        action = self.action_map.get(method) if hasattr(self, 'action_map') else method
+        validators = self.get_validators(request, action, **kwargs) if method in ('get', 'head') else None
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        last_modified = int(last_modified) if last_modified is not None else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Revalidate every time; the 304 is cheap
+        response['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,30 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from api import metrics
+
+
+# ---------- PostgreSQL backend with connection metrics ----------
+#
+# ENGINE = "api.db". Same as django.db.backends.postgresql, plus counters
+# for new connections / pool checkouts and the time spent getting them
+# (see api/metrics.py and manage.py show_metrics).
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        started = time.perf_counter()
+        connection = super().get_new_connection(conn_params)
+        elapsed = (time.perf_counter() - started) * 1_000_000
+        if self.pool:
+            metrics.incr('db.pool_checkouts')
+            metrics.incr('db.pool_wait_us', elapsed)
+        else:
+            metrics.incr('db.connects')
+            metrics.incr('db.connect_us', elapsed)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            metrics.incr('db.pool_returns' if self.pool else 'db.closes')
+        super()._close()
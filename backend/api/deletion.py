@@ -0,0 +1,25 @@
+from django.db import transaction
+
+from .models import CarsListing
+from .signals import batched_file_release
+
+
+# ---------- Batched listing deletion ----------
+#
+# Each batch is one transaction: the rows go with a single queryset delete,
+# the signal handlers refresh derived data once per batch (on_commit_batch
+# in signals.py) and the image files are queued for the image worker with
+# one insert, instead of being removed in the request.
+
+DELETE_BATCH_SIZE = 200
+
+
+def delete_listings(queryset, batch_size=DELETE_BATCH_SIZE):
+    """Delete the listings of ``queryset`` in batches; returns how many were deleted."""
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    deleted = 0
+    for start in range(0, len(pks), batch_size):
+        with transaction.atomic(), batched_file_release():
+            _, counts = CarsListing.objects.filter(pk__in=pks[start:start + batch_size]).delete()
+        deleted += counts.get(CarsListing._meta.label, 0)
+    return deleted
@@ -0,0 +1,86 @@
+from django.db import connections
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import CarsListing
+
+
+# ---------- Facet counts for a filtered listings queryset ----------
+
+FK_FACETS = (
+    'make', 'model', 'fuel_type', 'transmission', 'condition', 'color', 'car_type', 'drive_type'
+)
+
+# Bucket edges line up with the inclusive *_min / *_max filters: bucket i is edges[i] <= value < edges[i + 1]
+RANGE_FACETS = {
+    'price': (0, 10000, 25000, 50000, 75000, 100000, 150000, None),
+    'year': (1900, 1960, 1970, 1980, 1990, 2000, 2010, 2020, None),
+    'mileage': (0, 25000, 50000, 100000, 150000, 200000, None),
+}
+
+
+def bucket_expression(field, edges):
+    whens = [
+        When(**{f"{field}__lt": upper}, then=Value(index))
+        for index, upper in enumerate(edges[1:])
+        if upper is not None
+    ]
+    return Case(*whens, default=Value(len(edges) - 2), output_field=IntegerField())
+
+
+def bucket_ranges(edges, counts):
+    buckets = []
+    for index, lower in enumerate(edges[:-1]):
+        upper = edges[index + 1]
+        buckets.append({
+            'min': lower,
+            'max': upper - 1 if upper is not None else None,
+            'count': counts.get(index, 0),
+        })
+    return buckets
+
+
+def compute_facets(queryset):
+    """
+    Per-value counts for every facet over ``queryset``. The FK and range
+    facets come from one aggregation with a grouping set per facet, so only
+    a row per facet value comes back; ``features`` from a second grouped
+    query on the M2M table.
+    """
+    queryset = queryset.select_related(None).prefetch_related(None).order_by()
+
+    buckets = {f"{field}_bucket": bucket_expression(field, edges) for field, edges in RANGE_FACETS.items()}
+    columns = [f"{field}_id" for field in FK_FACETS] + list(buckets)
+    filtered, params = queryset.annotate(**buckets).values('id', *columns).query.sql_with_params()
+    quote = connections[queryset.db].ops.quote_name
+    # M2M filters can repeat a listing, hence DISTINCT
+    sql = (
+        f"SELECT {', '.join(map(quote, columns))}, COUNT(DISTINCT {quote('id')}) FROM ({filtered}) AS filtered "
+        f"GROUP BY GROUPING SETS ({', '.join(f'({quote(column)})' for column in columns)})"
+    )
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    fk_counts = {field: {} for field in FK_FACETS}
+    range_counts = {field: {} for field in RANGE_FACETS}
+    targets = [fk_counts[field] for field in FK_FACETS] + [range_counts[field] for field in RANGE_FACETS]
+    for row in rows:
+        # Every column is NOT NULL, so the one set in a row is the facet it counts
+        for counts, value in zip(targets, row[:-1]):
+            if value is not None:
+                counts[value] = row[-1]
+                break
+
+    through = CarsListing.features.through
+    feature_rows = (
+        through.objects
+        .filter(carslisting_id__in=queryset.values('id'))
+        .values('feature_id')
+        .annotate(n=Count('id'))
+    )
+
+    facets = dict(fk_counts)
+    facets['features'] = {row['feature_id']: row['n'] for row in feature_rows}
+    for field, edges in RANGE_FACETS.items():
+        facets[field] = bucket_ranges(edges, range_counts[field])
+    return facets
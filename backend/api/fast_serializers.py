@@ -0,0 +1,219 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from rest_framework import serializers
+
+from .images import build_variant_urls
+from .models import ListingImage
+from .serializers import CarListingImageSerializer
+
+
+# ---------- Precompiled read-only serializers ----------
+#
+# A ModelSerializer class is compiled once into the ``.values()`` columns it
+# reads (to-one relations become joined columns), one ``.values()`` query per
+# to-many relation, and a generated function turning a row into the same
+# dict the serializer would return. Field conversions that are not a no-op
+# (dates, files) reuse the DRF field's own to_representation.
+
+# Fields whose to_representation leaves a database value unchanged
+NATIVE_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+
+
+def _image_url(prefix):
+    storage = ListingImage._meta.get_field('path').storage
+    column = f"{prefix}path"
+
+    def full_url(row, request):
+        url = storage.url(row[column])
+        return request.build_absolute_uri(url) if request else url
+    return [column], full_url
+
+
+def _image_srcset(prefix):
+    storage = ListingImage._meta.get_field('path').storage
+    status, variants = f"{prefix}processing_status", f"{prefix}variants"
+
+    def srcset(row, request):
+        if row[status] != ListingImage.STATUS_READY:
+            return {}
+        return build_variant_urls(row[variants], storage, request.build_absolute_uri if request else str)
+    return [status, variants], srcset
+
+
+# SerializerMethodFields have no column to read; these build them from the row
+ROW_METHODS = {
+    (CarListingImageSerializer, 'full_url'): _image_url,
+    (CarListingImageSerializer, 'srcset'): _image_srcset,
+}
+
+
+def _file_url(field, column):
+    storage = field.storage
+
+    def file_url(row, request):
+        name = row[column]
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+    return file_url
+
+
+def _prefixed(ordering, prefix):
+    return [f"-{prefix}{name[1:]}" if name.startswith('-') else f"{prefix}{name}" for name in ordering]
+
+
+class _Relation:
+    """A to-many field: fetched with one query for every owner row at once."""
+
+    def __init__(self, field, model_field, owner_column):
+        self.owner_column = owner_column
+        self.limit = getattr(field, 'max_items', None)
+        related = model_field.related_model
+
+        if model_field.many_to_many and not model_field.auto_created:
+            # Read the through table, with the target's columns joined in
+            self.queryset = model_field.remote_field.through._default_manager.all()
+            self.owner = f"{model_field.m2m_field_name()}_id"
+            prefix = f"{model_field.m2m_reverse_field_name()}__"
+            self.ordering = _prefixed(related._meta.ordering, prefix) + ['pk']
+        elif model_field.one_to_many:
+            self.queryset = related._default_manager.all()
+            self.owner = model_field.field.attname
+            prefix = ''
+            self.ordering = list(related._meta.ordering) + ['pk']
+        else:
+            raise ImproperlyConfigured(f"Can't compile the to-many field {model_field.name!r}.")
+
+        self.plan = _Plan(field.child, related, prefix)
+
+    def fetch(self, rows, request):
+        """``{owner pk: [serialized item, ...]}`` for the given owner rows."""
+        pks = {row[self.owner_column] for row in rows} - {None}
+        if not pks:
+            return {}
+        related = list(
+            self.queryset
+            .filter(**{f"{self.owner}__in": pks})
+            .order_by(*self.ordering)
+            .values(self.owner, *self.plan.columns)
+        )
+        items = self.plan.serialize(related, request)
+        groups = {}
+        for row, item in zip(related, items):
+            group = groups.setdefault(row[self.owner], [])
+            if self.limit is None or len(group) < self.limit:
+                group.append(item)
+        return groups
+
+
+class _Plan:
+    def __init__(self, serializer, model, prefix=''):
+        self.columns = []
+        self.relations = []
+        self.namespace = {}
+        expression = self._compile(serializer, model, prefix)
+        source = f"def build(row, request, groups):\n    return {expression}\n"
+        exec(compile(source, f"<compiled {type(serializer).__name__}>", 'exec'), self.namespace)
+        self.build = self.namespace['build']
+
+    def _column(self, name):
+        if name not in self.columns:
+            self.columns.append(name)
+        return f"row[{name!r}]"
+
+    def _bind(self, value):
+        name = f"_{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def _compile(self, serializer, model, prefix):
+        items = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            items.append(f"{name!r}: {self._compile_field(serializer, field, model, prefix)}")
+        return '{' + ', '.join(items) + '}'
+
+    def _compile_field(self, serializer, field, model, prefix):
+        label = f"{type(serializer).__name__}.{field.field_name}"
+        if isinstance(field, serializers.SerializerMethodField):
+            method = ROW_METHODS.get((type(serializer), field.field_name))
+            if method is None:
+                raise ImproperlyConfigured(f"{label}: no row method registered in ROW_METHODS.")
+            columns, function = method(prefix)
+            for column in columns:
+                self._column(column)
+            return f"{self._bind(function)}(row, request)"
+
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(f"{label}: source {field.source!r} is not a model field.")
+        column = f"{prefix}{field.source}"
+
+        if isinstance(field, serializers.ListSerializer):
+            owner_column = f"{prefix}{model._meta.pk.name}"
+            key = self._column(owner_column)
+            self.relations.append(_Relation(field, model_field, owner_column))
+            return f"(groups[{len(self.relations) - 1}].get({key}) or [])"
+
+        if isinstance(field, serializers.BaseSerializer):
+            if not (model_field.many_to_one or model_field.one_to_one):
+                raise ImproperlyConfigured(f"{label}: nested serializers must follow a to-one relation.")
+            nested = self._compile(field, model_field.related_model, f"{column}__")
+            if model_field.null:
+                key = self._column(f"{column}__{model_field.related_model._meta.pk.name}")
+                return f"(None if {key} is None else {nested})"
+            return nested
+
+        if model_field.is_relation:
+            raise ImproperlyConfigured(f"{label}: relation fields need a nested serializer.")
+
+        value = self._column(column)
+        if isinstance(field, serializers.FileField):
+            return f"{self._bind(_file_url(model_field, column))}(row, request)"
+        if isinstance(field, NATIVE_FIELDS):
+            return value
+        return f"(None if (value := {value}) is None else {self._bind(field.to_representation)}(value))"
+
+    def serialize(self, rows, request=None):
+        groups = [relation.fetch(rows, request) for relation in self.relations]
+        build = self.build
+        return [build(row, request, groups) for row in rows]
+
+
+class CompiledSerializer:
+    """
+    Read-only stand-in for a ModelSerializer class producing identical output:
+    ``values()`` narrows a queryset of its model to the columns needed, and
+    ``serialize()`` turns those rows into the serializer's dicts.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.plan = _Plan(serializer_class(), self.model)
+        # The row's pk is always fetched, e.g. for keyset pagination cursors
+        self.plan._column(self.model._meta.pk.name)
+
+    def values(self, queryset, *columns):
+        """``queryset`` as rows of the columns needed, plus ``columns``."""
+        return queryset.select_related(None).prefetch_related(None).values(*self.plan.columns, *columns)
+
+    def serialize(self, rows, request=None):
+        return self.plan.serialize(list(rows), request)
+
+
+@lru_cache(maxsize=512)
+def compile_serializer(serializer_class):
+    return CompiledSerializer(serializer_class)
+
+
+def fast_serializer(serializer_class):
+    """The compiled form of ``serializer_class``, or None when FAST_SERIALIZERS is off."""
+    if not getattr(settings, 'FAST_SERIALIZERS_ENABLED', False):
+        return None
+    return compile_serializer(serializer_class)
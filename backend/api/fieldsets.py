@@ -0,0 +1,47 @@
+from functools import lru_cache
+
+from rest_framework.exceptions import ValidationError
+
+from .serializers import CarsListingCardSerializer, CarsListingSerializer
+
+
+# ---------- ?view= / ?fields= projections of listing payloads ----------
+#
+# ``view`` picks a serializer (``card`` is what a listing card shows),
+# ``fields`` keeps only some of its top-level fields. Both are plain
+# serializer subclasses, so the query plans and compiled serializers built
+# for them fetch only the columns and relations they still need.
+
+LISTING_VIEWS = {
+    'full': CarsListingSerializer,
+    'card': CarsListingCardSerializer,
+}
+
+
+@lru_cache(maxsize=128)
+def sparse_serializer(serializer_class, fields):
+    """Subclass of ``serializer_class`` with only ``fields`` (a tuple of its field names)."""
+    kept = [name for name in serializer_class.Meta.fields if name in fields]
+    # A declared field set to None is dropped from the subclass
+    dropped = {name: None for name in serializer_class._declared_fields if name not in fields}
+    meta = type('Meta', (serializer_class.Meta,), {'fields': kept})
+    return type(f"Sparse{serializer_class.__name__}", (serializer_class,), {'Meta': meta, **dropped})
+
+
+def listing_serializer_class(params, default='full'):
+    """The listing serializer asked for by ``?view=`` and ``?fields=``; 400 on unknown names."""
+    view = params.get('view') or default
+    if view not in LISTING_VIEWS:
+        raise ValidationError({'view': f"Unknown view {view!r}; expected one of {', '.join(LISTING_VIEWS)}."})
+    serializer_class = LISTING_VIEWS[view]
+
+    fields = params.get('fields')
+    if not fields:
+        return serializer_class
+    names = {name.strip() for name in fields.split(',') if name.strip()}
+    unknown = names.difference(serializer_class.Meta.fields)
+    if unknown:
+        raise ValidationError({'fields': f"Unknown fields for the {view} view: {', '.join(sorted(unknown))}."})
+    if names.issuperset(serializer_class.Meta.fields):
+        return serializer_class
+    return sparse_serializer(serializer_class, tuple(sorted(names)))
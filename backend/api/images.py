@@ -0,0 +1,192 @@
+import base64
+import io
+import os
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+from . import response_cache
+from . import seo
+
+
+# ---------- Resized variants of listing images ----------
+
+# name -> target width in pixels, never upscaled
+VARIANT_WIDTHS = {
+    'thumbnail': 160,
+    'card': 480,
+    'gallery': 1024,
+    'full': 1920,
+}
+
+# format -> (Pillow format, extension, save options)
+VARIANT_FORMATS = {
+    'avif': ('AVIF', 'avif', {'quality': 55}),
+    'webp': ('WEBP', 'webp', {'quality': 78, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+# Placeholders: this many pixels on the longer side, as a low quality WebP (~200 bytes)
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_OPTIONS = {'quality': 40, 'method': 6}
+
+
+def supported_formats():
+    return [name for name in VARIANT_FORMATS if name == 'jpeg' or features.check(name)]
+
+
+def variant_name(original, size, extension):
+    folder, filename = os.path.split(original)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, 'variants', f"{stem}_{size}.{extension}")
+
+
+def load_picture(fh):
+    picture = Image.open(fh)
+    picture = ImageOps.exif_transpose(picture)
+    picture.load()
+    # EXIF and alpha are dropped: variants are plain RGB photos
+    return picture.convert('RGB')
+
+
+def open_original(image):
+    with image.path.open('rb') as fh:
+        return load_picture(fh)
+
+
+def render_placeholder(picture):
+    """A ``data:`` URI of ``picture`` shrunk to PLACEHOLDER_SIZE; browsers blur it when scaling up."""
+    small = picture.copy()
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    buffer = io.BytesIO()
+    if features.check('webp'):
+        small.save(buffer, 'WEBP', **PLACEHOLDER_OPTIONS)
+        content_type = 'image/webp'
+    else:
+        small.save(buffer, 'JPEG', quality=40)
+        content_type = 'image/jpeg'
+    return f"data:{content_type};base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+def placeholder_for(storage, name):
+    """The placeholder of the stored image ``name``, decoding JPEGs at a reduced scale."""
+    with storage.open(name, 'rb') as fh:
+        picture = Image.open(fh)
+        if picture.format == 'JPEG':
+            picture.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        picture = ImageOps.exif_transpose(picture)
+        picture.load()
+    return render_placeholder(picture.convert('RGB'))
+
+
+def render_variants(original, picture):
+    """Encode every size/format of ``picture``; returns ``{size: {...}}`` plus the encoded files."""
+    variants, files = {}, {}
+    for size, width in VARIANT_WIDTHS.items():
+        width = min(width, picture.width)
+        height = round(picture.height * width / picture.width)
+        resized = picture if width == picture.width else picture.resize((width, height), Image.LANCZOS)
+
+        entry = {'width': width, 'height': height}
+        for name in supported_formats():
+            pillow_format, extension, options = VARIANT_FORMATS[name]
+            buffer = io.BytesIO()
+            resized.save(buffer, pillow_format, **options)
+            path = variant_name(original, size, extension)
+            files[path] = buffer.getvalue()
+            entry[name] = path
+        variants[size] = entry
+    return variants, files
+
+
+def store_variants(storage, variants, files):
+    """Save the encoded files; returns ``variants`` with the names the storage saved them under."""
+    names = {path: storage.save(path, ContentFile(content)) for path, content in files.items()}
+    return {
+        size: {key: names[value] if key in VARIANT_FORMATS else value for key, value in entry.items()}
+        for size, entry in variants.items()
+    }
+
+
+def _mark_ready(image, variants, placeholder):
+    type(image).objects.filter(pk=image.pk).update(
+        variants=variants, placeholder=placeholder, processing_status=image.STATUS_READY
+    )
+    # update() sends no signal, and the serialized image now has a srcset
+    response_cache.invalidate(type(image))
+    seo.refresh_listings([image.listing_id])
+    image.variants = variants
+    image.placeholder = placeholder
+    image.processing_status = image.STATUS_READY
+
+
+def generate_variants(image):
+    """Write the resized copies of ``image`` to its storage and record them on the row."""
+    storage = image.path.storage
+    picture = open_original(image)
+    variants, files = render_variants(image.path.name, picture)
+
+    delete_variants(image)
+    variants = store_variants(storage, variants, files)
+    _mark_ready(image, variants, render_placeholder(picture))
+    return variants
+
+
+def reuse_variants(image):
+    """
+    Give ``image`` the variants of another image with the same stored
+    original, if there is one; only content-addressed storages share names.
+    Returns whether it did.
+    """
+    storage = image.path.storage
+    if not image.path or not hasattr(storage, 'reference'):
+        return False
+    processed = (
+        type(image).objects
+        .filter(path=image.path.name, processing_status=image.STATUS_READY)
+        .exclude(pk=image.pk)
+        .exclude(variants={})
+        .values_list('variants', 'placeholder')
+        .first()
+    )
+    if processed is None:
+        return False
+    variants, placeholder = processed
+    for path in variant_files(variants):
+        storage.reference(path)
+    _mark_ready(image, variants, placeholder)
+    return True
+
+
+def variant_files(variants):
+    for entry in (variants or {}).values():
+        for name in VARIANT_FORMATS:
+            if entry.get(name):
+                yield entry[name]
+
+
+def image_files(image):
+    """Every stored file of ``image``: the original and its variants."""
+    return ([image.path.name] if image.path else []) + list(variant_files(image.variants))
+
+
+def delete_variants(image):
+    storage = image.path.storage
+    for path in variant_files(image.variants):
+        if storage.exists(path):
+            storage.delete(path)
+
+
+def build_variant_urls(variants, storage, build_url):
+    return {
+        size: {
+            key: build_url(storage.url(value)) if key in VARIANT_FORMATS else value
+            for key, value in entry.items()
+        }
+        for size, entry in (variants or {}).items()
+    }
+
+
+def variant_urls(image, build_url):
+    return build_variant_urls(image.variants, image.path.storage, build_url)
@@ -0,0 +1,359 @@
+import csv
+import json
+import os
+from collections import Counter
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from PIL import Image
+
+from . import jobs
+from . import recommendations
+from . import response_cache
+from . import search
+from . import seo
+from .images import load_picture, render_placeholder, render_variants, store_variants, variant_files
+from .listing_index import listing_index
+from .models import (
+    CarsListing, ListingImage, Make, ModelName, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature,
+    SafetyFeature, listing_image_upload_to,
+)
+from .suggest import suggest_index
+from .versions import bump_version
+from .views import filters_snapshot
+
+
+# ---------- Bulk listing import (manage.py import_listings) ----------
+#
+# A row is one listing with its lookups given by name, e.g. as CSV:
+#   title,make,model,color,...,vin,price,features,safety_features,images
+#   Jaguar E-Type,Jaguar,E-Type,Red,...,1E12345,125000,Leather seats|Wire wheels,ABS,front.jpg|back.jpg
+# List columns hold names separated by LIST_SEPARATOR (or JSON arrays);
+# images are paths relative to the image directory.
+#
+# Names resolve case-insensitively, like the Lower(...) unique constraints,
+# through a per-run cache; missing lookups are created. Listings, M2M rows
+# and images are bulk inserted, so no signal runs: refresh_derived() does
+# what the handlers in signals.py would have done. A VIN that is already
+# stored is skipped, so re-running an import only adds what is missing.
+# A batch's images are stored before its transaction opens, and released
+# again if it rolls back.
+
+LIST_SEPARATOR = '|'
+RECOMMENDATIONS_REBUILD_AFTER = 500
+
+SCALAR_FIELDS = ['title', 'description', 'year', 'mileage', 'engine_size', 'cylinders', 'doors', 'vin', 'price']
+# column -> lookup model, for the to-one lookups besides model (which is per make)
+FK_FIELDS = {
+    'make': Make,
+    'color': Color,
+    'transmission': Transmission,
+    'condition': Condition,
+    'fuel_type': FuelType,
+    'drive_type': DriveType,
+    'car_type': CarType,
+}
+M2M_FIELDS = {
+    'features': Feature,
+    'safety_features': SafetyFeature,
+}
+
+# lookup model -> (name field, field scoping the name or None)
+LOOKUP_TABLES = {
+    Make: ('name', None),
+    ModelName: ('name', 'make_id'),
+    Color: ('name', None),
+    Transmission: ('type', None),
+    Condition: ('type', None),
+    FuelType: ('type', None),
+    DriveType: ('type', None),
+    CarType: ('type', None),
+    Feature: ('name', None),
+    SafetyFeature: ('name', None),
+}
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(path):
+    """Yield ``(line, row dict)`` from a .csv file or a .json array of objects."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as fh:
+            reader = csv.DictReader(fh)
+            for row in reader:
+                yield reader.line_num, row
+    elif extension == '.json':
+        with open(path, encoding='utf-8') as fh:
+            rows = json.load(fh)
+        if not isinstance(rows, list):
+            raise ValueError("A JSON import file must hold an array of listings.")
+        yield from enumerate(rows, start=1)
+    else:
+        raise ValueError(f"Unsupported import format {extension!r}; use .csv or .json.")
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _names(value):
+    if isinstance(value, list):
+        names = value
+    else:
+        names = _text(value).split(LIST_SEPARATOR)
+    return [name for name in (_text(name) for name in names) if name]
+
+
+class LookupCache:
+    """``(scope, lower-cased name) -> pk`` for every lookup table, loaded once per run."""
+
+    def __init__(self):
+        self._tables = {}
+        self.created = Counter()
+
+    def _load(self, model, lowered=None):
+        field, scope = LOOKUP_TABLES[model]
+        rows = model.objects.annotate(key=Lower(field))
+        if lowered is not None:
+            rows = rows.filter(key__in=lowered)
+        table = self._tables.setdefault(model, {})
+        if scope:
+            for pk, key, scope_value in rows.values_list('pk', 'key', scope):
+                table[(scope_value, key)] = pk
+        else:
+            for pk, key in rows.values_list('pk', 'key'):
+                table[(None, key)] = pk
+
+    def table(self, model):
+        if model not in self._tables:
+            self._load(model)
+        return self._tables[model]
+
+    def resolve(self, model, names):
+        """Make sure every ``(scope, name)`` in ``names`` exists; returns the table to look them up in."""
+        field, scope = LOOKUP_TABLES[model]
+        table = self.table(model)
+        missing = {}
+        for scope_value, name in names:
+            key = (scope_value, name.lower())
+            if key not in table:
+                # The first spelling seen is the one stored
+                missing.setdefault(key, name)
+        if missing:
+            model.objects.bulk_create(
+                [model(**{field: name, **({scope: key[0]} if scope else {})}) for key, name in missing.items()],
+                ignore_conflicts=True,
+            )
+            # No pks come back with ignore_conflicts (someone may have added the same name meanwhile)
+            self._load(model, {key[1] for key in missing})
+            self.created[model] += len(missing)
+        return table
+
+    def pk(self, model, name, scope=None):
+        return self.table(model)[(scope, name.lower())]
+
+
+def parse_row(row, image_dir):
+    """Validate one input row; returns the listing field values, lookup names and image paths."""
+    if not isinstance(row, dict):
+        raise RowError("Expected an object with the listing's fields.")
+    listing = {}
+    errors = []
+    for name in SCALAR_FIELDS:
+        field = CarsListing._meta.get_field(name)
+        value = row.get(name)
+        if isinstance(value, str) or value is None:
+            value = _text(value)
+            if value == '' and field.blank:
+                listing[name] = field.get_default()
+                continue
+        try:
+            listing[name] = field.clean(value, None)
+        except ValidationError as exc:
+            errors.append(f"{name}: {' '.join(exc.messages)}")
+
+    lookups = {}
+    for name in ['model', *FK_FIELDS]:
+        lookups[name] = _text(row.get(name))
+        if not lookups[name]:
+            errors.append(f"{name}: This field cannot be blank.")
+    m2m = {name: _names(row.get(name)) for name in M2M_FIELDS}
+
+    images = []
+    for name in _names(row.get('images')):
+        path = os.path.join(image_dir, name)
+        if not os.path.isfile(path):
+            errors.append(f"images: {name} not found in {image_dir}")
+        images.append(path)
+
+    if errors:
+        raise RowError(' '.join(errors))
+    return SimpleNamespace(listing=listing, lookups=lookups, m2m=m2m, images=images)
+
+
+def ingest_image(key, source):
+    """
+    Store one image file along with its variants, before its listing exists.
+    Runs in the import's process pool; returns ``(key, name, variants, placeholder, error)``.
+    """
+    storage = ListingImage._meta.get_field('path').storage
+    try:
+        with open(source, 'rb') as fh:
+            content = fh.read()
+            fh.seek(0)
+            picture = load_picture(fh)
+        upload = SimpleNamespace(listing_id=None)
+        name = storage.save(listing_image_upload_to(upload, os.path.basename(source)), ContentFile(content))
+        variants = store_variants(storage, *render_variants(name, picture))
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        return key, None, None, None, f"{os.path.basename(source)}: {exc}"
+    return key, name, variants, render_placeholder(picture), None
+
+
+class ListingImporter:
+    """
+    Imports batches of rows. ``executor`` (a concurrent.futures executor)
+    processes the images; they are processed inline without one.
+    """
+
+    def __init__(self, image_dir, executor=None):
+        self.image_dir = image_dir
+        self.executor = executor
+        self.lookups = LookupCache()
+        self.seen_vins = set()
+        self.created = []
+        self.skipped = 0
+        self.images = 0
+        self.errors = []
+
+    def import_batch(self, rows):
+        """Import ``[(line, row), ...]``; returns the number of listings created."""
+        parsed = []
+        for line, row in rows:
+            try:
+                item = parse_row(row, self.image_dir)
+            except RowError as exc:
+                self.errors.append(f"row {line}: {exc}")
+                continue
+            item.line = line
+            parsed.append(item)
+
+        vins = [item.listing['vin'] for item in parsed]
+        stored = set(CarsListing.objects.filter(vin__in=vins).values_list('vin', flat=True))
+        fresh = []
+        for item in parsed:
+            vin = item.listing['vin']
+            if vin in stored or vin in self.seen_vins:
+                self.skipped += 1
+            else:
+                self.seen_vins.add(vin)
+                fresh.append(item)
+        if not fresh:
+            return 0
+
+        # Outside the transaction: it locks the make rows (listings_count) until it commits
+        stored = self._store_images(fresh)
+        try:
+            with transaction.atomic():
+                listings = self._insert(fresh)
+                self._insert_images(listings, stored)
+        except BaseException:
+            # No row will reference the files stored for the batch
+            jobs.delete_files([
+                path for images in stored for name, variants, _ in images for path in [name, *variant_files(variants)]
+            ])
+            raise
+        self.created.extend(listing.pk for listing in listings)
+        return len(listings)
+
+    def _insert(self, items):
+        for name, model in FK_FIELDS.items():
+            self.lookups.resolve(model, {(None, item.lookups[name]) for item in items})
+        self.lookups.resolve(ModelName, {
+            (self.lookups.pk(Make, item.lookups['make']), item.lookups['model']) for item in items
+        })
+        for name, model in M2M_FIELDS.items():
+            self.lookups.resolve(model, {(None, value) for item in items for value in item.m2m[name]})
+
+        listings = []
+        for item in items:
+            listing = CarsListing(**item.listing)
+            for name, model in FK_FIELDS.items():
+                setattr(listing, f"{name}_id", self.lookups.pk(model, item.lookups[name]))
+            listing.model_id = self.lookups.pk(ModelName, item.lookups['model'], listing.make_id)
+            listings.append(listing)
+        listings = CarsListing.objects.bulk_create(listings, batch_size=1000)
+
+        for name, model in M2M_FIELDS.items():
+            through = getattr(CarsListing, name).through
+            target = getattr(CarsListing, name).field.m2m_reverse_field_name()
+            # A name listed twice (in any case) is one row
+            pairs = {
+                (listing.pk, self.lookups.pk(model, value))
+                for listing, item in zip(listings, items)
+                for value in item.m2m[name]
+            }
+            through.objects.bulk_create(
+                [through(carslisting_id=listing_id, **{f"{target}_id": pk}) for listing_id, pk in pairs],
+                batch_size=5000,
+            )
+
+        for make_id, count in Counter(listing.make_id for listing in listings).items():
+            Make.objects.filter(pk=make_id).update(listings_count=F('listings_count') + count)
+        return listings
+
+    def _store_images(self, items):
+        """``[(name, variants, placeholder), ...]`` per item, for the images that could be stored."""
+        stored = [[] for _ in items]
+        sources = [(index, path) for index, item in enumerate(items) for path in item.images]
+        if not sources:
+            return stored
+        mapper = self.executor.map if self.executor else map
+        for index, name, variants, placeholder, error in mapper(ingest_image, *zip(*sources)):
+            if error:
+                self.errors.append(f"row {items[index].line}: {error}")
+            else:
+                stored[index].append((name, variants, placeholder))
+        return stored
+
+    def _insert_images(self, listings, stored):
+        images = [
+            ListingImage(
+                listing_id=listing.pk, path=name, variants=variants, placeholder=placeholder,
+                processing_status=ListingImage.STATUS_READY,
+            )
+            for listing, item_images in zip(listings, stored)
+            for name, variants, placeholder in item_images
+        ]
+        ListingImage.objects.bulk_create(images, batch_size=1000)
+        self.images += len(images)
+
+    def finish(self):
+        """Refresh what signals.py would have after each save; call once all batches are in."""
+        refresh_derived(self.created, self.lookups.created)
+
+
+def refresh_derived(pks, lookup_models=()):
+    if not pks:
+        return
+    search.refresh_documents(pks)
+    suggest_index.refresh(listings=pks)
+    # Patching neighbour lists costs about a full rebuild once the import is large
+    if len(pks) > RECOMMENDATIONS_REBUILD_AFTER:
+        recommendations.rebuild_all()
+    else:
+        recommendations.refresh(set(pks))
+    if listing_index.enabled:
+        listing_index.invalidate()
+    seo.refresh_listings(pks)
+    filters_snapshot.invalidate()
+    bump_version('inventory')
+    # Make counts changed too
+    response_cache.invalidate(CarsListing, ListingImage, Make, *lookup_models)
@@ -0,0 +1,108 @@
+import logging
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .images import generate_variants
+from .models import ImageJob, ListingImage, MediaDeletion
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Database backed queue for image processing ----------
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(seconds=30)
+# A job still "running" after this long belongs to a worker that died
+STALE_AFTER = timedelta(minutes=15)
+
+JOB_HANDLERS = {
+    'variants': generate_variants,
+}
+
+
+def enqueue(image, kind='variants'):
+    ListingImage.objects.filter(pk=image.pk).update(processing_status=ListingImage.STATUS_PENDING)
+    return ImageJob.objects.create(image=image, kind=kind)
+
+
+def claim(limit):
+    """Mark up to ``limit`` due jobs as running and return their ids; safe with several workers."""
+    now = timezone.now()
+    ImageJob.objects.filter(status=ImageJob.STATUS_RUNNING, updated_at__lt=now - STALE_AFTER).update(
+        status=ImageJob.STATUS_PENDING
+    )
+    with transaction.atomic():
+        ids = list(
+            ImageJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=ImageJob.STATUS_PENDING, run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        ImageJob.objects.filter(id__in=ids).update(status=ImageJob.STATUS_RUNNING, updated_at=now)
+    return ids
+
+
+def run_job(job_id):
+    """Run one claimed job. Called inside the worker's process pool."""
+    close_old_connections()
+    job = ImageJob.objects.select_related('image').filter(pk=job_id).first()
+    if job is None:
+        # The image (and its jobs) were deleted meanwhile
+        return job_id, ImageJob.STATUS_DONE
+
+    job.attempts += 1
+    try:
+        JOB_HANDLERS[job.kind](job.image)
+    except Exception as exc:
+        logger.exception("Image job #%s (%s) failed", job.pk, job.kind)
+        job.last_error = f"{type(exc).__name__}: {exc}"
+        if job.attempts < MAX_ATTEMPTS:
+            job.status = ImageJob.STATUS_PENDING
+            job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = ImageJob.STATUS_FAILED
+            ListingImage.objects.filter(pk=job.image_id).update(processing_status=ListingImage.STATUS_FAILED)
+    else:
+        job.status = ImageJob.STATUS_DONE
+        job.last_error = ''
+    job.save(update_fields=['attempts', 'status', 'last_error', 'run_after', 'updated_at'])
+    return job_id, job.status
+
+
+
+# ---------- Deferred removal of stored files ----------
+
+FILE_BATCH = 500
+
+
+def queue_file_deletion(paths):
+    """Queue stored files for removal; inside a transaction, a rollback keeps them."""
+    MediaDeletion.objects.bulk_create([MediaDeletion(path=path) for path in paths])
+
+
+def delete_files(paths):
+    storage = ListingImage._meta.get_field('path').storage
+    for path in paths:
+        try:
+            storage.delete(path)
+        except OSError:
+            # Left to manage.py gc_media
+            logger.exception("Could not delete %s", path)
+
+
+def delete_queued_files(limit=FILE_BATCH):
+    """Remove up to ``limit`` queued files; safe with several workers. Returns how many were handled."""
+    with transaction.atomic():
+        rows = list(
+            MediaDeletion.objects
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'path')[:limit]
+        )
+        if rows:
+            delete_files(path for _, path in rows)
+            MediaDeletion.objects.filter(id__in=[pk for pk, _ in rows]).delete()
+    return len(rows)
@@ -0,0 +1,306 @@
+import threading
+from array import array
+
+from django.conf import settings
+
+from .facets import FK_FACETS, RANGE_FACETS, bucket_ranges
+from .models import CarsListing
+from .sorting import SORTS, normalize_sort
+from .versions import bump_version, get_version
+
+
+# ---------- In-memory columnar / bitmap index of listings ----------
+#
+# Every listing gets a slot. Numeric fields live in array('q') columns indexed
+# by slot, FK and M2M values map to Python ints used as bitsets over slots.
+# Filters AND/OR bitsets together and scan the numeric columns of what is left,
+# sorts walk a presorted list of slots. Only the page of rows that is actually
+# serialized is loaded from the database.
+
+NUMERIC_FIELDS = ('price', 'mileage', 'year', 'cylinders', 'doors', 'created_at')
+FK_FIELDS = ('make', 'model', 'car_type', 'drive_type', 'fuel_type', 'transmission', 'condition', 'color')
+M2M_FIELDS = ('features', 'safety_features')
+
+RANGE_FILTERS = {
+    'price_min': ('price', 'gte'),
+    'price_max': ('price', 'lte'),
+    'mileage_min': ('mileage', 'gte'),
+    'mileage_max': ('mileage', 'lte'),
+    'cylinders_min': ('cylinders', 'gte'),
+    'cylinders_max': ('cylinders', 'lte'),
+    'year_min': ('year', 'gte'),
+    'year_max': ('year', 'lte'),
+    'doors': ('doors', 'exact'),
+}
+
+# view / fields only shape the payload (api/fieldsets.py)
+INDEXED_PARAMS = set(RANGE_FILTERS) | set(FK_FIELDS) | set(M2M_FIELDS) | {'vin', 'sort_date', 'page', 'facets', 'view', 'fields'}
+
+def _timestamp(value):
+    return int(value.timestamp() * 1_000_000)
+
+
+def _slots(bits):
+    digits = bin(bits)[:1:-1]
+    slot = digits.find('1')
+    while slot != -1:
+        yield slot
+        slot = digits.find('1', slot + 1)
+
+
+class _Columns:
+    def __init__(self):
+        self.ids = array('q')
+        self.slot_of = {}
+        self.alive = 0
+        self.numeric = {field: array('q') for field in NUMERIC_FIELDS}
+        self.vins = []
+        self.fk_values = {field: array('q') for field in FK_FIELDS}
+        self.fk = {field: {} for field in FK_FIELDS}
+        self.m2m_values = {field: {} for field in M2M_FIELDS}
+        self.m2m = {field: {} for field in M2M_FIELDS}
+        self.orders = {}
+
+    def copy(self):
+        other = _Columns()
+        other.ids = array('q', self.ids)
+        other.slot_of = dict(self.slot_of)
+        other.alive = self.alive
+        other.numeric = {field: array('q', column) for field, column in self.numeric.items()}
+        other.vins = list(self.vins)
+        other.fk_values = {field: array('q', column) for field, column in self.fk_values.items()}
+        other.fk = {field: dict(bitsets) for field, bitsets in self.fk.items()}
+        other.m2m_values = {field: dict(values) for field, values in self.m2m_values.items()}
+        other.m2m = {field: dict(bitsets) for field, bitsets in self.m2m.items()}
+        return other
+
+    def _clear(self, slot):
+        bit = 1 << slot
+        self.alive &= ~bit
+        for field in FK_FIELDS:
+            value = self.fk_values[field][slot]
+            self.fk[field][value] = self.fk[field].get(value, 0) & ~bit
+        for field in M2M_FIELDS:
+            for value in self.m2m_values[field].pop(slot, ()):
+                self.m2m[field][value] &= ~bit
+
+    def put(self, row, m2m):
+        pk = row['id']
+        slot = self.slot_of.get(pk)
+        if slot is None:
+            slot = len(self.ids)
+            self.slot_of[pk] = slot
+            self.ids.append(pk)
+            for column in self.numeric.values():
+                column.append(0)
+            for column in self.fk_values.values():
+                column.append(0)
+            self.vins.append('')
+        else:
+            self._clear(slot)
+
+        bit = 1 << slot
+        self.alive |= bit
+        for field in NUMERIC_FIELDS:
+            value = row[field]
+            self.numeric[field][slot] = _timestamp(value) if field == 'created_at' else value
+        self.vins[slot] = row['vin'].lower()
+        for field in FK_FIELDS:
+            value = row[f"{field}_id"]
+            self.fk_values[field][slot] = value
+            self.fk[field][value] = self.fk[field].get(value, 0) | bit
+        for field in M2M_FIELDS:
+            values = frozenset(m2m.get(field, ()))
+            self.m2m_values[field][slot] = values
+            for value in values:
+                self.m2m[field][value] = self.m2m[field].get(value, 0) | bit
+        self.orders = {}
+
+    def remove(self, pk):
+        slot = self.slot_of.pop(pk, None)
+        if slot is not None:
+            self._clear(slot)
+            self.orders = {}
+
+    def order(self, sort):
+        order = self.orders.get(sort)
+        if order is None:
+            field, descending = SORTS[sort]
+            column, ids = self.numeric[field], self.ids
+            order = sorted(
+                _slots(self.alive),
+                key=lambda slot: (column[slot], ids[slot]),
+                reverse=descending,
+            )
+            self.orders[sort] = order
+        return order
+
+
+def _load_rows(queryset):
+    fields = ['id', 'vin', *NUMERIC_FIELDS, *(f"{field}_id" for field in FK_FIELDS)]
+    rows = {row['id']: row for row in queryset.order_by().values(*fields)}
+
+    m2m = {pk: {} for pk in rows}
+    for field in M2M_FIELDS:
+        through = getattr(CarsListing, field).through
+        target = getattr(CarsListing, field).field.m2m_reverse_field_name()
+        pairs = through.objects.filter(carslisting_id__in=list(rows)).values_list('carslisting_id', f"{target}_id")
+        for pk, value in pairs:
+            m2m[pk].setdefault(field, []).append(value)
+    return rows, m2m
+
+
+class IndexedResult:
+    """
+    Sequence of listings matched by the index, in sort order. Slicing loads
+    only the requested rows, so it can be handed to the paginator as is.
+    """
+
+    def __init__(self, ids, mask, columns, queryset):
+        self.ids = ids
+        self.mask = mask
+        self.columns = columns
+        self.queryset = queryset
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids[index]
+        # in_bulk() refuses .values() querysets, which the fast serializers page through
+        by_id = {
+            row['id'] if isinstance(row, dict) else row.pk: row
+            for row in self.queryset.filter(pk__in=ids)
+        }
+        return [by_id[pk] for pk in ids if pk in by_id]
+
+    def facets(self):
+        columns, mask = self.columns, self.mask
+        facets = {}
+        for field in FK_FACETS:
+            counts = {value: (bits & mask).bit_count() for value, bits in columns.fk[field].items()}
+            facets[field] = {value: n for value, n in counts.items() if n}
+        counts = {value: (bits & mask).bit_count() for value, bits in columns.m2m['features'].items()}
+        facets['features'] = {value: n for value, n in counts.items() if n}
+
+        for field, edges in RANGE_FACETS.items():
+            column = columns.numeric[field]
+            counts = {}
+            for slot in _slots(mask):
+                value = column[slot]
+                index = next(
+                    (i for i, upper in enumerate(edges[1:]) if upper is not None and value < upper),
+                    len(edges) - 2,
+                )
+                counts[index] = counts.get(index, 0) + 1
+            facets[field] = bucket_ranges(edges, counts)
+        return facets
+
+
+class ListingIndex:
+    def __init__(self):
+        self._columns = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'LISTING_INDEX_ENABLED', False)
+
+    def columns(self):
+        version = get_version('listing_index')
+        if self._columns is None or self._version != version:
+            with self._lock:
+                if self._columns is None or self._version != version:
+                    self._columns = self._build()
+                    self._version = version
+        return self._columns
+
+    def _build(self):
+        columns = _Columns()
+        rows, m2m = _load_rows(CarsListing.objects.all())
+        for pk, row in rows.items():
+            columns.put(row, m2m[pk])
+        return columns
+
+    def refresh(self, pks):
+        """Re-read the given listings (dropping deleted ones) and publish a new version."""
+        with self._lock:
+            # Patching columns that miss another worker's changes would publish them as current
+            if self._columns is None or self._version != get_version('listing_index'):
+                self.invalidate()
+                return
+            columns = self._columns.copy()
+            rows, m2m = _load_rows(CarsListing.objects.filter(pk__in=pks))
+            for pk in pks:
+                if pk in rows:
+                    columns.put(rows[pk], m2m[pk])
+                else:
+                    columns.remove(pk)
+            self._columns, self._version = columns, bump_version('listing_index')
+
+    def invalidate(self):
+        bump_version('listing_index')
+
+    def search(self, params, queryset):
+        """
+        Answer ``params`` (the request's query dict) from the index, or return
+        None when a parameter can't be served here and the ORM should handle it.
+        """
+        if not self.enabled or any(name not in INDEXED_PARAMS for name in params):
+            return None
+
+        columns = self.columns()
+        mask = columns.alive
+
+        try:
+            for field in FK_FIELDS:
+                if field in params:
+                    mask &= columns.fk[field][int(params[field])]
+
+            for field in M2M_FIELDS:
+                values = [value for value in params.getlist(field) if value != '']
+                if values:
+                    union = 0
+                    for value in values:
+                        union |= columns.m2m[field][int(value)]
+                    mask &= union
+
+            ranges = [
+                (columns.numeric[field], op, float(params[name]))
+                for name, (field, op) in RANGE_FILTERS.items()
+                if params.get(name, '') != ''
+            ]
+        except (KeyError, ValueError):
+            return None
+
+        vin = params.get('vin', '').lower()
+        if ranges or vin:
+            matched = 0
+            for slot in _slots(mask):
+                if vin and vin not in columns.vins[slot]:
+                    continue
+                if all(
+                    (op == 'gte' and column[slot] >= bound)
+                    or (op == 'lte' and column[slot] <= bound)
+                    or (op == 'exact' and column[slot] == bound)
+                    for column, op, bound in ranges
+                ):
+                    matched |= 1 << slot
+            mask = matched
+
+        sort = normalize_sort(params.get('sort_date'))
+        if sort is None:
+            return None
+
+        members = set(_slots(mask))
+        ids = [columns.ids[slot] for slot in columns.order(sort) if slot in members]
+        return IndexedResult(ids, mask, columns, queryset)
+
+
+listing_index = ListingIndex()
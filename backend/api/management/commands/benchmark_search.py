@@ -0,0 +1,79 @@
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+
+from api.models import CarsListing, ListingSearchDocument
+from api.search import ListingSearchFilter, refresh_documents
+from api.synthetic import analyze, load_inventory
+
+
+# Whole words, type-ahead prefixes, several terms and a typo
+DEFAULT_QUERIES = ['classic', 'conv', 'restored coupe', 'supercharged roadster 12', 'BENCH0000', 'convertable']
+PAGE_SIZE = 12
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ?search= latency of the full-text ListingSearchFilter with the old "
+        "SearchFilter (title icontains): first page plus count, as the list endpoint runs it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', help="Search strings (defaults to a built-in mix).")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query and backend.")
+        parser.add_argument(
+            '--synthetic', type=int, default=0, metavar='ROWS',
+            help="Benchmark against ROWS generated listings, rolled back afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Full-text search needs PostgreSQL.")
+
+        queries = options['queries'] or DEFAULT_QUERIES
+        try:
+            with transaction.atomic():
+                if options['synthetic']:
+                    started = time.monotonic()
+                    load_inventory(options['synthetic'])
+                    refresh_documents()
+                    analyze(CarsListing, ListingSearchDocument)
+                    self.stdout.write(f"Loaded {options['synthetic']} listings in {time.monotonic() - started:.1f}s")
+                self.run(queries, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, queries, repeat):
+        backends = {
+            'SearchFilter': (SearchFilter(), SimpleNamespace(search_fields=['title'])),
+            'full-text': (ListingSearchFilter(), None),
+        }
+        factory = RequestFactory()
+        self.stdout.write(f"{'query':<28} {'backend':<13} {'hits':>7} {'median ms':>10} {'p95 ms':>8}")
+
+        for text in queries:
+            request = Request(factory.get('/', {'search': text}))
+            for name, (backend, view) in backends.items():
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    queryset = backend.filter_queryset(request, CarsListing.objects.all(), view)
+                    list(queryset[:PAGE_SIZE])
+                    hits = queryset.count()
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f"{text[:28]:<28} {name:<13} {hits:>7} {statistics.median(timings):>10.2f} {p95:>8.2f}"
+                )
@@ -0,0 +1,122 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api import renderers
+from api.fast_serializers import compile_serializer
+from api.models import CarsListing, Make
+from api.query_plans import apply_query_plan
+from api.renderers import FastJSONRenderer
+from api.serializers import CarsListingCardSerializer, CarsListingSerializer
+from api.synthetic import load_inventory
+from api.views import TOP_MAKE_LISTINGS, TOP_MAKES
+
+
+PAGE_SIZE = 12
+
+
+class Rollback(Exception):
+    pass
+
+
+class SQLTimer:
+    def __init__(self):
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Per-item cost of the list, detail and top-makes payloads with the DRF serializers "
+        "and JSONRenderer versus the precompiled serializers and FastJSONRenderer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50, help="Runs per payload and path.")
+        parser.add_argument(
+            '--synthetic', type=int, default=0, metavar='ROWS',
+            help="Benchmark against ROWS generated listings, rolled back afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['synthetic']:
+                    load_inventory(options['synthetic'])
+                    for make in Make.objects.all():
+                        Make.objects.filter(pk=make.pk).update(listings_count=make.listings.count())
+                self.run(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def payloads(self):
+        newest = CarsListing.objects.order_by('-created_at').values_list('pk', flat=True)
+        page = list(newest[:PAGE_SIZE])
+        if not page:
+            raise CommandError("No listings to serialize; try --synthetic.")
+        makes = Make.objects.filter(listings_count__gt=0).order_by('-listings_count', 'name')[:TOP_MAKES]
+        cards = [pk for make in makes for pk in newest.filter(make=make)[:TOP_MAKE_LISTINGS]]
+        return {
+            'list': (CarsListingSerializer, page),
+            'detail': (CarsListingSerializer, page[:1]),
+            'top-makes': (CarsListingCardSerializer, cards),
+        }
+
+    def run(self, repeat):
+        request = Request(RequestFactory().get('/api/v1/car-listings/'))
+        if renderers.orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed: FastJSONRenderer falls back to json"))
+        self.stdout.write(
+            f"{'payload':<10} {'path':<5} {'items':>5} {'sql us/item':>12} {'serialize us/item':>18} "
+            f"{'render us/item':>15} {'total us/item':>14} {'bytes':>8}"
+        )
+
+        for name, (serializer_class, pks) in self.payloads().items():
+            compiled = compile_serializer(serializer_class)
+
+            def drf():
+                listings = list(apply_query_plan(CarsListing.objects.filter(pk__in=pks), serializer_class))
+                return serializer_class(listings, many=True, context={'request': request}).data
+
+            def fast():
+                return compiled.serialize(compiled.values(CarsListing.objects.filter(pk__in=pks)), request)
+
+            rendered = {}
+            for path, serialize, renderer in (('drf', drf, JSONRenderer()), ('fast', fast, FastJSONRenderer())):
+                sql_times, serialize_times, render_times = [], [], []
+                for _ in range(repeat):
+                    timer = SQLTimer()
+                    started = time.perf_counter()
+                    with connection.execute_wrapper(timer):
+                        data = serialize()
+                    serialized = time.perf_counter()
+                    content = renderer.render(data)
+                    # Both paths run the same queries; serialize is the Python time around them
+                    sql_times.append(timer.elapsed)
+                    serialize_times.append(serialized - started - timer.elapsed)
+                    render_times.append(time.perf_counter() - serialized)
+                rendered[path] = content
+
+                per_item = 1_000_000 / len(pks)
+                sql_us, serialize_us, render_us = (
+                    statistics.median(times) * per_item for times in (sql_times, serialize_times, render_times)
+                )
+                self.stdout.write(
+                    f"{name:<10} {path:<5} {len(pks):>5} {sql_us:>12.1f} {serialize_us:>18.1f} "
+                    f"{render_us:>15.1f} {sql_us + serialize_us + render_us:>14.1f} {len(content):>8}"
+                )
+
+            if rendered['drf'] != rendered['fast']:
+                self.stdout.write(self.style.ERROR(f"{name}: the two paths rendered different JSON"))
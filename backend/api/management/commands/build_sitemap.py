@@ -0,0 +1,18 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import seo
+
+
+class Command(BaseCommand):
+    help = "Write the sharded sitemap and the per-listing SSR metadata files under SEO_ROOT."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = seo.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {counts['urls']} listing URLs in {counts['shards']} shards and "
+            f"{counts['metadata']} metadata files to {settings.SEO_ROOT} in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,159 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import jobs
+from api.images import generate_variants, variant_files
+from api.models import ListingImage, MediaBlob, MediaDeletion
+
+
+# Where listing_image_upload_to puts images
+UPLOAD_DIR = 'listings'
+
+
+def scan(directory):
+    """``[(path, mtime, size), ...]`` for every file below ``directory``."""
+    found = []
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    found.append((entry.path, stat.st_mtime, stat.st_size))
+    return found
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile the listing image files in storage with the ListingImage rows: report files no row "
+        "references (orphans) and rows whose files are gone (missing), and optionally fix both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-orphans', action='store_true', help="Remove the orphaned files.")
+        parser.add_argument(
+            '--fix-missing', action='store_true',
+            help="Delete images whose original is gone and queue new variants for those missing only variants.",
+        )
+        parser.add_argument(
+            '--fix-references', action='store_true',
+            help="Set the reference counts of content-addressed blobs to the number of rows using them.",
+        )
+        parser.add_argument(
+            '--min-age', type=float, default=1.0, metavar='HOURS',
+            help="Only count files older than this as orphans (uploads in progress have no row yet).",
+        )
+        parser.add_argument('--workers', type=int, default=8, help="Threads scanning and deleting files.")
+
+    def handle(self, *args, **options):
+        storage = ListingImage._meta.get_field('path').storage
+        try:
+            roots = [storage.path(UPLOAD_DIR)]
+        except NotImplementedError:
+            raise CommandError("gc_media needs a storage on the local filesystem.")
+        blob_dir = getattr(storage, 'blob_dir', None)
+        if blob_dir:
+            roots.append(storage.path(blob_dir))
+        workers = max(1, options['workers'])
+        started = time.perf_counter()
+
+        # storage name -> (an image id, is the original); content-addressed names are shared
+        referenced = {}
+        users = Counter()
+        rows = ListingImage.objects.values_list('pk', 'path', 'variants').iterator(chunk_size=5000)
+        for pk, path, variants in rows:
+            referenced[path] = (pk, True)
+            users[path] += 1
+            for variant in variant_files(variants):
+                referenced[variant] = (pk, False)
+                users[variant] += 1
+
+        # One task per listing (or blob prefix) folder; they are small and many
+        directories, files = [], []
+        for root in roots:
+            if not os.path.isdir(root):
+                continue
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, stat.st_mtime, stat.st_size))
+        with ThreadPoolExecutor(workers) as pool:
+            for found in pool.map(scan, directories):
+                files.extend(found)
+
+        location = storage.path('')
+        cutoff = time.time() - options['min_age'] * 3600
+        present, orphans = set(), []
+        for path, mtime, size in files:
+            name = os.path.relpath(path, location).replace(os.sep, '/')
+            present.add(name)
+            if name not in referenced and mtime < cutoff:
+                orphans.append((path, name, size))
+        missing = {name: ref for name, ref in referenced.items() if name not in present}
+        lost = {pk for pk, original in missing.values() if original}
+        stale = {pk for pk, original in missing.values() if not original} - lost
+        miscounted = {}
+        if blob_dir:
+            counted = dict(MediaBlob.objects.values_list('name', 'references'))
+            # A queued deletion still holds its reference until the worker drops it
+            users.update(MediaDeletion.objects.values_list('path', flat=True))
+            names = {name for name in users if storage.is_blob(name)} | set(counted)
+            miscounted = {name: users[name] for name in names if counted.get(name) != users[name]}
+
+        self.stdout.write(
+            f"Scanned {len(files)} files in {len(directories)} folders and {len(referenced)} referenced files "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        self.stdout.write(
+            f"{len(orphans)} orphaned files ({sum(size for _, _, size in orphans) / 1e6:.1f} MB), "
+            f"{len(lost)} images without their original, {len(stale)} images missing variants, "
+            f"{len(miscounted)} blobs with a wrong reference count"
+        )
+        if options['verbosity'] > 1:
+            for path, _, _ in orphans:
+                self.stdout.write(f"orphan  {path}")
+            for name, (pk, _) in sorted(missing.items()):
+                self.stdout.write(f"missing {name} (image #{pk})")
+
+        if options['delete_orphans'] and orphans:
+            with ThreadPoolExecutor(workers) as pool:
+                list(pool.map(remove, [path for path, _, _ in orphans]))
+            MediaBlob.objects.filter(name__in=[name for _, name, _ in orphans]).delete()
+            self.stdout.write(self.style.SUCCESS(f"Removed {len(orphans)} orphaned files"))
+
+        if options['fix_missing'] and (lost or stale):
+            # The signal handlers queue the removal of whatever variants are left
+            ListingImage.objects.filter(pk__in=lost).delete()
+            for image in ListingImage.objects.filter(pk__in=stale):
+                if settings.IMAGE_JOBS_INLINE:
+                    generate_variants(image)
+                else:
+                    jobs.enqueue(image, 'variants')
+            self.stdout.write(self.style.SUCCESS(
+                f"Deleted {len(lost)} images without their original, queued variants for {len(stale)}"
+            ))
+
+        if options['fix_references'] and miscounted:
+            unused = [name for name, count in miscounted.items() if not count]
+            MediaBlob.objects.filter(name__in=unused).delete()
+            for name, count in miscounted.items():
+                if count:
+                    MediaBlob.objects.update_or_create(name=name, defaults={'references': count})
+            self.stdout.write(self.style.SUCCESS(f"Fixed the reference counts of {len(miscounted)} blobs"))
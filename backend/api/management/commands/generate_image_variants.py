@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.images import generate_variants
+from api.models import ListingImage
+
+
+class Command(BaseCommand):
+    help = "Create the resized variants for listing images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that already exist.")
+        parser.add_argument('--listing', type=int, help="Only process images of this listing.")
+
+    def handle(self, *args, **options):
+        images = ListingImage.objects.order_by('id')
+        if options['listing']:
+            images = images.filter(listing_id=options['listing'])
+        if not options['force']:
+            images = images.filter(variants={})
+
+        done = failed = 0
+        for image in images.iterator():
+            try:
+                generate_variants(image)
+                done += 1
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f"Image #{image.pk} ({image.path.name}): {exc}")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} images, {failed} failed"))
@@ -0,0 +1,84 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from multiprocessing import get_context
+
+import django
+from django.core.management.base import BaseCommand
+from django.db.models import Case, Value, When
+from PIL import Image
+
+from api import response_cache
+from api.images import placeholder_for
+from api.models import ListingImage
+
+
+def render(name):
+    """``(name, placeholder or None, error)``; runs in the command's process pool."""
+    storage = ListingImage._meta.get_field('path').storage
+    try:
+        return name, placeholder_for(storage, name), None
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        return name, None, f"{name}: {exc}"
+
+
+class Command(BaseCommand):
+    help = "Compute the inline placeholders of listing images that have none (or of all of them with --force)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Recompute the placeholders already stored.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Images per database update.")
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Processes decoding images; 1 decodes them in this process.",
+        )
+
+    def handle(self, *args, **options):
+        images = ListingImage.objects.exclude(path='')
+        if not options['force']:
+            images = images.filter(placeholder='')
+        # Images sharing a blob share a placeholder, so each file is decoded once
+        names = sorted(set(images.values_list('path', flat=True).iterator(chunk_size=5000)))
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+
+        started = time.perf_counter()
+        done = errors = 0
+        # spawn, not fork: children must not inherit the parent's DB sockets
+        pool = (
+            ProcessPoolExecutor(workers, mp_context=get_context('spawn'), initializer=django.setup)
+            if workers > 1 else nullcontext()
+        )
+        with pool as executor:
+            results = executor.map(render, names, chunksize=16) if executor else map(render, names)
+            pending = {}
+            for name, placeholder, error in results:
+                if error:
+                    self.stderr.write(error)
+                    errors += 1
+                    continue
+                pending[name] = placeholder
+                if len(pending) >= batch_size:
+                    done += self._store(images, pending)
+                    self.stdout.write(f"{done} images updated")
+            done += self._store(images, pending)
+
+        if done:
+            # update() sends no signal
+            response_cache.invalidate(ListingImage)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(names)} files, {done} images updated, {errors} errors in {elapsed:.1f}s "
+            f"({len(names) / elapsed if elapsed else 0:.0f} files/s)"
+        ))
+
+    def _store(self, images, pending):
+        """One UPDATE for the ``{name: placeholder}`` in ``pending``; returns the rows updated."""
+        if not pending:
+            return 0
+        updated = images.filter(path__in=pending).update(placeholder=Case(
+            *[When(path=name, then=Value(placeholder)) for name, placeholder in pending.items()]
+        ))
+        pending.clear()
+        return updated
@@ -0,0 +1,79 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+from multiprocessing import get_context
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import ListingImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import listings from a .csv or .json file, creating missing lookups and storing their images. "
+        "Listings whose VIN is already stored are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help="The .csv or .json file to import.")
+        parser.add_argument(
+            '--images', metavar='DIR',
+            help="Directory the images column is relative to (default: the source file's directory).",
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help="Listings per transaction.")
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Processes resizing images; 1 processes them in this process.",
+        )
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.isfile(source):
+            raise CommandError(f"{source} does not exist.")
+        image_dir = options['images'] or os.path.dirname(os.path.abspath(source))
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+
+        # spawn, not fork: children must not inherit the parent's DB sockets
+        pool = (
+            ProcessPoolExecutor(workers, mp_context=get_context('spawn'), initializer=django.setup)
+            if workers > 1 else nullcontext()
+        )
+        started = time.perf_counter()
+        read = 0
+        importer = None
+        try:
+            with pool as executor:
+                importer = ListingImporter(image_dir, executor)
+                rows = read_rows(source)
+                while batch := list(islice(rows, batch_size)):
+                    read += len(batch)
+                    created = importer.import_batch(batch)
+                    self.stdout.write(f"{read} rows read, {created} listings created")
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        except csv.Error as exc:
+            raise CommandError(f"Malformed CSV in {source}: {exc}")
+        finally:
+            imported = time.perf_counter() - started
+            # Batches committed before a failure still need their derived data
+            if importer is not None:
+                importer.finish()
+        elapsed = time.perf_counter() - started
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        created = len(importer.created)
+        lookups = ', '.join(f"{count} {model.__name__}" for model, count in importer.lookups.created.items())
+        self.stdout.write(
+            f"{created} listings and {importer.images} images created, {importer.skipped} existing VINs skipped, "
+            f"{len(importer.errors)} errors; new lookups: {lookups or 'none'}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{read} rows in {imported:.1f}s ({read / imported if imported else 0:.0f} rows/s, "
+            f"{created / imported if imported else 0:.0f} listings/s); derived data refreshed in {elapsed - imported:.1f}s"
+        ))
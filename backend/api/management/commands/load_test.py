@@ -0,0 +1,111 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# The public pages' API calls: home, search page, listing detail
+DEFAULT_PATHS = [
+    '/api/v1/top-makes/',
+    '/api/v1/filters/',
+    '/api/v1/car-listings/?view=card',
+    '/api/v1/car-listings/?view=card&sort_date=price&page=2',
+    '/api/v1/car-listings/{listing}/',
+    '/api/v1/car-listings/{listing}/other/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure throughput and latency of a running server (runserver, gunicorn, ...) "
+        "with concurrent keep-alive clients cycling through the public API endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Server base URL.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Parallel clients.")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run.")
+        parser.add_argument('--listing', type=int, help="Listing id for the detail paths (default: newest).")
+        parser.add_argument('paths', nargs='*', help="Paths to request, in turn (defaults to the public endpoints).")
+
+    def handle(self, *args, **options):
+        base = urlsplit(options['url'])
+        paths = options['paths'] or DEFAULT_PATHS
+        if any('{listing}' in path for path in paths):
+            listing = options['listing'] or self.newest_listing()
+            paths = [path.format(listing=listing) for path in paths]
+
+        latencies, errors = [], []
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def connect():
+            return http.client.HTTPConnection(base.hostname, base.port or 80, timeout=30)
+
+        def fetch(connection, path):
+            connection.request('GET', path, headers={'Host': base.netloc})
+            response = connection.getresponse()
+            response.read()
+            return response.status
+
+        def client(offset):
+            connection = connect()
+            local, failed, i = [], [], offset
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    try:
+                        status = fetch(connection, path)
+                    except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                        # A recycled worker closed the idle keep-alive socket; retry like a browser would
+                        connection.close()
+                        connection = connect()
+                        status = fetch(connection, path)
+                    if status >= 400:
+                        failed.append(f"{status} {path}")
+                except (OSError, http.client.HTTPException) as exc:
+                    failed.append(f"{type(exc).__name__} {path}")
+                    connection.close()
+                    connection = connect()
+                    continue
+                local.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(local)
+                errors.extend(failed)
+
+        started = time.monotonic()
+        workers = [threading.Thread(target=client, args=(n,)) for n in range(options['concurrency'])]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+
+        if not latencies:
+            raise CommandError(f"No successful requests ({len(errors)} errors, first: {errors[:1]})")
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f"{len(latencies)} requests in {elapsed:.1f}s with {options['concurrency']} clients")
+        self.stdout.write(f"throughput  {len(latencies) / elapsed:.1f} req/s")
+        self.stdout.write(
+            f"latency ms  p50 {percentile(0.5):.1f}  p95 {percentile(0.95):.1f}  "
+            f"p99 {percentile(0.99):.1f}  mean {statistics.mean(latencies) * 1000:.1f}"
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f"{len(errors)} errors, e.g. {errors[:3]}"))
+
+    def newest_listing(self):
+        from api.models import CarsListing
+        listing = CarsListing.objects.order_by('-created_at').values_list('pk', flat=True).first()
+        if listing is None:
+            raise CommandError("No listings to request; pass --listing or paths without {listing}.")
+        return listing
@@ -0,0 +1,49 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import claim, delete_queued_files, run_job
+from api.recommendations import refresh_queued
+
+
+class Command(BaseCommand):
+    help = (
+        "Work through queued image jobs using a pool of processes, remove the files of deleted images "
+        "and refresh the recommendations of changed listings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        # spawn, not fork: children must not inherit the parent's DB sockets
+        with ProcessPoolExecutor(workers, mp_context=get_context('spawn'), initializer=django.setup) as pool:
+            self.stdout.write(f"Processing image jobs with {workers} workers")
+            while True:
+                removed = delete_queued_files()
+                refreshed = refresh_queued()
+                ids = claim(workers * 4)
+                connections.close_all()
+                if removed:
+                    self.stdout.write(f"Removed {removed} deleted files")
+                if refreshed:
+                    self.stdout.write(f"Refreshed recommendations for {refreshed} listing changes")
+                if not ids:
+                    if removed or refreshed:
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                for future in as_completed([pool.submit(run_job, job_id) for job_id in ids]):
+                    job_id, status = future.result()
+                    self.stdout.write(f"Job #{job_id}: {status}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.recommendations import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Recompute the similar-listings table for every listing."
+
+    def handle(self, *args, **options):
+        count = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt recommendations for {count} listings"))
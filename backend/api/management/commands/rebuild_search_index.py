@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ListingSearchDocument
+from api.search import refresh_documents
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search document of every listing."
+
+    def handle(self, *args, **options):
+        refresh_documents()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {ListingSearchDocument.objects.count()} listings"))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from api import metrics
+
+
+RESPONSE_HITS = ('response_cache.hit_local', 'response_cache.hit_shared')
+
+# (label, numerator counters, denominator counters, scale)
+DERIVED = [
+    ("new DB connections per request", ('db.connects',), ('http.requests',), 1),
+    ("avg connect time (ms)", ('db.connect_us',), ('db.connects',), 0.001),
+    ("pool checkouts per request", ('db.pool_checkouts',), ('http.requests',), 1),
+    ("avg pool wait (ms)", ('db.pool_wait_us',), ('db.pool_checkouts',), 0.001),
+    ("response cache hit ratio", RESPONSE_HITS, (*RESPONSE_HITS, 'response_cache.miss'), 1),
+]
+
+
+class Command(BaseCommand):
+    help = "Print the counters collected by api/metrics.py across all workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Zero every counter after printing.")
+
+    def handle(self, *args, **options):
+        metrics.flush(force=True)
+        totals = metrics.totals()
+        if not totals:
+            self.stdout.write("No metrics recorded yet")
+            return
+
+        width = max(len(name) for name in totals)
+        for name, value in sorted(totals.items()):
+            self.stdout.write(f"{name:<{width}}  {value}")
+
+        for label, numerator, denominator, scale in DERIVED:
+            below = sum(totals.get(name, 0) for name in denominator)
+            if below:
+                above = sum(totals.get(name, 0) for name in numerator)
+                self.stdout.write(f"{label}: {above * scale / below:.3f}")
+
+        if options['reset']:
+            metrics.reset()
+            self.stdout.write("Counters reset")
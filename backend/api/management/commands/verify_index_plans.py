@@ -0,0 +1,98 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from api.models import CarsListing
+from api.synthetic import analyze, load_inventory
+from api.views import CarListingsFilter
+
+
+SORTS = ['created_at', 'price', '-price', 'mileage', '-mileage']
+
+# One entry per filter on its own plus the combinations the search page sends most
+FILTER_SETS = [
+    {},
+    {'make': 'make'},
+    {'model': 'model'},
+    {'make': 'make', 'price_max': 40000},
+    {'price_min': 20000, 'price_max': 60000},
+    {'mileage_max': 50000},
+    {'year_min': 1990, 'year_max': 1999},
+    {'year_min': 2015, 'price_max': 30000},
+    {'car_type': 'car_type', 'fuel_type': 'fuel_type'},
+    {'transmission': 'transmission', 'color': 'color'},
+    {'features': 'features'},
+    {'safety_features': 'safety_features'},
+    {'vin': 'A1B2'},
+]
+
+SEQ_SCAN = re.compile(r'Seq Scan on "?api_carslisting"?\b')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a synthetic inventory inside a rolled back transaction and check with EXPLAIN "
+        "that every listing filter/sort combination is served by an index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help="Number of synthetic listings.")
+        parser.add_argument('--verbose-plans', action='store_true', help="Print every plan.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Index plans can only be verified against PostgreSQL.")
+
+        self.failures = []
+        try:
+            with transaction.atomic():
+                lookups = self.load(options['rows'])
+                self.check_plans(lookups, options['verbose_plans'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        if self.failures:
+            raise CommandError(f"{len(self.failures)} combinations fall back to a sequential scan")
+        self.stdout.write(self.style.SUCCESS("Every combination uses an index"))
+
+    def load(self, rows):
+        started = time.monotonic()
+        lookups = load_inventory(rows)
+        analyze(CarsListing, CarsListing.features.through, CarsListing.safety_features.through)
+        self.stdout.write(f"Loaded {rows} listings in {time.monotonic() - started:.1f}s")
+        return lookups
+
+    def check_plans(self, lookups, verbose):
+        for filters in FILTER_SETS:
+            for sort in SORTS:
+                params = {
+                    name: lookups[value][0].pk if isinstance(value, str) and value in lookups else value
+                    for name, value in filters.items()
+                }
+                params['sort_date'] = sort
+                data = QueryDict(mutable=True)
+                for name, value in params.items():
+                    data.setlist(name, [value])
+                filterset = CarListingsFilter(data=data, queryset=CarsListing.objects.all())
+                if not filterset.is_valid():
+                    raise CommandError(f"Invalid filters {params}: {filterset.errors}")
+
+                # The first page is what the API runs for every request
+                plan = filterset.qs[:12].explain()
+                label = ' '.join(f"{k}={v}" for k, v in params.items())
+                if SEQ_SCAN.search(plan):
+                    self.failures.append(label)
+                    self.stdout.write(self.style.ERROR(f"SEQ  {label}"))
+                    self.stdout.write(plan)
+                else:
+                    self.stdout.write(f"ok   {label}")
+                    if verbose:
+                        self.stdout.write(plan)
@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.core.cache import cache
+
+
+# ---------- Process counters, totalled in the shared cache ----------
+#
+# incr() only touches a dict in this process. Every FLUSH_INTERVAL seconds
+# (checked at the end of a request) the deltas are added to cache keys, so
+# manage.py show_metrics sees the sum over all workers. Durations are
+# recorded as integer microseconds. On the file cache the totals are
+# approximate, since its incr() is not atomic.
+
+FLUSH_INTERVAL = 10
+PREFIX = 'metrics:'
+NAMES_KEY = 'metrics-names'
+
+_lock = threading.Lock()
+_pending = defaultdict(int)
+_last_flush = time.monotonic()
+
+
+def incr(name, value=1):
+    with _lock:
+        _pending[name] += int(value)
+
+
+def flush(force=False):
+    global _last_flush
+    with _lock:
+        if not force and time.monotonic() - _last_flush < FLUSH_INTERVAL:
+            return
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    names = set(cache.get(NAMES_KEY) or ())
+    if not names.issuperset(pending):
+        cache.set(NAMES_KEY, sorted(names | set(pending)), None)
+    for name, value in pending.items():
+        key = PREFIX + name
+        if not cache.add(key, value, None):
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                # Expired or evicted between add() and incr()
+                cache.set(key, value, None)
+
+
+def totals():
+    names = cache.get(NAMES_KEY) or []
+    values = cache.get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
+
+
+def reset():
+    names = cache.get(NAMES_KEY) or []
+    cache.delete_many([PREFIX + name for name in names] + [NAMES_KEY])
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_remove_inquirycomments_listing_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingRecommendations',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendations', serialize=False, to='api.carslisting')),
+                ('similar_ids', models.JSONField(default=list)),
+                ('scores', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Listing Recommendations',
+                'verbose_name_plural': 'Listing Recommendations',
+            },
+        ),
+    ]
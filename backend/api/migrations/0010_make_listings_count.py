@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_listings(apps, schema_editor):
+    Make = apps.get_model('api', 'Make')
+    CarsListing = apps.get_model('api', 'CarsListing')
+    counts = (
+        CarsListing.objects
+        .filter(make=OuterRef('pk'))
+        .order_by()
+        .values('make')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    Make.objects.update(listings_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_listingrecommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='make',
+            name='listings_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(count_listings, migrations.RunPython.noop),
+    ]
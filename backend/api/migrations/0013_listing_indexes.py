@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:36
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_imagejob_listingimage_processing_status'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=models.Index(models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='listing_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=models.Index(fields=['price', 'id'], name='listing_price_id'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=models.Index(fields=['mileage', 'id'], name='listing_mileage_id'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=models.Index(fields=['year', 'price'], name='listing_year_price'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=models.Index(models.F('make'), models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='listing_make_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=models.Index(models.F('model'), models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='listing_model_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=models.Index(fields=['make', 'price'], name='listing_make_price'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('vin', output_field=models.TextField())), name='gin_trgm_ops'), name='listing_vin_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='carslisting',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('title', output_field=models.TextField())), name='gin_trgm_ops'), name='listing_title_trgm'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:41
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# A frozen copy of api.search.REFRESH_SQL as of this migration, so it doesn't follow later model changes
+BUILD_SQL = """
+INSERT INTO {document} (listing_id, vector, updated_at)
+SELECT
+    l.id,
+    setweight(to_tsvector('english', l.title || ' ' || l.vin), 'A')
+    || setweight(to_tsvector('english', mk.name || ' ' || md.name), 'B')
+    || setweight(to_tsvector('english', concat_ws(' ',
+        (SELECT string_agg(f.name, ' ') FROM {listing_features} lf
+            JOIN {feature} f ON f.id = lf.feature_id WHERE lf.carslisting_id = l.id),
+        (SELECT string_agg(s.name, ' ') FROM {listing_safety_features} ls
+            JOIN {safety_feature} s ON s.id = ls.safetyfeature_id WHERE ls.carslisting_id = l.id)
+    )), 'C')
+    || setweight(to_tsvector('english', l.description), 'D'),
+    now()
+FROM {listing} l
+JOIN {make} mk ON mk.id = l.make_id
+JOIN {model} md ON md.id = l.model_id
+ON CONFLICT (listing_id) DO NOTHING
+"""
+
+
+def build_documents(apps, schema_editor):
+    listing = apps.get_model('api', 'CarsListing')
+    tables = {
+        'document': apps.get_model('api', 'ListingSearchDocument')._meta.db_table,
+        'listing': listing._meta.db_table,
+        'listing_features': listing.features.through._meta.db_table,
+        'listing_safety_features': listing.safety_features.through._meta.db_table,
+        'feature': apps.get_model('api', 'Feature')._meta.db_table,
+        'safety_feature': apps.get_model('api', 'SafetyFeature')._meta.db_table,
+        'make': apps.get_model('api', 'Make')._meta.db_table,
+        'model': apps.get_model('api', 'ModelName')._meta.db_table,
+    }
+    schema_editor.execute(BUILD_SQL.format(**{name: schema_editor.quote_name(table) for name, table in tables.items()}))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSearchDocument',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='api.carslisting')),
+                ('vector', django.contrib.postgres.search.SearchVectorField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Listing Search Document',
+                'verbose_name_plural': 'Listing Search Documents',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['vector'], name='listing_search_vector')],
+            },
+        ),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='placeholder',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+    ]
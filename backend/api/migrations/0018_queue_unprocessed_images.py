@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def queue_unprocessed_images(apps, schema_editor):
+    ListingImage = apps.get_model('api', 'ListingImage')
+    ImageJob = apps.get_model('api', 'ImageJob')
+
+    # Variants made before processing_status existed (0012) are done already;
+    # their placeholders come from manage.py generate_placeholders
+    ListingImage.objects.filter(processing_status='pending').exclude(variants={}).update(processing_status='ready')
+
+    # The rest never had a job: queue one for manage.py process_image_jobs
+    # (or run manage.py generate_image_variants where jobs run inline)
+    unqueued = (
+        ListingImage.objects
+        .filter(processing_status='pending', variants={})
+        .exclude(path='')
+        .exclude(jobs__status__in=['pending', 'running'])
+        .values_list('pk', flat=True)
+    )
+    ImageJob.objects.bulk_create(
+        [ImageJob(image_id=pk, kind='variants') for pk in unqueued.iterator(chunk_size=5000)],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_listingimage_placeholder'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_unprocessed_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_queue_unprocessed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Recommendation Refresh',
+                'verbose_name_plural': 'Recommendation Refreshes',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -3,13 +3,19 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 import os
 from django.core.validators import RegexValidator
-from django.db.models import F,UniqueConstraint
-from django.db.models.functions import Lower
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import storages
+from django.db.models import F, Q, UniqueConstraint
+from django.db.models.functions import Cast, Lower, Upper
+from django.utils import timezone
 
 
 # ---------- Lookup tables ----------
 class Make(models.Model):
     name = models.CharField(max_length=100, unique=False)
+    # Maintained by signals.py on listing create/delete/make change
+    listings_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
 
     class Meta:
         ordering = ["name"]
@@ -195,17 +201,29 @@ class CarsListing(models.Model):
         verbose_name = "Car Listing"
         verbose_name_plural = "Car Listings"
         ordering = ["-created_at"]
+        # Matched to CarListingsFilter and the sort_date orders (see api/sorting.py);
+        # checked with manage.py verify_index_plans
+        indexes = [
+            models.Index(F("created_at").desc(), F("id").desc(), name="listing_created_id"),
+            models.Index(fields=["price", "id"], name="listing_price_id"),
+            models.Index(fields=["mileage", "id"], name="listing_mileage_id"),
+            models.Index(fields=["year", "price"], name="listing_year_price"),
+            models.Index(F("make"), F("created_at").desc(), F("id").desc(), name="listing_make_created_id"),
+            models.Index(F("model"), F("created_at").desc(), F("id").desc(), name="listing_model_created_id"),
+            models.Index(fields=["make", "price"], name="listing_make_price"),
+            # icontains compiles to UPPER(col::text) LIKE UPPER('%q%'), which only a trigram index can serve
+            GinIndex(
+                OpClass(Upper(Cast("vin", output_field=models.TextField())), name="gin_trgm_ops"),
+                name="listing_vin_trgm",
+            ),
+            GinIndex(
+                OpClass(Upper(Cast("title", output_field=models.TextField())), name="gin_trgm_ops"),
+                name="listing_title_trgm",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.title} ({self.make} {self.model}, {self.year})"
-    
-    def delete(self, *args, **kwargs):
-        # Ensure related images are deleted first
-        for image in self.images.all():
-            image.delete()  # Calls ListingImage's delete method
-
-        # Now delete the listing itself
-        super().delete(*args, **kwargs)
 
 
 def listing_image_upload_to(instance: "ListingImage", filename: str) -> str:
@@ -215,9 +233,31 @@ def listing_image_upload_to(instance: "ListingImage", filename: str) -> str:
     return os.path.join("listings", str(listing_id), new_filename)
 
 
+def listing_image_storage():
+    # STORAGES["listing_images"]: content-addressed by default (api/storage.py)
+    return storages["listing_images"]
+
+
 class ListingImage(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_READY = "ready"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_READY, "Ready"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
     listing = models.ForeignKey(CarsListing, on_delete=models.CASCADE, related_name="images")
-    path = models.ImageField(upload_to=listing_image_upload_to)
+    path = models.ImageField(upload_to=listing_image_upload_to, storage=listing_image_storage, max_length=255)
+    # Resized copies written by api/images.py: {size: {"width": ..., format: storage path}}
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Until "ready" the API serves only the original
+    processing_status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, editable=False
+    )
+    # A data: URI of a tiny blurred copy, shown until the image loads (api/images.py)
+    placeholder = models.TextField(blank=True, default="", editable=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -235,10 +275,124 @@ class ListingImage(models.Model):
         request_domain = "https://zoom-vintageclassics.com"
         return f"{request_domain}{settings.MEDIA_URL}{self.path}"
 
-    def delete(self, *args, **kwargs):
-        if self.path:
-            self.path.delete(save=False)
-        super().delete(*args, **kwargs)
+
+class ImageJob(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    image = models.ForeignKey(ListingImage, on_delete=models.CASCADE, related_name="jobs")
+    kind = models.CharField(max_length=30)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_after = models.DateTimeField(default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["run_after", "id"]
+        verbose_name = "Image Job"
+        verbose_name_plural = "Image Jobs"
+        indexes = [
+            # The worker only ever looks for due pending jobs
+            models.Index(
+                fields=["run_after", "id"],
+                condition=Q(status="pending"),
+                name="imagejob_pending_run_after",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} job for image #{self.image_id} ({self.status})"
+
+
+class MediaBlob(models.Model):
+    """A stored file shared by every upload with the same content, with its reference count."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Media Blob"
+        verbose_name_plural = "Media Blobs"
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.references} references)"
+
+
+class MediaDeletion(models.Model):
+    """A stored file whose row is gone; removed by the image worker (see api/jobs.py)."""
+    path = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Media Deletion"
+        verbose_name_plural = "Media Deletions"
+
+    def __str__(self) -> str:
+        return self.path
+
+
+class ListingRecommendations(models.Model):
+    listing = models.OneToOneField(
+        CarsListing, on_delete=models.CASCADE, primary_key=True, related_name="recommendations"
+    )
+    similar_ids = models.JSONField(default=list)
+    scores = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Listing Recommendations"
+        verbose_name_plural = "Listing Recommendations"
+
+    def __str__(self) -> str:
+        return f"Recommendations for listing #{self.listing_id}"
+
+
+class RecommendationRefresh(models.Model):
+    """A changed listing whose neighbour lists the image worker must refresh (see api/recommendations.py)."""
+    # Not a foreign key: deleted listings must leave the lists they were in
+    listing_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Recommendation Refresh"
+        verbose_name_plural = "Recommendation Refreshes"
+
+    def __str__(self) -> str:
+        return f"Refresh for listing #{self.listing_id}"
+
+
+class ListingSearchDocument(models.Model):
+    """Weighted tsvector of a listing, kept apart so listing queries never load it (see api/search.py)."""
+    listing = models.OneToOneField(
+        CarsListing, on_delete=models.CASCADE, primary_key=True, related_name="search_document"
+    )
+    vector = SearchVectorField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Listing Search Document"
+        verbose_name_plural = "Listing Search Documents"
+        indexes = [
+            GinIndex(fields=["vector"], name="listing_search_vector"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Search document for listing #{self.listing_id}"
+
 
 class Inquiry(models.Model):
     listing = models.ForeignKey(
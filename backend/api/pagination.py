@@ -0,0 +1,143 @@
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .sorting import SORTS, normalize_sort
+from .versions import get_version
+
+
+# ---------- Keyset ("seek") pagination for listings ----------
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class ListingKeysetPagination(BasePagination):
+    """
+    Pages through listings with ``WHERE (sort_column, id) > cursor`` instead
+    of OFFSET, in whichever order ``sort_date`` asks for. There is no
+    COUNT(*): ``?count=1`` returns a total cached per filter set until the
+    inventory changes.
+    """
+    page_size = 12
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    count_timeout = 60 * 60
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def decode_cursor(self, request, sort):
+        """The cursor for ``sort`` with its ``v`` parsed to the sort column's type, or None."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if not isinstance(cursor, dict) or cursor['s'] != sort or not _is_int(cursor['i']):
+                raise ValueError
+            field, _ = SORTS[sort]
+            if field == 'created_at':
+                # parse_datetime returns None for text that isn't a datetime at all
+                value = parse_datetime(cursor['v']) if isinstance(cursor['v'], str) else None
+                if value is None:
+                    raise ValueError
+                cursor['v'] = value
+            elif not _is_int(cursor['v']):
+                raise ValueError
+            return cursor
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, sort, listing, reverse):
+        field, _ = SORTS[sort]
+        # Model instances, or .values() rows from the fast serializers
+        if isinstance(listing, dict):
+            value, pk = listing[field], listing['id']
+        else:
+            value, pk = getattr(listing, field), listing.pk
+        cursor = {'s': sort, 'v': value.isoformat() if field == 'created_at' else value, 'i': pk}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.sort = normalize_sort(request.query_params.get('sort_date'))
+        if self.sort is None:
+            raise NotFound('Keyset pagination needs a single sort_date.')
+
+        field, descending = SORTS[self.sort]
+        cursor = self.decode_cursor(request, self.sort)
+        filtered = queryset
+        # Walking backwards flips the order, then the page is flipped back
+        reverse = bool(cursor and cursor.get('r'))
+        forward_desc = descending != reverse
+        prefix = '-' if forward_desc else ''
+        queryset = queryset.order_by(f"{prefix}{field}", f"{prefix}id")
+
+        if cursor:
+            value = cursor['v']
+            lookup = 'lt' if forward_desc else 'gt'
+            queryset = queryset.filter(
+                Q(**{f"{field}__{lookup}": value})
+                | Q(**{field: value, f"id__{lookup}": cursor['i']})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_link = self.previous_link = None
+        if rows:
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(self.sort, rows[-1], reverse=False)
+            if cursor and (has_more or not reverse):
+                self.previous_link = self.encode_cursor(self.sort, rows[0], reverse=True)
+
+        self.count = self.cached_count(filtered, request) if self.wants_count(request) else None
+        return rows
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param) in ('1', 'true')
+
+    def cached_count(self, queryset, request):
+        params = sorted(
+            (key, value)
+            for key, values in request.query_params.lists()
+            for value in values
+            if key not in (self.cursor_query_param, self.count_query_param, 'sort_date', 'paginate', 'facets')
+        )
+        digest = hashlib.sha1(json.dumps(params).encode()).hexdigest()
+        key = f"listing-count:{get_version('inventory')}:{digest}"
+
+        count = cache.get(key)
+        if count is None:
+            count = queryset.order_by().count()
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+        ])
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+
+def uses_keyset_pagination(request):
+    return 'cursor' in request.query_params or request.query_params.get('paginate') == 'cursor'
@@ -0,0 +1,83 @@
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def query_budget(limit, label):
+    """
+    Count the queries run inside the block and complain when there are more
+    than ``limit`` of them: raise in DEBUG/tests, log a warning otherwise.
+    """
+    # Connecting runs setup queries (django.contrib.postgres looks up its types); they
+    # belong to the connection, not the view
+    connection.ensure_connection()
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+    if counter.count > limit:
+        message = f"{label} ran {counter.count} queries (budget {limit})"
+        if getattr(settings, 'QUERY_BUDGET_STRICT', settings.DEBUG):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def with_query_budget(limit):
+    """Decorator form of ``query_budget`` for function based views."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            with query_budget(limit, view.__name__):
+                return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+class QueryBudgetMixin:
+    """
+    ``query_budget`` is either an int applied to every action or a dict
+    keyed by action name (``list``, ``retrieve``, ``get``...).
+    """
+    query_budget = None
+
+    def get_query_budget(self):
+        budget = self.query_budget
+        if isinstance(budget, dict):
+            action = getattr(self, 'action', None) or self.request.method.lower()
+            return budget.get(action)
+        return budget
+
+    def dispatch(self, request, *args, **kwargs):
+        self.request = request
+        limit = None
+        if request.method.lower() in self.http_method_names:
+            self.args, self.kwargs = args, kwargs
+            if hasattr(self, 'action_map'):
+                self.action = self.action_map.get(request.method.lower())
+            limit = self.get_query_budget()
+
+        if limit is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        label = f"{type(self).__name__}.{getattr(self, 'action', None) or request.method.lower()}"
+        with query_budget(limit, label):
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,98 @@
+from functools import lru_cache
+
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+# ---------- Serializer -> select/prefetch plan ----------
+
+def _related_field(model, source):
+    try:
+        return model._meta.get_field(source)
+    except Exception:
+        return None
+
+
+def _walk(serializer, model, prefix, select, prefetch):
+    for field in serializer.fields.values():
+        if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+            continue
+
+        source = field.source.replace('.', '__')
+        model_field = _related_field(model, source.split('__')[0])
+        if model_field is None or not model_field.is_relation:
+            continue
+
+        path = f"{prefix}{source}"
+        related_model = model_field.related_model
+
+        if isinstance(field, serializers.ListSerializer) or model_field.many_to_many or model_field.one_to_many:
+            child = field.child if isinstance(field, serializers.ListSerializer) else None
+            child_select, child_prefetch = [], []
+            if isinstance(child, serializers.BaseSerializer):
+                _walk(child, related_model, '', child_select, child_prefetch)
+            queryset = related_model._default_manager.all()
+            if child_select:
+                queryset = queryset.select_related(*child_select)
+            if child_prefetch:
+                queryset = queryset.prefetch_related(*child_prefetch)
+            prefetch.append(Prefetch(path, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(path)
+            _walk(field, related_model, f"{path}__", select, prefetch)
+
+
+@lru_cache(maxsize=512)
+def build_query_plan(serializer_class):
+    """
+    Walk the serializer's field tree and return the ``(select_related,
+    prefetch_related)`` lookups needed to serialize a queryset of its model
+    in a fixed number of queries.
+    """
+    select, prefetch = [], []
+    _walk(serializer_class(), serializer_class.Meta.model, '', select, prefetch)
+    return tuple(select), tuple(prefetch)
+
+
+def _columns(serializer, model, prefix, columns):
+    for field in serializer.fields.values():
+        if field.source == '*' or '.' in field.source or isinstance(field, serializers.SerializerMethodField):
+            return False
+        model_field = _related_field(model, field.source)
+        if model_field is None:
+            return False
+        if isinstance(field, serializers.ListSerializer) or model_field.many_to_many or model_field.one_to_many:
+            # Prefetched with their own queryset
+            continue
+
+        path = f"{prefix}{field.source}"
+        columns.append(path)
+        if isinstance(field, serializers.BaseSerializer):
+            if not _columns(field, model_field.related_model, f"{path}__", columns):
+                return False
+    return True
+
+
+@lru_cache(maxsize=512)
+def build_column_plan(serializer_class):
+    """
+    The ``only()`` fields the serializer reads from its model and the
+    select_related models, or None when it reads anything but model fields.
+    """
+    columns = []
+    if not _columns(serializer_class(), serializer_class.Meta.model, '', columns):
+        return None
+    return tuple(columns)
+
+
+def apply_query_plan(queryset, serializer_class, columns=()):
+    """Select, prefetch and load only what ``serializer_class`` needs, plus ``columns``."""
+    select, prefetch = build_query_plan(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    only = build_column_plan(serializer_class)
+    if only is not None:
+        queryset = queryset.only(*only, *columns)
+    return queryset
@@ -0,0 +1,192 @@
+import math
+
+from django.conf import settings
+from django.db import transaction
+
+from .listing_index import _load_rows
+from .models import CarsListing, ListingRecommendations, RecommendationRefresh
+
+
+# ---------- "Similar listings" recommender ----------
+#
+# Each listing keeps its NEIGHBOURS best matches in ListingRecommendations,
+# best first. A listing change rescores that listing against the inventory
+# and patches only the neighbour lists it enters or leaves. That reads every
+# profile, so saves queue it for the image worker, which refreshes all the
+# listings changed since its last pass at once.
+
+NEIGHBOURS = 8
+RESULT_SIZE = 4
+REFRESH_BATCH = 1000
+
+WEIGHTS = {
+    'model': 3.0,
+    'make': 2.0,
+    'car_type': 1.5,
+    'price': 1.5,
+    'year': 1.0,
+    'features': 1.0,
+    'safety_features': 0.5,
+}
+
+
+class Profile:
+    __slots__ = ('id', 'make', 'model', 'car_type', 'price_band', 'year_band', 'features', 'safety_features')
+
+    def __init__(self, row, m2m):
+        self.id = row['id']
+        self.make = row['make_id']
+        self.model = row['model_id']
+        self.car_type = row['car_type_id']
+        # Bands 25% wide in price and 5 years wide in age
+        self.price_band = int(math.log(max(row['price'], 1), 1.25))
+        self.year_band = row['year'] // 5
+        self.features = frozenset(m2m.get('features', ()))
+        self.safety_features = frozenset(m2m.get('safety_features', ()))
+
+
+def _band(a, b):
+    distance = abs(a - b)
+    return 1.0 if distance == 0 else 0.5 if distance == 1 else 0.0
+
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def similarity(a, b):
+    score = 0.0
+    if a.model == b.model:
+        score += WEIGHTS['model'] + WEIGHTS['make']
+    elif a.make == b.make:
+        score += WEIGHTS['make']
+    if a.car_type == b.car_type:
+        score += WEIGHTS['car_type']
+    score += WEIGHTS['price'] * _band(a.price_band, b.price_band)
+    score += WEIGHTS['year'] * _band(a.year_band, b.year_band)
+    score += WEIGHTS['features'] * _jaccard(a.features, b.features)
+    score += WEIGHTS['safety_features'] * _jaccard(a.safety_features, b.safety_features)
+    return round(score, 4)
+
+
+def load_profiles():
+    rows, m2m = _load_rows(CarsListing.objects.all())
+    return {pk: Profile(row, m2m[pk]) for pk, row in rows.items()}
+
+
+def rank(profile, profiles):
+    scored = [
+        (similarity(profile, other), other.id)
+        for other in profiles.values()
+        if other.id != profile.id
+    ]
+    # Best score first, newer listing first on ties
+    scored.sort(key=lambda item: (-item[0], -item[1]))
+    return scored[:NEIGHBOURS]
+
+
+def _store(pk, ranked, existing=None):
+    recommendations = existing or ListingRecommendations(listing_id=pk)
+    recommendations.similar_ids = [other for _, other in ranked]
+    recommendations.scores = [score for score, _ in ranked]
+    return recommendations
+
+
+def rebuild_all():
+    profiles = load_profiles()
+    recommendations = [_store(pk, rank(profile, profiles)) for pk, profile in profiles.items()]
+    with transaction.atomic():
+        ListingRecommendations.objects.all().delete()
+        ListingRecommendations.objects.bulk_create(recommendations, batch_size=500)
+    return len(recommendations)
+
+
+def refresh(pks):
+    """
+    Update neighbour lists after the listings in ``pks`` were saved or
+    deleted: rescore the changed listings and patch every list they
+    enter or leave.
+    """
+    profiles = load_profiles()
+    stored = {r.listing_id: r for r in ListingRecommendations.objects.all()}
+    changed = {}
+
+    for pk in pks:
+        profile = profiles.get(pk)
+        if profile is not None:
+            changed[pk] = _store(pk, rank(profile, profiles), stored.get(pk))
+
+    present = sum(1 for pk in pks if pk in profiles)
+    for other_pk, other in profiles.items():
+        if other_pk in pks:
+            continue
+        current = changed.get(other_pk) or stored.get(other_pk)
+        if current is None:
+            continue
+
+        ranked = [
+            (score, similar)
+            for score, similar in zip(current.scores, current.similar_ids)
+            if similar not in pks
+        ]
+        dropped = len(ranked) != len(current.similar_ids)
+        # Does the list still hold every unchanged listing (a small inventory)?
+        holds_all = len(ranked) >= len(profiles) - 1 - present
+        if not holds_all and len(ranked) < RESULT_SIZE:
+            changed[other_pk] = _store(other_pk, rank(other, profiles), current)
+            continue
+
+        weakest = ranked[-1] if ranked else None
+        entered = False
+        for pk in pks:
+            profile = profiles.get(pk)
+            if profile is None:
+                continue
+            score = similarity(other, profile)
+            if holds_all or (weakest and (score, pk) > weakest):
+                ranked.append((score, pk))
+                entered = True
+        if dropped or entered:
+            ranked.sort(key=lambda item: (-item[0], -item[1]))
+            changed[other_pk] = _store(other_pk, ranked[:NEIGHBOURS], current)
+
+    new = [r for r in changed.values() if r.listing_id not in stored]
+    existing = [r for r in changed.values() if r.listing_id in stored]
+    ListingRecommendations.objects.bulk_create(new, batch_size=500, ignore_conflicts=True)
+    ListingRecommendations.objects.bulk_update(existing, ['similar_ids', 'scores'], batch_size=500)
+
+
+def schedule_refresh(pks):
+    """refresh() now where image jobs run inline, otherwise queue ``pks`` for the worker."""
+    if settings.IMAGE_JOBS_INLINE:
+        refresh(pks)
+    else:
+        RecommendationRefresh.objects.bulk_create([RecommendationRefresh(listing_id=pk) for pk in pks])
+
+
+def refresh_queued(limit=REFRESH_BATCH):
+    """refresh() up to ``limit`` queued listings together; safe with several workers. Returns how many were handled."""
+    with transaction.atomic():
+        rows = list(
+            RecommendationRefresh.objects
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'listing_id')[:limit]
+        )
+        if rows:
+            refresh({pk for _, pk in rows})
+            RecommendationRefresh.objects.filter(id__in=[pk for pk, _ in rows]).delete()
+    return len(rows)
+
+def similar_listing_ids(pk):
+    recommendations = ListingRecommendations.objects.filter(listing_id=pk).first()
+    if recommendations is None:
+        profiles = load_profiles()
+        if pk not in profiles:
+            return None
+        recommendations = _store(pk, rank(profiles[pk], profiles))
+        ListingRecommendations.objects.bulk_create([recommendations], ignore_conflicts=True)
+    return recommendations.similar_ids[:RESULT_SIZE]
+
@@ -0,0 +1,35 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+# ---------- JSON renderer ----------
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer writing bytes with orjson when it is installed. Output is
+    the same compact UTF-8 JSON; anything orjson can't encode natively
+    (lazy strings, Decimals, ...) goes through DRF's encoder.
+    """
+
+    _default = JSONEncoder().default
+    # int dict keys as JSON does; dates through DRF's encoder for the same format
+    _options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            content = orjson.dumps(data, default=self._default, option=self._options)
+        except TypeError:
+            # e.g. integers past 64 bits, which the json module handles
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, for JSON embedded in <script>
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
@@ -0,0 +1,202 @@
+import fcntl
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from PIL import ExifTags, Image, ImageOps
+
+from .images import VARIANT_FORMATS, supported_formats
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- On-demand resized images (/api/v1/img/<id>/) ----------
+#
+# Results are files under IMAGE_CACHE_DIR named by a hash of the original's
+# storage name, width and format. A hit is touched, so the mtimes order the
+# cache for LRU eviction once it outgrows IMAGE_CACHE_MAX_BYTES. A miss is
+# encoded under an flock shared by every thread and worker process, so a
+# burst of requests for the same variant encodes it once.
+# The cache's total size is kept in locks/size, under an flock of its own,
+# so every process adds to the same count. The files are measured afresh
+# when it is missing, MEASURE_INTERVAL after the last measurement, and
+# whenever the count says the cache is over the limit.
+
+# Widths the endpoint answers; anything else would let clients fill the cache
+WIDTHS = (160, 240, 320, 480, 640, 800, 960, 1024, 1280, 1600, 1920)
+# Accept header order of preference when no format is asked for
+PREFERRED_FORMATS = ('avif', 'webp')
+CONTENT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+# Lock files (hash prefixes) shared by all variants
+LOCK_BUCKETS = 256
+# Evict down to this share of the limit, so eviction doesn't run on every write
+EVICT_TO = 0.9
+# Seconds before the recorded total is measured again, in case files went missing behind its back
+MEASURE_INTERVAL = 15 * 60
+
+
+def negotiate_format(accept):
+    formats = supported_formats()
+    for name in PREFERRED_FORMATS:
+        if name in formats and CONTENT_TYPES[name] in accept:
+            return name
+    return 'jpeg'
+
+
+def cache_key(name, width, image_format):
+    return hashlib.sha256(f"{name}\0{width}\0{image_format}".encode()).hexdigest()
+
+
+def _cache_path(key, image_format):
+    extension = VARIANT_FORMATS[image_format][1]
+    return os.path.join(settings.IMAGE_CACHE_DIR, key[:2], f"{key}.{extension}")
+
+
+def _oriented_size(picture):
+    """(width, height) once the EXIF orientation is applied."""
+    orientation = picture.getexif().get(ExifTags.Base.Orientation, 1)
+    return picture.size[::-1] if orientation in (5, 6, 7, 8) else picture.size
+
+
+def encode(fh, width, image_format):
+    """Resize the image file ``fh`` to ``width`` (never larger) and encode it."""
+    picture = Image.open(fh)
+    shown_width, shown_height = _oriented_size(picture)
+    width = min(width, shown_width)
+    height = max(1, round(shown_height * width / shown_width))
+    if picture.format == 'JPEG':
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that is still large enough
+        swapped = (shown_width, shown_height) != picture.size
+        picture.draft('RGB', (height, width) if swapped else (width, height))
+    picture = ImageOps.exif_transpose(picture).convert('RGB')
+    if picture.size != (width, height):
+        picture = picture.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+    pillow_format, _, options = VARIANT_FORMATS[image_format]
+    buffer = io.BytesIO()
+    picture.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+def _write(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _read(path):
+    """The cached file's bytes, marking it recently used; None on a miss."""
+    try:
+        with open(path, 'rb') as fh:
+            content = fh.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # Evicted meanwhile; the bytes are still good
+        pass
+    return content
+
+
+def resized(storage, name, width, image_format):
+    """Bytes of the original ``name`` in ``storage`` at ``width`` as ``image_format``."""
+    key = cache_key(name, width, image_format)
+    path = _cache_path(key, image_format)
+    content = _read(path)
+    if content is not None:
+        return content
+
+    locks = os.path.join(settings.IMAGE_CACHE_DIR, 'locks')
+    os.makedirs(locks, exist_ok=True)
+    bucket = int(key[:4], 16) % LOCK_BUCKETS
+    with open(os.path.join(locks, f"{bucket:03d}.lock"), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Whoever held the lock may have just encoded it
+            content = _read(path)
+            if content is None:
+                with storage.open(name, 'rb') as fh:
+                    content = encode(fh, width, image_format)
+                _write(path, content)
+                _account(len(content))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return content
+
+
+def _account(size):
+    """Add ``size`` freshly written bytes to the shared total, evicting once it passes the limit."""
+    locks = os.path.join(settings.IMAGE_CACHE_DIR, 'locks')
+    os.makedirs(locks, exist_ok=True)
+    fd = os.open(os.path.join(locks, 'size'), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # "<total bytes> <time measured>"
+        recorded = os.read(fd, 64).split()
+        try:
+            total, measured = int(recorded[0]) + size, float(recorded[1])
+        except (IndexError, ValueError):
+            total, measured = None, 0
+        now = time.time()
+        if total is None or total > settings.IMAGE_CACHE_MAX_BYTES or now - measured >= MEASURE_INTERVAL:
+            # Counts the file just written too
+            files = _cached_files()
+            total = sum(file_size for _, file_size, _ in files) - _evict(files, settings.IMAGE_CACHE_MAX_BYTES)
+            measured = now
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{total} {measured}".encode())
+    finally:
+        os.close(fd)
+
+
+def _cached_files():
+    """``[(mtime, size, path), ...]`` for every file in the cache."""
+    files = []
+    root = settings.IMAGE_CACHE_DIR
+    for folder in os.listdir(root) if os.path.isdir(root) else ():
+        if folder == 'locks':
+            continue
+        with os.scandir(os.path.join(root, folder)) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+    return files
+
+
+def evict(limit=None):
+    """Delete the least recently used files until the cache fits ``limit``; returns bytes freed."""
+    limit = settings.IMAGE_CACHE_MAX_BYTES if limit is None else limit
+    return _evict(_cached_files(), limit)
+
+
+def _evict(files, limit):
+    total = sum(size for _, size, _ in files)
+    if total <= limit:
+        return 0
+    freed = 0
+    target = total - limit * EVICT_TO
+    for _, size, path in sorted(files):
+        if freed >= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        freed += size
+    logger.info("Evicted %d bytes from the resized image cache", freed)
+    return freed
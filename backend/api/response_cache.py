@@ -0,0 +1,135 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import metrics
+from .versions import bump_version, get_versions
+
+
+# ---------- Cache of public read-only API responses ----------
+#
+# A response is stored as (content type, JSON bytes) under the normalized
+# URL plus the current version of every model it was built from ("tags").
+# Saving or deleting one of those models bumps its tag (signals.py), so
+# every entry built from it stops matching at once, in every worker.
+# Entries live in a small per-process LRU and, optionally, the shared cache.
+
+def tag(model):
+    return f"tag:{model._meta.label_lower}"
+
+
+def invalidate(*models):
+    for model in models:
+        bump_version(tag(model))
+
+
+class LocalLRU:
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LocalLRU(settings.RESPONSE_CACHE_LOCAL_SIZE)
+
+
+def cache_key(request, models):
+    # Blank filters are dropped and params sorted, so equivalent URLs share an entry
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values if value != '')
+    url = f"{request.scheme}://{request.get_host()}{request.path}?{urlencode(params)}"
+    versions = get_versions([tag(model) for model in models])
+    return 'response:' + hashlib.sha256(f"{url}|{','.join(versions)}".encode()).hexdigest()
+
+
+def cacheable(request):
+    # The browsable API (text/html) is left alone
+    return (
+        settings.RESPONSE_CACHE_ENABLED
+        and request.method == 'GET'
+        and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+    )
+
+
+def cached_response(request, models, respond):
+    """Return the cached response for ``request``, or call ``respond()`` and store its result."""
+    if not cacheable(request):
+        return respond()
+
+    key = cache_key(request, models)
+    entry = _local.get(key)
+    source = 'local'
+    if entry is None and settings.RESPONSE_CACHE_SHARED:
+        entry = cache.get(key)
+        source = 'shared'
+        if entry is not None:
+            _local.set(key, entry)
+
+    if entry is not None:
+        metrics.incr(f'response_cache.hit_{source}')
+        response = HttpResponse(entry[1], content_type=entry[0])
+        response['X-Cache'] = 'HIT'
+        return response
+
+    metrics.incr('response_cache.miss')
+    response = respond()
+    if response.status_code == 200:
+        if hasattr(response, 'render'):
+            response.render()
+        if response['Content-Type'].startswith('application/json'):
+            entry = (response['Content-Type'], response.content)
+            _local.set(key, entry)
+            if settings.RESPONSE_CACHE_SHARED:
+                cache.set(key, entry, settings.RESPONSE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+def cache_response(*models):
+    """Decorator for function views built from ``models``."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return cached_response(request, models, lambda: view(request, *args, **kwargs))
+        return wrapped
+    return decorator
+
+
+class CachedResponseMixin:
+    """
+    View mixin: caches the actions (or, on a plain APIView, the methods)
+    named in ``cache_actions``; the response is built from ``cache_models``.
+    """
+    cache_models = ()
+    cache_actions = ('list', 'retrieve', 'get')
+
+    def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        action = self.action_map.get(method) if hasattr(self, 'action_map') else method
+        respond = super().dispatch
+        if action not in self.cache_actions:
+            return respond(request, *args, **kwargs)
+        return cached_response(request, self.cache_models, lambda: respond(request, *args, **kwargs))
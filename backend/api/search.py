@@ -0,0 +1,136 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q, TextField
+from django.db.models.functions import Cast, Greatest, Upper
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from .models import CarsListing, Feature, ListingSearchDocument, Make, ModelName, SafetyFeature
+
+
+# ---------- Full-text search over listings ----------
+#
+# Every listing has a ListingSearchDocument holding one weighted tsvector:
+#   A  title and VIN
+#   B  make and model names
+#   C  features and safety features
+#   D  description
+# signals.py rewrites the documents a listing or lookup change touches.
+
+SEARCH_CONFIG = 'english'
+# Weights for D, C, B, A, in the order ts_rank expects them
+RANK_WEIGHTS = [0.1, 0.2, 0.4, 1.0]
+# Make/model names are short, so they get a lower bar than the title index
+FUZZY_THRESHOLD = 0.4
+MAX_TERMS = 8
+
+TERM = re.compile(r'[^\W_]+')
+
+_features = CarsListing.features.through
+_safety_features = CarsListing.safety_features.through
+
+REFRESH_SQL = f"""
+INSERT INTO {ListingSearchDocument._meta.db_table} (listing_id, vector, updated_at)
+SELECT
+    l.id,
+    setweight(to_tsvector(%(config)s::regconfig, l.title || ' ' || l.vin), 'A')
+    || setweight(to_tsvector(%(config)s::regconfig, mk.name || ' ' || md.name), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, concat_ws(' ',
+        (SELECT string_agg(f.name, ' ') FROM {_features._meta.db_table} lf
+            JOIN {Feature._meta.db_table} f ON f.id = lf.feature_id WHERE lf.carslisting_id = l.id),
+        (SELECT string_agg(s.name, ' ') FROM {_safety_features._meta.db_table} ls
+            JOIN {SafetyFeature._meta.db_table} s ON s.id = ls.safetyfeature_id WHERE ls.carslisting_id = l.id)
+    )), 'C')
+    || setweight(to_tsvector(%(config)s::regconfig, l.description), 'D'),
+    now()
+FROM {CarsListing._meta.db_table} l
+JOIN {Make._meta.db_table} mk ON mk.id = l.make_id
+JOIN {ModelName._meta.db_table} md ON md.id = l.model_id
+{{where}}
+ON CONFLICT (listing_id) DO UPDATE SET vector = EXCLUDED.vector, updated_at = EXCLUDED.updated_at
+"""
+
+
+def refresh_documents(pks=None):
+    """Rebuild the search documents of the listings in ``pks``, or of every listing."""
+    params = {'config': SEARCH_CONFIG}
+    if pks is None:
+        where = ''
+    else:
+        pks = list(pks)
+        if not pks:
+            return
+        where = 'WHERE l.id = ANY(%(pks)s)'
+        params['pks'] = pks
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_SQL.format(where=where), params)
+
+
+def parse_query(text):
+    """
+    Turn free text into a tsquery: every term must match, the last one as a
+    prefix so results follow the user while typing.
+    """
+    terms = TERM.findall(text.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    terms[-1] += ':*'
+    return SearchQuery(' & '.join(terms), search_type='raw', config=SEARCH_CONFIG)
+
+
+def fuzzy_matches(queryset, text):
+    """Trigram fallback for misspelled queries over the title, make and model."""
+    makes = Make.objects.annotate(similarity=TrigramWordSimilarity(text, 'name')).filter(similarity__gt=FUZZY_THRESHOLD)
+    models = ModelName.objects.annotate(similarity=TrigramWordSimilarity(text, 'name')).filter(similarity__gt=FUZZY_THRESHOLD)
+    return (
+        queryset
+        # Same expression as the listing_title_trgm index
+        .alias(search_title=Upper(Cast('title', output_field=TextField())))
+        .filter(
+            Q(search_title__trigram_word_similar=text.upper())
+            | Q(make__in=makes.values('id'))
+            | Q(model__in=models.values('id'))
+        )
+        .annotate(search_rank=Greatest(
+            TrigramWordSimilarity(text, 'title'),
+            TrigramWordSimilarity(text, 'make__name'),
+            TrigramWordSimilarity(text, 'model__name'),
+        ))
+    )
+
+
+def search_listings(queryset, text):
+    """
+    Listings in ``queryset`` matching ``text``, with a ``search_rank``
+    annotation. Falls back to trigram similarity when nothing matches.
+    """
+    query = parse_query(text)
+    if query is None:
+        return queryset
+
+    matches = (
+        queryset
+        .filter(search_document__vector=query)
+        .annotate(search_rank=SearchRank(F('search_document__vector'), query, weights=RANK_WEIGHTS))
+    )
+    if not matches.exists():
+        matches = fuzzy_matches(queryset, text)
+
+    # An explicit sort (sort_date / ordering) wins over relevance. Ties go to the
+    # newest listing by id alone, which lets the top N be picked before the join.
+    if not matches.query.order_by:
+        matches = matches.order_by('-search_rank', '-id')
+    return matches
+
+
+class ListingSearchFilter(BaseFilterBackend):
+    """Drop-in replacement for SearchFilter on listings, driven by ``?search=``."""
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search_listings(queryset, text)
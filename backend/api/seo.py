@@ -0,0 +1,291 @@
+import fcntl
+import gzip
+import json
+import logging
+import os
+import re
+import tempfile
+from urllib.parse import quote, urljoin
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F, Max
+
+from .models import CarsListing, ListingImage
+
+logger = logging.getLogger(__name__)
+
+
+# ---------- Sitemap and SSR metadata files ----------
+#
+# Written under SEO_ROOT (nginx serves it as /media/seo/):
+#   sitemap.xml                    index of the shards below
+#   sitemaps/pages.xml.gz          the static pages
+#   sitemaps/listings-<n>.xml.gz   listings with n * SHARD_SIZE <= id < (n + 1) * SHARD_SIZE
+#   listings/<id>.json             what the SSR server puts in a listing page's <head>
+#   sitemap-index.json             the shards in sitemap.xml and their lastmod
+# Shards go by id range, so a listing change rewrites one shard only, and
+# sitemap.xml is patched from sitemap-index.json instead of regrouping
+# every listing.
+# `manage.py build_sitemap` rebuilds everything; signals.py keeps it current.
+
+# The sitemap protocol allows up to 50,000 URLs per file
+SHARD_SIZE = 10000
+STATIC_PAGES = ['/', '/search', '/contact-us', '/shipping', '/return-policy', '/privacy-policy']
+DESCRIPTION_LENGTH = 200
+# og:image: a JPEG variant that's big enough for link previews
+IMAGE_VARIANT = ('gallery', 'jpeg')
+CHUNK_SIZE = 2000
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+WHITESPACE = re.compile(r'\s+')
+
+
+def listing_slug(title, pk):
+    # Same as the frontend's links: lowercased title, whitespace runs as dashes, then the id
+    return f"{WHITESPACE.sub('-', title.lower())}-{pk}"
+
+
+def site_url(path):
+    return urljoin(settings.SITE_URL, path)
+
+
+def _path(*parts):
+    return os.path.join(settings.SEO_ROOT, *parts)
+
+
+def _write(path, content):
+    # Readers never see a half written file
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        _remove(temporary)
+        raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _gzip(content):
+    # mtime=0 keeps unchanged shards byte-identical between builds
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def _lastmod(value):
+    return value.replace(microsecond=0).isoformat()
+
+
+# ---------- Per-listing metadata ----------
+
+def _primary_images(pks):
+    """``{listing id: absolute image URL}`` for the first image of each listing."""
+    storage = ListingImage._meta.get_field('path').storage
+    images = {}
+    rows = (
+        ListingImage.objects
+        .filter(listing_id__in=pks)
+        .order_by('listing_id', 'id')
+        .values_list('listing_id', 'path', 'variants', 'processing_status')
+    )
+    for listing_id, path, variants, status in rows:
+        if listing_id in images:
+            continue
+        size, image_format = IMAGE_VARIANT
+        if status == ListingImage.STATUS_READY:
+            path = (variants or {}).get(size, {}).get(image_format) or path
+        images[listing_id] = site_url(storage.url(path))
+    return images
+
+
+def listing_metadata(pks):
+    """``{listing id: metadata dict}`` for the listings in ``pks`` that exist."""
+    rows = CarsListing.objects.filter(pk__in=pks).values_list('id', 'title', 'description', 'price', 'updated_at')
+    rows = list(rows)
+    images = _primary_images([row[0] for row in rows])
+    metadata = {}
+    for pk, title, description, price, updated_at in rows:
+        slug = listing_slug(title, pk)
+        description = ' '.join(description.split())
+        if len(description) > DESCRIPTION_LENGTH:
+            description = description[:DESCRIPTION_LENGTH - 1].rsplit(' ', 1)[0] + '…'
+        metadata[pk] = {
+            'id': pk,
+            'slug': slug,
+            'url': site_url(f"/listing/{quote(slug)}"),
+            'title': title,
+            'description': description,
+            'price': price,
+            'image': images.get(pk),
+            'updated_at': _lastmod(updated_at),
+        }
+    return metadata
+
+
+def write_metadata(pks):
+    metadata = listing_metadata(pks)
+    for pk in pks:
+        path = _path('listings', f"{pk}.json")
+        if pk in metadata:
+            _write(path, json.dumps(metadata[pk], ensure_ascii=False, separators=(',', ':')).encode())
+        else:
+            _remove(path)
+    return len(metadata)
+
+
+# ---------- Sitemap ----------
+
+def _urlset(entries):
+    lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">']
+    for location, lastmod in entries:
+        lastmod = f"<lastmod>{lastmod}</lastmod>" if lastmod else ''
+        lines.append(f"<url><loc>{escape(location)}</loc>{lastmod}</url>")
+    lines.append('</urlset>\n')
+    return '\n'.join(lines).encode()
+
+
+def shard_name(shard):
+    return f"listings-{shard}.xml.gz"
+
+
+def write_shard(shard):
+    """
+    Rewrite one listings shard from the database; removes it when the id
+    range is empty. Returns ``(urls, lastmod)``, with no lastmod when removed.
+    """
+    rows = list(
+        CarsListing.objects
+        .filter(pk__gte=shard * SHARD_SIZE, pk__lt=(shard + 1) * SHARD_SIZE)
+        .order_by('id')
+        .values_list('id', 'title', 'updated_at')
+    )
+    entries = [
+        (site_url(f"/listing/{quote(listing_slug(title, pk))}"), _lastmod(updated_at))
+        for pk, title, updated_at in rows
+    ]
+    path = _path('sitemaps', shard_name(shard))
+    if entries:
+        _write(path, _gzip(_urlset(entries)))
+    else:
+        _remove(path)
+    return len(entries), _lastmod(max(updated_at for _, _, updated_at in rows)) if rows else None
+
+
+def write_pages():
+    _write(_path('sitemaps', 'pages.xml.gz'), _gzip(_urlset((site_url(page), None) for page in STATIC_PAGES)))
+
+
+def _shard_lastmods():
+    """``{shard: lastmod}`` for every shard that has listings."""
+    shards = (
+        CarsListing.objects
+        .annotate(shard=F('id') / SHARD_SIZE)
+        .values('shard')
+        .annotate(lastmod=Max('updated_at'))
+        .order_by('shard')
+    )
+    return {row['shard']: _lastmod(row['lastmod']) for row in shards}
+
+
+def _read_index():
+    """The ``{shard: lastmod}`` sitemap.xml was last written from, or None if unknown."""
+    try:
+        with open(_path('sitemap-index.json'), 'rb') as fh:
+            return {int(shard): lastmod for shard, lastmod in json.load(fh).items()}
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _lock_index():
+    """An exclusive lock, shared by every process, for reading and rewriting the index; close it to release."""
+    os.makedirs(settings.SEO_ROOT, exist_ok=True)
+    lock = open(_path('sitemap.lock'), 'a')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+
+def _write_index(shards):
+    """Rewrite sitemap.xml from ``{shard: lastmod}``, dropping any stale shard files."""
+    entries = [('pages.xml.gz', None)]
+    entries += [(shard_name(shard), shards[shard]) for shard in sorted(shards)]
+
+    lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">']
+    for name, lastmod in entries:
+        lastmod = f"<lastmod>{lastmod}</lastmod>" if lastmod else ''
+        lines.append(f"<sitemap><loc>{escape(site_url(f'/sitemaps/{name}'))}</loc>{lastmod}</sitemap>")
+    lines.append('</sitemapindex>\n')
+    write_pages()
+    _write(_path('sitemap.xml'), '\n'.join(lines).encode())
+    _write(_path('sitemap-index.json'), json.dumps(shards, sort_keys=True).encode())
+
+    current = {name for name, _ in entries}
+    directory = _path('sitemaps')
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        if name.startswith('listings-') and name.endswith('.xml.gz') and name not in current:
+            _remove(os.path.join(directory, name))
+
+
+def write_index():
+    """Rewrite sitemap.xml from the shards that have listings."""
+    with _lock_index():
+        _write_index(_shard_lastmods())
+
+
+def update_index(lastmods):
+    """
+    Patch sitemap.xml with ``{shard: lastmod}`` (None for a removed shard);
+    it is only rewritten when that changes it.
+    """
+    with _lock_index():
+        shards = _read_index()
+        if shards is None:
+            _write_index(_shard_lastmods())
+            return
+        updated = {**shards, **lastmods}
+        updated = {shard: lastmod for shard, lastmod in updated.items() if lastmod is not None}
+        if updated != shards:
+            _write_index(updated)
+
+
+# ---------- Entry points ----------
+
+def refresh_listings(pks):
+    """Rewrite the metadata and sitemap shards of the given (saved or deleted) listings."""
+    pks = set(pks)
+    if not pks:
+        return
+    try:
+        write_metadata(pks)
+        update_index({shard: write_shard(shard)[1] for shard in {pk // SHARD_SIZE for pk in pks}})
+    except OSError:
+        # The files can always be rebuilt; a full disk must not fail the save
+        logger.exception("Could not update the sitemap / listing metadata files")
+
+
+def rebuild():
+    """Write every file from scratch and delete files of listings that are gone; returns counts."""
+    pks = list(CarsListing.objects.order_by('id').values_list('id', flat=True))
+    written = 0
+    for start in range(0, len(pks), CHUNK_SIZE):
+        written += write_metadata(pks[start:start + CHUNK_SIZE])
+
+    existing = set(pks)
+    directory = _path('listings')
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        stem, extension = os.path.splitext(name)
+        if extension == '.json' and (not stem.isdigit() or int(stem) not in existing):
+            _remove(os.path.join(directory, name))
+
+    shards = sorted({pk // SHARD_SIZE for pk in pks})
+    urls = sum(write_shard(shard)[0] for shard in shards)
+    write_index()
+    return {'metadata': written, 'urls': urls, 'shards': len(shards)}
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from .images import variant_urls
 from .models import (
     Inquiry, CarsListing, Make, ModelName, Status, Color, Transmission,
     Condition, FuelType, DriveType, CarType, Feature, SafetyFeature, ListingImage
@@ -31,7 +32,12 @@ class InquirySerializer(serializers.ModelSerializer):
 class MakeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Make
-        fields = '__all__'
+        fields = ['id', 'name']
+
+class ModelNameSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ModelName
+        fields = ['id', 'name']
 
 class ModelSerializer(serializers.ModelSerializer):
     make = MakeSerializer()
@@ -83,10 +89,12 @@ class SafetyFeatureSerializer(serializers.ModelSerializer):
 #Listing - Serializers
 class CarListingImageSerializer(serializers.ModelSerializer):
     full_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ListingImage
-        fields = ['id', 'path', 'full_url']
+        # placeholder: a data: URI to show until the image has loaded ('' until processed)
+        fields = ['id', 'path', 'full_url', 'srcset', 'placeholder']
 
     def get_full_url(self, obj):
         request = self.context.get('request')
@@ -94,6 +102,13 @@ class CarListingImageSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.path.url)
         return obj.path.url
 
+    def get_srcset(self, obj):
+        # Empty until the worker has produced the variants; clients fall back to path
+        if obj.processing_status != ListingImage.STATUS_READY:
+            return {}
+        request = self.context.get('request')
+        return variant_urls(obj, request.build_absolute_uri if request else str)
+
 class CarsListingSerializer(serializers.ModelSerializer):
     make = MakeSerializer()
     model = ModelSerializer()
@@ -115,3 +130,25 @@ class CarsListingSerializer(serializers.ModelSerializer):
             'cylinders', 'doors', 'vin', 'price', 'features', 'safety_features', 'listing_images',
             'created_at', 'updated_at'
         ]
+
+class FirstImageListSerializer(serializers.ListSerializer):
+    max_items = 1
+
+    def to_representation(self, data):
+        images = data.all() if hasattr(data, 'all') else data
+        return super().to_representation(list(images)[:self.max_items])
+
+class CarsListingCardSerializer(serializers.ModelSerializer):
+    """Just what a listing card shows (see frontend ListingCard)."""
+    make = MakeSerializer()
+    model = ModelNameSerializer()
+    transmission = TransmissionSerializer()
+    fuel_type = FuelTypeSerializer()
+    listing_images = FirstImageListSerializer(child=CarListingImageSerializer(), source='images')
+
+    class Meta:
+        model = CarsListing
+        fields = [
+            'id', 'title', 'make', 'model', 'transmission', 'fuel_type', 'year', 'mileage', 'price',
+            'listing_images', 'created_at'
+        ]
@@ -0,0 +1,326 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from .listing_index import listing_index
+from . import recommendations
+from . import search
+from . import seo
+from .suggest import suggest_index
+from .images import generate_variants, image_files, reuse_variants, variant_files
+from . import jobs
+from . import metrics
+from . import response_cache
+from .versions import bump_version
+from .models import (
+    CarsListing, ListingImage, Make, ModelName, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature, SafetyFeature
+)
+from .views import filters_snapshot
+
+
+FILTER_LOOKUP_MODELS = (
+    Make, ModelName, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature, SafetyFeature
+)
+
+
+def on_commit_batch(refresh, pks):
+    """
+    ``transaction.on_commit(lambda: refresh(pks))``, except that the calls for
+    one ``refresh`` in a transaction (e.g. a queryset delete) become one call
+    with all their pks.
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        for _, callback, _ in connection.run_on_commit:
+            if getattr(callback, 'refresh', None) == refresh:
+                callback.pks.update(pks)
+                return
+    batch = set(pks)
+
+    def callback():
+        refresh(batch)
+    callback.refresh, callback.pks = refresh, batch
+    transaction.on_commit(callback)
+
+
+def refresh_suggested_listings(pks):
+    suggest_index.refresh(listings=pks)
+
+
+def invalidate_filters(sender, **kwargs):
+    # After commit, so another worker can't rebuild from the old rows under the new version
+    transaction.on_commit(filters_snapshot.invalidate)
+
+
+def refresh_listing_index(sender, instance, **kwargs):
+    if listing_index.enabled:
+        # Bound now: a deleted instance has its pk cleared before the commit
+        on_commit_batch(listing_index.refresh, [instance.pk])
+
+
+def refresh_listing_index_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not listing_index.enabled or not action.startswith('post_'):
+        return
+    if not reverse:
+        pks = [instance.pk]
+    elif pk_set:
+        pks = list(pk_set)
+    else:
+        # Reverse clear() doesn't say which listings were touched
+        transaction.on_commit(listing_index.invalidate)
+        return
+    transaction.on_commit(lambda: listing_index.refresh(pks))
+
+
+def invalidate_listing_index(sender, **kwargs):
+    # Deleting a feature cascades through the M2M table without m2m_changed
+    if listing_index.enabled:
+        transaction.on_commit(listing_index.invalidate)
+
+
+def refresh_recommendations(sender, instance, **kwargs):
+    on_commit_batch(recommendations.schedule_refresh, [instance.pk])
+
+
+def refresh_recommendations_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    pks = {instance.pk} if not reverse else set(pk_set or ())
+    if pks:
+        # Merged with the listing's post_save refresh, so a save refreshes once
+        on_commit_batch(recommendations.schedule_refresh, pks)
+
+
+def refresh_search_document(sender, instance, **kwargs):
+    on_commit_batch(search.refresh_documents, [instance.pk])
+
+
+def refresh_search_documents_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # Reverse clear() doesn't say which listings lose the feature; ask before the rows go
+        pks = list(instance.listings.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear') and not (reverse and action == 'post_clear'):
+        pks = list(pk_set) if reverse else [instance.pk]
+    else:
+        return
+    transaction.on_commit(lambda: search.refresh_documents(pks))
+
+
+def refresh_search_documents_lookup(sender, instance, created, **kwargs):
+    # A renamed make/model/feature changes the text of every listing using it
+    if not created:
+        transaction.on_commit(
+            lambda: search.refresh_documents(instance.listings.values_list('pk', flat=True))
+        )
+
+
+def remember_search_documents_lookup(sender, instance, **kwargs):
+    # The M2M rows are gone by post_delete, so collect the listings now
+    pks = list(instance.listings.values_list('pk', flat=True))
+    if pks:
+        transaction.on_commit(lambda: search.refresh_documents(pks))
+
+
+def refresh_suggestions(sender, instance, **kwargs):
+    on_commit_batch(refresh_suggested_listings, [instance.pk])
+
+
+def refresh_suggestions_make(sender, instance, **kwargs):
+    # Model labels carry the make name
+    models = list(ModelName.objects.filter(make_id=instance.pk).values_list('pk', flat=True))
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest_index.refresh(makes=[pk], models=models))
+
+
+def refresh_suggestions_model(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: suggest_index.refresh(models=[pk]))
+
+
+def remember_listing_make(sender, instance, **kwargs):
+    instance._previous_make_id = (
+        CarsListing.objects.filter(pk=instance.pk).values_list('make_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+def count_listing_make(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_make_id', None)
+    if created or previous is None:
+        Make.objects.filter(pk=instance.make_id).update(listings_count=F('listings_count') + 1)
+    elif previous != instance.make_id:
+        Make.objects.filter(pk=previous).update(listings_count=F('listings_count') - 1)
+        Make.objects.filter(pk=instance.make_id).update(listings_count=F('listings_count') + 1)
+
+
+def uncount_listing_make(sender, instance, **kwargs):
+    Make.objects.filter(pk=instance.make_id, listings_count__gt=0).update(listings_count=F('listings_count') - 1)
+
+
+def drop_stale_variants(sender, instance, **kwargs):
+    if not instance.pk:
+        return
+    previous, variants = (
+        ListingImage.objects.filter(pk=instance.pk).values_list('path', 'variants').first() or (None, None)
+    )
+    if previous and previous != instance.path.name:
+        instance.variants = {}
+        # The replaced original and its variants, once the new one is saved
+        stale = [previous, *variant_files(variants)]
+        transaction.on_commit(lambda: release_files(stale))
+
+
+def build_variants(sender, instance, **kwargs):
+    if not instance.path or instance.variants:
+        return
+    # An identical upload reuses the variants already made for it
+    if settings.IMAGE_JOBS_INLINE:
+        transaction.on_commit(lambda: reuse_variants(instance) or generate_variants(instance))
+    else:
+        # Picked up by manage.py process_image_jobs
+        transaction.on_commit(lambda: reuse_variants(instance) or jobs.enqueue(instance, 'variants'))
+
+
+def refresh_seo(sender, instance, **kwargs):
+    on_commit_batch(seo.refresh_listings, [instance.pk])
+
+
+def refresh_seo_image(sender, instance, **kwargs):
+    # The first image is the listing's og:image
+    on_commit_batch(seo.refresh_listings, [instance.listing_id])
+
+
+def release_files(paths):
+    pending = getattr(transaction.get_connection(), 'released_files', None)
+    if pending is not None:
+        # Inside batched_file_release()
+        pending.extend(paths)
+    elif settings.IMAGE_JOBS_INLINE:
+        transaction.on_commit(lambda: jobs.delete_files(paths))
+    else:
+        # Removed by manage.py process_image_jobs
+        jobs.queue_file_deletion(paths)
+
+
+@contextmanager
+def batched_file_release():
+    """
+    Release the files that handlers release in the block (e.g. for every
+    image of a queryset delete) together when it ends: one queue insert
+    instead of one per image.
+    """
+    connection = transaction.get_connection()
+    outer = getattr(connection, 'released_files', None)
+    connection.released_files = paths = []
+    try:
+        yield
+    finally:
+        connection.released_files = outer
+    if paths:
+        release_files(paths)
+
+
+def delete_image_files(sender, instance, **kwargs):
+    # Also runs for images deleted along with their listing, in a queryset delete or the admin
+    paths = image_files(instance)
+    if paths:
+        release_files(paths)
+
+
+def bump_inventory_version(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('inventory'))
+
+
+def invalidate_responses(sender, **kwargs):
+    transaction.on_commit(lambda: response_cache.invalidate(sender))
+
+
+def invalidate_listing_responses(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(lambda: response_cache.invalidate(CarsListing))
+
+
+def touch_listings_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    # Feature changes count as listing edits for updated_at (ETag / Last-Modified)
+    if not reverse and action in ('post_add', 'post_remove', 'post_clear'):
+        pks = [instance.pk]
+    elif reverse and action in ('post_add', 'post_remove'):
+        pks = list(pk_set)
+    elif reverse and action == 'pre_clear':
+        pks = list(instance.listings.values_list('pk', flat=True))
+    else:
+        return
+    CarsListing.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+def count_request(sender, **kwargs):
+    metrics.incr('http.requests')
+    metrics.flush()
+
+
+def connect_signals():
+    # First, so handlers below (run at once outside a transaction) see the new counts
+    pre_save.connect(remember_listing_make, sender=CarsListing, dispatch_uid="make-count-pre-save")
+    post_save.connect(count_listing_make, sender=CarsListing, dispatch_uid="make-count-save")
+    post_delete.connect(uncount_listing_make, sender=CarsListing, dispatch_uid="make-count-delete")
+
+    for model in FILTER_LOOKUP_MODELS:
+        post_save.connect(invalidate_filters, sender=model, dispatch_uid=f"filters-save-{model.__name__}")
+        post_delete.connect(invalidate_filters, sender=model, dispatch_uid=f"filters-delete-{model.__name__}")
+
+    post_save.connect(refresh_listing_index, sender=CarsListing, dispatch_uid="listing-index-save")
+    post_delete.connect(refresh_listing_index, sender=CarsListing, dispatch_uid="listing-index-delete")
+    for field in (CarsListing.features, CarsListing.safety_features):
+        m2m_changed.connect(refresh_listing_index_m2m, sender=field.through, dispatch_uid=f"listing-index-{field.field.name}")
+        post_delete.connect(invalidate_listing_index, sender=field.rel.model, dispatch_uid=f"listing-index-delete-{field.rel.model.__name__}")
+
+    post_save.connect(refresh_recommendations, sender=CarsListing, dispatch_uid="recommendations-save")
+    post_delete.connect(refresh_recommendations, sender=CarsListing, dispatch_uid="recommendations-delete")
+    for field in (CarsListing.features, CarsListing.safety_features):
+        m2m_changed.connect(refresh_recommendations_m2m, sender=field.through, dispatch_uid=f"recommendations-{field.field.name}")
+
+    post_save.connect(refresh_search_document, sender=CarsListing, dispatch_uid="search-save")
+    for field in (CarsListing.features, CarsListing.safety_features):
+        m2m_changed.connect(refresh_search_documents_m2m, sender=field.through, dispatch_uid=f"search-{field.field.name}")
+    for model in (Make, ModelName, Feature, SafetyFeature):
+        post_save.connect(refresh_search_documents_lookup, sender=model, dispatch_uid=f"search-lookup-{model.__name__}")
+    for model in (Feature, SafetyFeature):
+        pre_delete.connect(remember_search_documents_lookup, sender=model, dispatch_uid=f"search-delete-{model.__name__}")
+
+    post_save.connect(refresh_suggestions, sender=CarsListing, dispatch_uid="suggest-save")
+    post_delete.connect(refresh_suggestions, sender=CarsListing, dispatch_uid="suggest-delete")
+    post_save.connect(refresh_suggestions_make, sender=Make, dispatch_uid="suggest-make-save")
+    post_delete.connect(refresh_suggestions_make, sender=Make, dispatch_uid="suggest-make-delete")
+    post_save.connect(refresh_suggestions_model, sender=ModelName, dispatch_uid="suggest-model-save")
+    post_delete.connect(refresh_suggestions_model, sender=ModelName, dispatch_uid="suggest-model-delete")
+
+    pre_save.connect(drop_stale_variants, sender=ListingImage, dispatch_uid="image-variants-pre-save")
+    post_save.connect(build_variants, sender=ListingImage, dispatch_uid="image-variants-save")
+    post_delete.connect(delete_image_files, sender=ListingImage, dispatch_uid="image-files-delete")
+
+    post_save.connect(refresh_seo, sender=CarsListing, dispatch_uid="seo-save")
+    post_delete.connect(refresh_seo, sender=CarsListing, dispatch_uid="seo-delete")
+    post_save.connect(refresh_seo_image, sender=ListingImage, dispatch_uid="seo-image-save")
+    post_delete.connect(refresh_seo_image, sender=ListingImage, dispatch_uid="seo-image-delete")
+
+    post_save.connect(bump_inventory_version, sender=CarsListing, dispatch_uid="inventory-save")
+    post_delete.connect(bump_inventory_version, sender=CarsListing, dispatch_uid="inventory-delete")
+    for field in (CarsListing.features, CarsListing.safety_features):
+        m2m_changed.connect(bump_inventory_version, sender=field.through, dispatch_uid=f"inventory-{field.field.name}")
+
+    for field in (CarsListing.features, CarsListing.safety_features):
+        m2m_changed.connect(touch_listings_m2m, sender=field.through, dispatch_uid=f"touch-{field.field.name}")
+
+    request_finished.connect(count_request, dispatch_uid="metrics-request")
+
+    # Last, so cached responses are dropped after the derived data above is rebuilt
+    for model in (CarsListing, ListingImage, *FILTER_LOOKUP_MODELS):
+        post_save.connect(invalidate_responses, sender=model, dispatch_uid=f"responses-save-{model.__name__}")
+        post_delete.connect(invalidate_responses, sender=model, dispatch_uid=f"responses-delete-{model.__name__}")
+    for field in (CarsListing.features, CarsListing.safety_features):
+        m2m_changed.connect(invalidate_listing_responses, sender=field.through, dispatch_uid=f"responses-{field.field.name}")
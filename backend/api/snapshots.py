@@ -0,0 +1,60 @@
+import hashlib
+import json
+import threading
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .versions import bump_version, get_version
+
+
+# ---------- Versioned, precomputed JSON payloads ----------
+
+class Snapshot:
+    """
+    A JSON payload that is built once per version and kept both in this
+    process and in the shared cache. ``invalidate()`` moves the shared
+    version on, which every worker notices on its next ``get()``.
+    """
+
+    def __init__(self, name, build, timeout=None):
+        self.name = name
+        self.build = build
+        self.timeout = timeout
+        self._local = None
+        self._lock = threading.Lock()
+
+    def data_key(self, version):
+        return f"snapshot:{self.name}:{version}"
+
+    def get(self):
+        """Return ``(body, etag)`` for the current version."""
+        version = get_version(f"snapshot:{self.name}")
+        local = self._local
+        if local is not None and local[0] == version:
+            return local[1], local[2]
+
+        with self._lock:
+            local = self._local
+            if local is not None and local[0] == version:
+                return local[1], local[2]
+
+            stored = cache.get(self.data_key(version))
+            if stored is None:
+                body = json.dumps(self.build(), cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+                stored = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+                cache.set(self.data_key(version), stored, self.timeout)
+
+            self._local = (version, *stored)
+            return stored
+
+    def invalidate(self):
+        bump_version(f"snapshot:{self.name}")
+        self._local = None
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
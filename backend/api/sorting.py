@@ -0,0 +1,38 @@
+# ---------- Listing sort orders (sort_date filter) ----------
+
+# sort key -> (column, descending); ties are broken on id in the same direction
+SORTS = {
+    'created_at': ('created_at', True),
+    'price': ('price', False),
+    'price_desc': ('price', True),
+    'mileage': ('mileage', False),
+    'mileage_desc': ('mileage', True),
+}
+
+DEFAULT_SORT = 'created_at'
+
+# Columns a keyset cursor is built from, whatever fields are serialized
+SORT_FIELDS = tuple(sorted({field for field, _ in SORTS.values()}))
+
+# OrderingFilter spells the descending sorts with a leading '-'
+SORT_ALIASES = {
+    '-price': 'price_desc',
+    '-mileage': 'mileage_desc',
+    '-created_at': 'created_at',
+}
+
+
+def normalize_sort(value):
+    """Map a sort_date value (string or OrderingFilter list) to a SORTS key, or None."""
+    if isinstance(value, (list, tuple)):
+        value = value[0] if len(value) == 1 else None
+    if not value:
+        return DEFAULT_SORT
+    value = SORT_ALIASES.get(value, value)
+    return value if value in SORTS else None
+
+
+def sort_ordering(sort):
+    field, descending = SORTS[sort]
+    prefix = '-' if descending else ''
+    return (f"{prefix}{field}", f"{prefix}id")
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+# ---------- Content-addressed storage for listing images ----------
+#
+# A saved file is stored once per distinct content, as
+#   blobs/<2 hex>/<2 hex>/<sha256><extension>
+# whatever name it was uploaded under. MediaBlob counts the references to
+# each blob: save() adds one and delete() drops one, removing the file with
+# the last. The same bytes always get the same name, so the URLs never
+# change meaning and can be cached forever (see nginx.conf).
+# Names outside blobs/ (uploads from before) are plain files.
+
+class ContentAddressedStorage(FileSystemStorage):
+    blob_dir = 'blobs'
+
+    def blob_name(self, digest, extension):
+        return '/'.join([self.blob_dir, digest[:2], digest[2:4], f"{digest}{extension}"])
+
+    def is_blob(self, name):
+        return name.startswith(f"{self.blob_dir}/")
+
+    def get_available_name(self, name, max_length=None):
+        # Replaced by the digest in _save; identical content is meant to share the name
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        directory = self.path(self.blob_dir)
+        os.makedirs(directory, exist_ok=True)
+
+        # Hash while copying, so an upload is read once
+        digest = hashlib.sha256()
+        size = 0
+        fd, temporary = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    fh.write(chunk)
+                    size += len(chunk)
+
+            name = self.blob_name(digest.hexdigest(), extension)
+            path = self.path(name)
+            # The blob's row stays locked until the file is in place, so a concurrent
+            # delete() of the last reference can't remove it in between
+            with transaction.atomic():
+                self.reference(name, size)
+                if os.path.exists(path):
+                    os.remove(temporary)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.chmod(temporary, self.file_permissions_mode or 0o644)
+                    os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+    def reference(self, name, size=0):
+        """Count one more user of the blob ``name``."""
+        from .models import MediaBlob
+
+        if MediaBlob.objects.filter(name=name).update(references=F('references') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size, references=1)
+        except IntegrityError:
+            # Created by a concurrent save meanwhile
+            MediaBlob.objects.filter(name=name).update(references=F('references') + 1)
+
+    def delete(self, name):
+        if not self.is_blob(name):
+            return super().delete(name)
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.references > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(references=F('references') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            super().delete(name)
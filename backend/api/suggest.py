@@ -0,0 +1,218 @@
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db.models import Count
+
+from .models import CarsListing, Make, ModelName
+from .versions import bump_version, get_version
+
+
+# ---------- In-memory prefix index for type-ahead ----------
+#
+# Entries are makes, models (labelled with their make), listing titles and
+# VINs. Each entry is reachable through a few lowercase, accent-free keys
+# (one per word start, so "must" finds "Ford Mustang") kept in one sorted
+# list and searched with bisect. The best completions of every one or two
+# character prefix are precomputed, since those ranges cover most of the list.
+
+KINDS = ('make', 'model', 'title', 'vin')
+KIND_ORDER = {kind: i for i, kind in enumerate(KINDS)}
+MAX_LIMIT = 20
+SHORT_PREFIX = 2
+# Word starts indexed per label; later words are rarely typed first
+MAX_WORD_KEYS = 6
+HIGH = '\U0010ffff'
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def _keys(kind, label):
+    text = normalize(label)
+    if kind == 'vin':
+        return [text] if text else []
+    words = text.split()
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_WORD_KEYS))]
+
+
+class _Entries:
+    def __init__(self):
+        # (kind, id) -> {'type', 'id', 'label', 'count', ...}
+        self.entries = {}
+        self.keys = []
+        self.top = {}
+        # listing id -> (make id, model id), to recount what a listing leaves
+        self.listing_refs = {}
+
+    def copy(self):
+        other = _Entries()
+        other.entries = dict(self.entries)
+        other.keys = list(self.keys)
+        other.top = dict(self.top)
+        other.listing_refs = dict(self.listing_refs)
+        return other
+
+    @staticmethod
+    def rank(entry):
+        return KIND_ORDER[entry['type']], -entry['count'], entry['label'].lower()
+
+    def set(self, kind, pk, entry, touched):
+        """Replace (or with ``entry=None`` drop) one entry, collecting the short prefixes it changes."""
+        old = self.entries.pop((kind, pk), None)
+        if old is not None:
+            for key in _keys(kind, old['label']):
+                index = bisect_left(self.keys, (key, kind, pk))
+                if index < len(self.keys) and self.keys[index] == (key, kind, pk):
+                    del self.keys[index]
+                touched.update(key[:n] for n in range(1, SHORT_PREFIX + 1))
+        if entry is not None:
+            self.entries[(kind, pk)] = entry
+            for key in _keys(kind, entry['label']):
+                insort(self.keys, (key, kind, pk))
+                touched.update(key[:n] for n in range(1, SHORT_PREFIX + 1))
+
+    def matches(self, prefix):
+        lo = bisect_left(self.keys, (prefix,))
+        hi = bisect_left(self.keys, (prefix + HIGH,))
+        return {(kind, pk) for _, kind, pk in self.keys[lo:hi]}
+
+    def best(self, refs, limit):
+        return heapq.nsmallest(limit, (self.entries[ref] for ref in refs), key=self.rank)
+
+    def rebuild_top(self, prefixes):
+        for prefix in prefixes:
+            best = self.best(self.matches(prefix), MAX_LIMIT)
+            if best:
+                self.top[prefix] = best
+            else:
+                self.top.pop(prefix, None)
+
+    def complete(self, prefix, limit):
+        if len(prefix) <= SHORT_PREFIX:
+            return self.top.get(prefix, [])[:limit]
+        return self.best(self.matches(prefix), limit)
+
+
+def _listing_rows():
+    return CarsListing.objects.values_list('id', 'title', 'vin', 'make_id', 'model_id')
+
+
+def _make_rows():
+    return Make.objects.filter(listings_count__gt=0).values_list('id', 'name', 'listings_count')
+
+
+def _model_rows():
+    return (
+        ModelName.objects
+        .annotate(n=Count('listings'))
+        .filter(n__gt=0)
+        .values_list('id', 'name', 'make_id', 'make__name', 'n')
+    )
+
+
+def _listing_entries(pk, title, vin):
+    return [
+        ('title', {'type': 'title', 'id': pk, 'label': title, 'count': 1}),
+        ('vin', {'type': 'vin', 'id': pk, 'label': vin, 'count': 1}),
+    ]
+
+
+def _make_entry(pk, name, count):
+    return {'type': 'make', 'id': pk, 'label': name, 'count': count}
+
+
+def _model_entry(pk, name, make_id, make_name, count):
+    return {'type': 'model', 'id': pk, 'make': make_id, 'label': f"{make_name} {name}", 'count': count}
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._entries = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def entries(self):
+        version = get_version('suggest')
+        if self._entries is None or self._version != version:
+            with self._lock:
+                if self._entries is None or self._version != version:
+                    self._entries = self._build()
+                    self._version = version
+        return self._entries
+
+    def _build(self):
+        entries = _Entries()
+        for pk, title, vin, make_id, model_id in _listing_rows():
+            entries.listing_refs[pk] = (make_id, model_id)
+            for kind, entry in _listing_entries(pk, title, vin):
+                entries.entries[(kind, pk)] = entry
+        for row in _make_rows():
+            entries.entries[('make', row[0])] = _make_entry(*row)
+        for row in _model_rows():
+            entries.entries[('model', row[0])] = _model_entry(*row)
+
+        entries.keys = sorted(
+            (key, kind, pk)
+            for (kind, pk), entry in entries.entries.items()
+            for key in _keys(kind, entry['label'])
+        )
+        by_prefix = defaultdict(set)
+        for key, kind, pk in entries.keys:
+            for n in range(1, SHORT_PREFIX + 1):
+                by_prefix[key[:n]].add((kind, pk))
+        entries.top = {prefix: entries.best(refs, MAX_LIMIT) for prefix, refs in by_prefix.items()}
+        return entries
+
+    def refresh(self, listings=(), makes=(), models=()):
+        """Re-read the given listings/makes/models and publish a new version."""
+        with self._lock:
+            # Patching entries that miss another worker's changes would publish them as current
+            if self._entries is None or self._version != get_version('suggest'):
+                self.invalidate()
+                return
+            entries = self._entries.copy()
+            touched = set()
+            listings, makes, models = set(listings), set(makes), set(models)
+
+            # Counts change for the make/model a listing leaves and the one it joins
+            for pk in listings:
+                previous = entries.listing_refs.pop(pk, None)
+                if previous:
+                    makes.add(previous[0])
+                    models.add(previous[1])
+                entries.set('title', pk, None, touched)
+                entries.set('vin', pk, None, touched)
+            for pk, title, vin, make_id, model_id in _listing_rows().filter(pk__in=listings):
+                entries.listing_refs[pk] = (make_id, model_id)
+                makes.add(make_id)
+                models.add(model_id)
+                for kind, entry in _listing_entries(pk, title, vin):
+                    entries.set(kind, pk, entry, touched)
+
+            found = {row[0]: row for row in _make_rows().filter(pk__in=makes)}
+            for pk in makes:
+                entries.set('make', pk, _make_entry(*found[pk]) if pk in found else None, touched)
+            found = {row[0]: row for row in _model_rows().filter(pk__in=models)}
+            for pk in models:
+                entries.set('model', pk, _model_entry(*found[pk]) if pk in found else None, touched)
+
+            entries.rebuild_top(touched)
+            self._entries, self._version = entries, bump_version('suggest')
+
+    def invalidate(self):
+        bump_version('suggest')
+
+    def complete(self, text, limit):
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        return self.entries().complete(prefix, min(limit, MAX_LIMIT))
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,91 @@
+import random
+
+from django.db import connection
+
+from .models import (
+    CarsListing, Make, ModelName, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature, SafetyFeature
+)
+
+
+# ---------- Synthetic inventory for the benchmark commands ----------
+#
+# Rows are bulk inserted, so no signal runs: callers refresh whatever
+# derived data they measure. Meant to be loaded inside a transaction that
+# is rolled back afterwards.
+
+TITLE_WORDS = [
+    'Classic', 'Restored', 'Original', 'Convertible', 'Coupe', 'Roadster', 'Sedan', 'Wagon',
+    'Turbo', 'Supercharged', 'Matching', 'Numbers', 'Barn', 'Find', 'Collector', 'Edition',
+]
+DESCRIPTION_WORDS = [
+    'garage', 'kept', 'rebuilt', 'engine', 'new', 'paint', 'leather', 'interior', 'service',
+    'history', 'documented', 'chrome', 'bumpers', 'rust', 'free', 'body', 'manual', 'gearbox',
+]
+
+
+def load_inventory(rows, seed=42):
+    """Insert ``rows`` random listings plus their lookups; returns ``{filter name: [lookup rows]}``."""
+    rng = random.Random(seed)
+
+    def create(model, field, count):
+        return model.objects.bulk_create(model(**{field: f"bench-{model.__name__}-{i}"}) for i in range(count))
+
+    makes = create(Make, 'name', 60)
+    models = ModelName.objects.bulk_create(
+        ModelName(make=make, name=f"bench-model-{make.pk}-{i}") for make in makes for i in range(12)
+    )
+    lookups = {
+        'make': makes,
+        'model': models,
+        'color': create(Color, 'name', 16),
+        'transmission': create(Transmission, 'type', 4),
+        'condition': create(Condition, 'type', 4),
+        'fuel_type': create(FuelType, 'type', 6),
+        'drive_type': create(DriveType, 'type', 4),
+        'car_type': create(CarType, 'type', 10),
+        'features': create(Feature, 'name', 40),
+        'safety_features': create(SafetyFeature, 'name', 20),
+    }
+
+    listings = []
+    for i in range(rows):
+        model = rng.choice(models)
+        listings.append(CarsListing(
+            title=f"{' '.join(rng.sample(TITLE_WORDS, 3))} {i}",
+            description=' '.join(rng.choices(DESCRIPTION_WORDS, k=30)),
+            make_id=model.make_id,
+            model=model,
+            color=rng.choice(lookups['color']),
+            transmission=rng.choice(lookups['transmission']),
+            condition=rng.choice(lookups['condition']),
+            fuel_type=rng.choice(lookups['fuel_type']),
+            drive_type=rng.choice(lookups['drive_type']),
+            car_type=rng.choice(lookups['car_type']),
+            year=rng.randint(1950, 2025),
+            mileage=rng.randint(0, 400000),
+            engine_size=round(rng.uniform(1.0, 6.0), 1),
+            cylinders=rng.choice([4, 6, 8, 12]),
+            doors=rng.choice([2, 4, 5]),
+            vin=f"BENCH{i:08d}{rng.randrange(16 ** 4):04X}",
+            price=rng.randint(2000, 250000),
+        ))
+    listings = CarsListing.objects.bulk_create(listings, batch_size=2000)
+
+    for field in ('features', 'safety_features'):
+        through = getattr(CarsListing, field).through
+        target = getattr(CarsListing, field).field.m2m_reverse_field_name()
+        through.objects.bulk_create(
+            (
+                through(carslisting_id=listing.pk, **{f"{target}_id": value.pk})
+                for listing in listings
+                for value in rng.sample(lookups[field], 3)
+            ),
+            batch_size=5000,
+        )
+    return lookups
+
+
+def analyze(*models):
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f"ANALYZE {model._meta.db_table}")
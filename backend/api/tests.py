@@ -1,3 +1,1322 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.postgres.signals import get_citext_oids, get_hstore_oids
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import QueryDict
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from . import jobs
+from . import recommendations
+from . import resize
+from . import response_cache
+from . import search
+from . import seo
+from .deletion import delete_listings
+from .images import VARIANT_FORMATS, image_files, supported_formats
+from .importer import ListingImporter
+from .listing_index import ListingIndex, listing_index
+from .pagination import ListingKeysetPagination
+
+from .models import (
+    CarsListing, ImageJob, ListingImage, Make, ModelName, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature,
+    ListingRecommendations, MediaBlob, MediaDeletion, RecommendationRefresh, SafetyFeature
+)
+from .query_budget import query_budget
+from .serializers import CarsListingCardSerializer
+from .suggest import suggest_index
+from .views import BATCH_MAX_IDS
+
+
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_listing(make, model, lookups, **fields):
+    values = {
+        'title': f"{make.name} {model.name}",
+        'year': 1965,
+        'mileage': 50000,
+        'engine_size': 4.2,
+        'cylinders': 6,
+        'doors': 2,
+        'price': 100000,
+        **fields,
+    }
+    values.setdefault('vin', f"VIN{CarsListing.objects.count() + 1:06d}")
+    return CarsListing.objects.create(make=make, model=model, **lookups, **values)
+
+
+class ListingFixtureMixin:
+    """A few listings over two makes, with the lookups they need; the cache starts empty."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.jaguar = Make.objects.create(name='Jaguar')
+        self.porsche = Make.objects.create(name='Porsche')
+        self.e_type = ModelName.objects.create(make=self.jaguar, name='E-Type')
+        self.carrera = ModelName.objects.create(make=self.porsche, name='911')
+        self.red = Color.objects.create(name='Red')
+        self.silver = Color.objects.create(name='Silver')
+        self.lookups = {
+            'color': self.red,
+            'transmission': Transmission.objects.create(type='Manual'),
+            'condition': Condition.objects.create(type='Restored'),
+            'fuel_type': FuelType.objects.create(type='Petrol'),
+            'drive_type': DriveType.objects.create(type='RWD'),
+            'car_type': CarType.objects.create(type='Coupe'),
+        }
+        self.leather = Feature.objects.create(name='Leather seats')
+        self.abs = SafetyFeature.objects.create(name='ABS')
+
+        self.listings = [
+            create_listing(self.jaguar, self.e_type, self.lookups, price=90000, mileage=70000, year=1963),
+            create_listing(self.jaguar, self.e_type, self.lookups, price=125000, mileage=40000, year=1966),
+            create_listing(self.porsche, self.carrera, {**self.lookups, 'color': self.silver}, price=80000, mileage=90000),
+            create_listing(self.porsche, self.carrera, {**self.lookups, 'color': self.silver}, price=150000, mileage=20000),
+            create_listing(self.porsche, self.carrera, self.lookups, price=125000, mileage=60000, year=1973),
+        ]
+        for listing in self.listings[:3]:
+            listing.features.add(self.leather)
+        self.listings[0].safety_features.add(self.abs)
+        for listing in self.listings:
+            ListingImage.objects.create(listing=listing, path=f"listings/{listing.pk}/front.jpg")
+
+
+# ---------- Query budgets (api/query_budget.py) ----------
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(ListingFixtureMixin, APITestCase):
+    """Strict budgets raise QueryBudgetExceeded, which the test client re-raises."""
+
+    def assertWithinBudget(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertIn(response.status_code, (200, 304), url)
+        return response
+
+    def test_listings_list(self):
+        self.assertWithinBudget('/api/v1/car-listings/')
+        self.assertWithinBudget('/api/v1/car-listings/', {'sort_date': 'price', 'view': 'card'})
+        self.assertWithinBudget('/api/v1/car-listings/', {'make': self.jaguar.pk, 'features': self.leather.pk})
+        self.assertWithinBudget('/api/v1/car-listings/', {'facets': '1'})
+        self.assertWithinBudget('/api/v1/car-listings/', {'search': 'jaguar'})
+
+    def test_listings_keyset_pages(self):
+        response = self.assertWithinBudget('/api/v1/car-listings/', {'paginate': 'cursor', 'count': '1'})
+        while response.data['next']:
+            response = self.assertWithinBudget(response.data['next'])
+
+    def test_listing_detail_and_batch(self):
+        self.assertWithinBudget(f'/api/v1/car-listings/{self.listings[0].pk}/')
+        ids = ','.join(str(listing.pk) for listing in self.listings)
+        self.assertWithinBudget('/api/v1/car-listings/batch/', {'ids': ids})
+
+    def test_lookups(self):
+        self.assertWithinBudget('/api/v1/top-makes/')
+        self.assertWithinBudget('/api/v1/suggest/', {'q': 'jag'})
+        self.assertWithinBudget(f'/api/v1/car-listings/{self.listings[0].pk}/other/')
+
+    def test_over_budget_raises(self):
+        with self.assertRaises(AssertionError):
+            with query_budget(0, 'test'):
+                list(Make.objects.all())
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetConnectionTests(TransactionTestCase):
+    def test_connection_setup_is_not_counted(self):
+        # django.contrib.postgres looks its types up on the first connection of a process
+        get_hstore_oids.cache_clear()
+        get_citext_oids.cache_clear()
+        connection.close()
+        with query_budget(1, 'test') as counter:
+            list(Make.objects.all())
+        self.assertEqual(counter.count, 1)
+
+
+# ---------- Bulk import (api/importer.py) ----------
+
+def write_image(path, color='red', size=(64, 48)):
+    Image.new('RGB', size, color).save(path, 'JPEG')
+    return path
+
+
+def import_row(vin, images, **fields):
+    return {
+        'title': 'Jaguar E-Type', 'make': 'Jaguar', 'model': 'E-Type', 'color': 'Red', 'transmission': 'Manual',
+        'condition': 'Restored', 'fuel_type': 'Petrol', 'drive_type': 'RWD', 'car_type': 'Coupe', 'year': '1965',
+        'mileage': '50000', 'engine_size': '4.2', 'cylinders': '6', 'doors': '2', 'vin': vin, 'price': '100000',
+        'features': 'Leather seats', 'images': '|'.join(images), **fields,
+    }
+
+
+class MediaRootMixin:
+    """MEDIA_ROOT and the source images live in temporary directories."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.source_dir, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root, SEO_ROOT=os.path.join(self.media_root, 'seo'))
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(folder, name), self.media_root)
+            for folder, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ListingImporterTests(MediaRootMixin, APITestCase):
+    def test_import_creates_listings_lookups_and_images(self):
+        write_image(os.path.join(self.source_dir, 'front.jpg'))
+        importer = ListingImporter(self.source_dir)
+        created = importer.import_batch([(2, import_row('1E00001', ['front.jpg'])), (3, import_row('1E00002', []))])
+
+        self.assertEqual(created, 2)
+        self.assertEqual(importer.errors, [])
+        self.assertEqual(Make.objects.get().listings_count, 2)
+        image = ListingImage.objects.get()
+        self.assertEqual(image.processing_status, ListingImage.STATUS_READY)
+        self.assertTrue(image.variants)
+        self.assertTrue(image.placeholder.startswith('data:image/'))
+
+        # Re-running skips what is already stored
+        self.assertEqual(ListingImporter(self.source_dir).import_batch([(2, import_row('1E00001', ['front.jpg']))]), 0)
+
+    def test_rolled_back_batch_releases_its_files(self):
+        write_image(os.path.join(self.source_dir, 'front.jpg'))
+        importer = ListingImporter(self.source_dir)
+        with mock.patch.object(ListingImage.objects, 'bulk_create', side_effect=IntegrityError("boom")):
+            with self.assertRaises(IntegrityError):
+                importer.import_batch([(2, import_row('1E00001', ['front.jpg']))])
+
+        self.assertFalse(CarsListing.objects.exists())
+        self.assertFalse(Make.objects.exists())
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+        self.assertEqual(importer.created, [])
+
+    def test_bad_rows_and_images_are_reported(self):
+        with open(os.path.join(self.source_dir, 'broken.jpg'), 'wb') as fh:
+            fh.write(b'not an image')
+        importer = ListingImporter(self.source_dir)
+        created = importer.import_batch([
+            (2, import_row('1E00001', ['broken.jpg'])),
+            (3, import_row('1E00002', ['missing.jpg'])),
+            (4, import_row('1E00003', [], price='cheap')),
+        ])
+
+        self.assertEqual(created, 1)
+        self.assertEqual(len(importer.errors), 3)
+        self.assertFalse(ListingImage.objects.exists())
+
+    def test_command_refreshes_committed_batches_when_a_later_one_fails(self):
+        source = os.path.join(self.source_dir, 'listings.csv')
+        rows = [import_row('1E00001', [], description=''), import_row('1E00002', [], description='x' * (csv.field_size_limit() + 1))]
+        with open(source, 'w', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(rows[1]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+        with mock.patch('api.importer.refresh_derived') as refresh_derived:
+            with self.assertRaisesMessage(CommandError, 'Malformed CSV'):
+                call_command('import_listings', source, batch_size=1, workers=1, stdout=io.StringIO())
+
+        listing = CarsListing.objects.get()
+        refresh_derived.assert_called_once_with([listing.pk], mock.ANY)
+
+
+# ---------- On-demand image sizes (api/resize.py) ----------
+
+def jpeg_bytes(size=(640, 480), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@override_settings(CACHES=TEST_CACHES, QUERY_BUDGET_STRICT=True)
+class ResizedImageTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.media_root, 'image_cache')
+        cache_dir = override_settings(IMAGE_CACHE_DIR=self.cache_dir)
+        cache_dir.enable()
+        self.addCleanup(cache_dir.disable)
+        self.image = ListingImage.objects.create(
+            listing=self.listings[0], path=SimpleUploadedFile('front.jpg', jpeg_bytes())
+        )
+        self.url = f'/api/v1/img/{self.image.pk}/'
+
+    def test_parameters_are_validated(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'w': '161'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'w': 'wide'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'w': '320', 'fmt': 'gif'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/img/0/', {'w': '320'}).status_code, 404)
+
+    def test_resizes_and_answers_conditional_requests(self):
+        response = self.client.get(self.url, {'w': '320', 'fmt': 'jpeg'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(Image.open(io.BytesIO(response.content)).size, (320, 240))
+
+        cached = self.client.get(self.url, {'w': '320', 'fmt': 'jpeg'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_never_enlarges(self):
+        response = self.client.get(self.url, {'w': '1920', 'fmt': 'jpeg'})
+        self.assertEqual(Image.open(io.BytesIO(response.content)).size, (640, 480))
+
+    def test_format_follows_accept(self):
+        if 'webp' not in supported_formats():
+            self.skipTest("Pillow was built without WebP")
+        response = self.client.get(self.url, {'w': '160'}, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+
+    def test_cache_stays_within_its_limit(self):
+        folder = os.path.join(self.cache_dir, 'ab')
+        os.makedirs(folder)
+        with override_settings(IMAGE_CACHE_MAX_BYTES=10_000):
+            for n in range(30):
+                path = os.path.join(folder, f"{n:02d}.jpeg")
+                with open(path, 'wb') as fh:
+                    fh.write(b'x' * 1000)
+                os.utime(path, (n, n))
+                resize._account(1000)
+                size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+                self.assertLessEqual(size, 10_000)
+        # The least recently used went first
+        self.assertIn('29.jpeg', os.listdir(folder))
+        self.assertNotIn('00.jpeg', os.listdir(folder))
+
+    def test_cache_left_over_the_limit_is_evicted_by_the_next_write(self):
+        # Written by processes that have since been recycled
+        folder = os.path.join(self.cache_dir, 'cd')
+        os.makedirs(folder)
+        for n in range(120):
+            with open(os.path.join(folder, f"{n:03d}.jpeg"), 'wb') as fh:
+                fh.write(b'x' * 1000)
+        with override_settings(IMAGE_CACHE_MAX_BYTES=100_000):
+            resize._account(1000)
+        self.assertLessEqual(len(os.listdir(folder)) * 1000, 100_000)
+
+
+# ---------- Facet counts (api/facets.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class FacetTests(ListingFixtureMixin, APITestCase):
+    def facets(self, **params):
+        response = self.client.get('/api/v1/car-listings/', {'facets': '1', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['facets']
+
+    def test_counts_over_all_listings(self):
+        facets = self.facets()
+        self.assertEqual(facets['make'], {str(self.jaguar.pk): 2, str(self.porsche.pk): 3})
+        self.assertEqual(facets['color'], {str(self.red.pk): 3, str(self.silver.pk): 2})
+        self.assertEqual(facets['features'], {str(self.leather.pk): 3})
+        self.assertEqual(
+            [bucket['count'] for bucket in facets['price']],
+            [0, 0, 0, 0, 2, 2, 1],
+        )
+        self.assertEqual(facets['price'][4], {'min': 75000, 'max': 99999, 'count': 2})
+        self.assertEqual(facets['year'][-1], {'min': 2020, 'max': None, 'count': 0})
+
+    def test_counts_follow_the_filters(self):
+        facets = self.facets(make=self.porsche.pk, price_min=100000)
+        self.assertEqual(facets['make'], {str(self.porsche.pk): 2})
+        self.assertEqual(facets['color'], {str(self.red.pk): 1, str(self.silver.pk): 1})
+        self.assertEqual(facets['features'], {})
+        self.assertEqual(sum(bucket['count'] for bucket in facets['mileage']), 2)
+
+    def test_m2m_filters_count_each_listing_once(self):
+        second = Feature.objects.create(name='Wire wheels')
+        self.listings[0].features.add(second)
+        facets = self.facets(features=[self.leather.pk, second.pk])
+        self.assertEqual(facets['make'], {str(self.jaguar.pk): 2, str(self.porsche.pk): 1})
+
+    def test_no_matches(self):
+        facets = self.facets(price_min=10 ** 6)
+        self.assertEqual(facets['make'], {})
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price']), 0)
+
+
+# ---------- Derived data refreshes (api/signals.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class SignalBatchingTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    def test_a_listing_save_refreshes_recommendations_once(self):
+        with mock.patch('api.recommendations.schedule_refresh') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    listing = create_listing(self.jaguar, self.e_type, self.lookups)
+                    listing.features.add(self.leather)
+                    listing.safety_features.add(self.abs)
+        refresh.assert_called_once_with({listing.pk})
+
+    def test_reverse_m2m_changes_join_the_batch(self):
+        with mock.patch('api.recommendations.schedule_refresh') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self.listings[4].save()
+                    self.abs.listings.add(self.listings[1], self.listings[2])
+        refresh.assert_called_once_with({self.listings[1].pk, self.listings[2].pk, self.listings[4].pk})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecommendationRefreshTests(ListingFixtureMixin, MediaRootMixin, TransactionTestCase):
+    # Committed for real: the fixture's own refreshes don't swallow the test's
+    def setUp(self):
+        super().setUp()
+        recommendations.rebuild_all()
+        RecommendationRefresh.objects.all().delete()
+
+    def assert_matches_a_rebuild(self):
+        stored = dict(ListingRecommendations.objects.values_list('listing_id', 'similar_ids'))
+        recommendations.rebuild_all()
+        self.assertEqual(stored, dict(ListingRecommendations.objects.values_list('listing_id', 'similar_ids')))
+
+    def test_saves_are_queued_for_the_worker(self):
+        listing = create_listing(self.jaguar, self.e_type, self.lookups, price=95000)
+        gone = self.listings[2].pk
+        self.listings[2].delete()
+        self.assertCountEqual(RecommendationRefresh.objects.values_list('listing_id', flat=True), [listing.pk, gone])
+        self.assertFalse(ListingRecommendations.objects.filter(listing=listing).exists())
+
+        self.assertEqual(recommendations.refresh_queued(), 2)
+        self.assertFalse(RecommendationRefresh.objects.exists())
+        similar = ListingRecommendations.objects.get(listing=self.listings[0]).similar_ids
+        self.assertIn(listing.pk, similar)
+        self.assertNotIn(gone, similar)
+        self.assert_matches_a_rebuild()
+
+    @override_settings(IMAGE_JOBS_INLINE=True)
+    def test_inline_mode_refreshes_on_commit(self):
+        listing = create_listing(self.jaguar, self.e_type, self.lookups, price=95000)
+        self.assertFalse(RecommendationRefresh.objects.exists())
+        self.assertIn(listing.pk, ListingRecommendations.objects.get(listing=self.listings[0]).similar_ids)
+        self.assert_matches_a_rebuild()
+
+# ---------- Keyset pagination (api/pagination.py) ----------
+
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTests(ListingFixtureMixin, APITestCase):
+    def pages(self, sort):
+        with mock.patch.object(ListingKeysetPagination, 'page_size', 2):
+            response = self.client.get('/api/v1/car-listings/', {'paginate': 'cursor', 'sort_date': sort})
+            pages = [response.json()]
+            while pages[-1]['next']:
+                pages.append(self.client.get(pages[-1]['next']).json())
+        return pages
+
+    def test_pages_cover_every_listing_in_order(self):
+        for sort, key in [
+            ('price', lambda listing: (listing.price, listing.pk)),
+            ('-price', lambda listing: (-listing.price, -listing.pk)),
+            ('mileage', lambda listing: (listing.mileage, listing.pk)),
+            ('created_at', lambda listing: (-listing.created_at.timestamp(), -listing.pk)),
+        ]:
+            pages = self.pages(sort)
+            ids = [row['id'] for page in pages for row in page['results']]
+            self.assertEqual(ids, [listing.pk for listing in sorted(self.listings, key=key)], sort)
+            self.assertEqual(len(pages), 3)
+
+    def test_previous_goes_back(self):
+        pages = self.pages('price')
+        with mock.patch.object(ListingKeysetPagination, 'page_size', 2):
+            previous = self.client.get(pages[2]['previous']).json()
+            first = self.client.get(previous['previous']).json()
+        self.assertEqual(previous['results'], pages[1]['results'])
+        self.assertEqual(first['results'], pages[0]['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_count_on_request(self):
+        response = self.client.get('/api/v1/car-listings/', {'paginate': 'cursor', 'count': '1', 'make': self.porsche.pk})
+        self.assertEqual(response.json()['count'], 3)
+        self.assertNotIn('count', self.client.get('/api/v1/car-listings/', {'paginate': 'cursor'}).json())
+
+    def test_tampered_cursors_are_rejected(self):
+        for sort, cursor in [
+            ('price', 'not base64!'),
+            ('price', base64.urlsafe_b64encode(b'not json').decode()),
+            ('price', encode_cursor([1, 2])),
+            ('price', encode_cursor({'s': 'mileage', 'v': 1, 'i': 1})),
+            ('price', encode_cursor({'s': 'price', 'v': {}, 'i': 1})),
+            ('price', encode_cursor({'s': 'price', 'v': '100', 'i': 1})),
+            ('price', encode_cursor({'s': 'price', 'v': 100, 'i': 'x'})),
+            ('price', encode_cursor({'s': 'price', 'v': 100})),
+            ('created_at', encode_cursor({'s': 'created_at', 'v': 'garbage', 'i': 1})),
+            ('created_at', encode_cursor({'s': 'created_at', 'v': 5, 'i': 1})),
+            ('created_at', encode_cursor({'s': 'created_at', 'v': '2024-13-45T00:00:00', 'i': 1})),
+        ]:
+            response = self.client.get('/api/v1/car-listings/', {'cursor': cursor, 'sort_date': sort})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.json(), {'detail': ListingKeysetPagination.invalid_cursor_message})
+
+
+# ---------- In-memory listing index (api/listing_index.py) ----------
+
+@override_settings(CACHES=TEST_CACHES, RESPONSE_CACHE_ENABLED=False)
+class ListingIndexParityTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    """The index must answer exactly what the ORM answers."""
+
+    def listing_page(self, params, indexed):
+        with override_settings(LISTING_INDEX_ENABLED=indexed):
+            response = self.client.get('/api/v1/car-listings/', params)
+        self.assertEqual(response.status_code, 200, params)
+        return response.json()
+
+    def assertParity(self, params):
+        self.assertEqual(self.listing_page(params, True), self.listing_page(params, False), params)
+
+    def test_filters_sorts_and_facets(self):
+        wire_wheels = Feature.objects.create(name='Wire wheels')
+        self.listings[3].features.add(wire_wheels)
+        for params in [
+            {},
+            {'sort_date': '-price'},
+            {'sort_date': 'mileage', 'year_min': 1965},
+            {'make': self.jaguar.pk},
+            {'model': self.carrera.pk, 'color': self.silver.pk},
+            {'features': self.leather.pk},
+            {'features': [self.leather.pk, wire_wheels.pk]},
+            {'safety_features': self.abs.pk},
+            {'price_min': 90000, 'price_max': 125000},
+            {'mileage_max': 60000, 'cylinders_min': 6, 'doors': 2},
+            {'vin': 'vin00000'},
+            {'facets': '1'},
+            {'facets': '1', 'make': self.porsche.pk, 'price_min': 100000},
+            {'view': 'card', 'sort_date': 'price'},
+        ]:
+            self.assertParity(params)
+
+    @override_settings(LISTING_INDEX_ENABLED=True)
+    def test_follows_saves(self):
+        self.listing_page({}, True)
+        listing = self.listings[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.price = 500000
+            listing.save()
+            self.listings[4].delete()
+        self.assertEqual(listing_index.search(QueryDict('price_min=400000'), CarsListing.objects.all()).ids, [listing.pk])
+        self.assertParity({'sort_date': '-price'})
+
+    @override_settings(LISTING_INDEX_ENABLED=True)
+    def test_a_stale_worker_does_not_publish_its_copy(self):
+        first, second = ListingIndex(), ListingIndex()
+        first.columns()
+        second.columns()
+        CarsListing.objects.filter(pk=self.listings[0].pk).update(price=999999)
+        second.refresh([self.listings[0].pk])
+        first.refresh([self.listings[1].pk])
+
+        found = first.search(QueryDict('price_min=999999'), CarsListing.objects.all())
+        self.assertEqual(found.ids, [self.listings[0].pk])
+
+
+# ---------- Batch fetch (/car-listings/batch/) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class ListingBatchTests(ListingFixtureMixin, APITestCase):
+    url = '/api/v1/car-listings/batch/'
+
+    def test_keeps_request_order_and_reports_missing(self):
+        wanted = [self.listings[3].pk, 0, self.listings[0].pk, self.listings[3].pk, self.listings[2].pk]
+        response = self.client.get(self.url, {'ids': ','.join(map(str, wanted))})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row['id'] for row in data['results']], [self.listings[3].pk, self.listings[0].pk, self.listings[2].pk])
+        self.assertEqual(data['missing'], [0])
+
+    def test_matches_the_detail_payload(self):
+        listing = self.listings[1]
+        detail = self.client.get(f'/api/v1/car-listings/{listing.pk}/').json()
+        self.assertEqual(self.client.get(self.url, {'ids': str(listing.pk)}).json()['results'], [detail])
+
+    def test_card_view(self):
+        response = self.client.get(self.url, {'ids': f"{self.listings[0].pk}", 'view': 'card'})
+        self.assertNotIn('description', response.json()['results'][0])
+
+    def test_invalid_ids(self):
+        for ids in ['', ',', '1,x', ','.join(str(n) for n in range(BATCH_MAX_IDS + 1))]:
+            self.assertEqual(self.client.get(self.url, {'ids': ids}).status_code, 400, ids)
+
+
+# ---------- Content-addressed image storage (api/storage.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class ContentAddressedStorageTests(MediaRootMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ListingImage._meta.get_field('path').storage
+
+    def test_identical_content_is_stored_once(self):
+        first = self.storage.save('listings/1/a.jpg', ContentFile(b'same bytes'))
+        second = self.storage.save('listings/2/b.JPG', ContentFile(b'same bytes'))
+        other = self.storage.save('listings/2/c.jpg', ContentFile(b'other bytes'))
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith('blobs/') and first.endswith('.jpg'))
+        self.assertNotEqual(first, other)
+        self.assertEqual(MediaBlob.objects.get(name=first).references, 2)
+        self.assertEqual(MediaBlob.objects.get(name=first).size, len(b'same bytes'))
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_the_last_reference_removes_the_file(self):
+        name = self.storage.save('a.jpg', ContentFile(b'same bytes'))
+        self.storage.save('b.jpg', ContentFile(b'same bytes'))
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).references, 1)
+
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_files_outside_blobs_are_plain(self):
+        os.makedirs(os.path.join(self.media_root, 'listings', '1'))
+        with open(os.path.join(self.media_root, 'listings', '1', 'old.jpg'), 'wb') as fh:
+            fh.write(b'old upload')
+        self.storage.delete('listings/1/old.jpg')
+        self.assertEqual(self.stored_files(), [])
+
+
+@override_settings(CACHES=TEST_CACHES, IMAGE_JOBS_INLINE=True)
+class SharedImageTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    def upload(self, listing, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ListingImage.objects.create(listing=listing, path=SimpleUploadedFile('photo.jpg', content))
+        image.refresh_from_db()
+        return image
+
+    def test_identical_uploads_share_the_original_and_variants(self):
+        content = jpeg_bytes()
+        first = self.upload(self.listings[0], content)
+        second = self.upload(self.listings[1], content)
+
+        self.assertEqual(first.path.name, second.path.name)
+        self.assertEqual(second.variants, first.variants)
+        self.assertEqual(second.placeholder, first.placeholder)
+        self.assertEqual(second.processing_status, ListingImage.STATUS_READY)
+        # Sizes wider than the original can come out identical, and each entry holds a reference
+        for name, uses in Counter(image_files(first)).items():
+            self.assertEqual(MediaBlob.objects.get(name=name).references, 2 * uses, name)
+
+    def test_files_go_with_the_last_image_using_them(self):
+        first = self.upload(self.listings[0], jpeg_bytes())
+        second = self.upload(self.listings[1], jpeg_bytes())
+        files = image_files(first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(all(first.path.storage.exists(name) for name in files))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(any(first.path.storage.exists(name) for name in files))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_a_replaced_original_and_its_variants_go_on_commit(self):
+        image = self.upload(self.listings[0], jpeg_bytes())
+        old_files = image_files(image)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            image.path = SimpleUploadedFile('photo.jpg', jpeg_bytes(color='blue'))
+            image.save()
+            raise IntegrityError
+        # Rolled back: the row still points at them
+        self.assertTrue(all(image.path.storage.exists(name) for name in old_files))
+
+        image.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            image.path = SimpleUploadedFile('photo.jpg', jpeg_bytes(color='blue'))
+            image.save()
+            self.assertTrue(all(image.path.storage.exists(name) for name in old_files))
+        image.refresh_from_db()
+        self.assertFalse(any(image.path.storage.exists(name) for name in old_files))
+        self.assertTrue(all(image.path.storage.exists(name) for name in image_files(image)))
+
+
+# ---------- Listing deletion (api/deletion.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class ListingDeletionTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        # Drop the fixture's placeholder paths for real files
+        ListingImage.objects.all().delete()
+        MediaDeletion.objects.all().delete()
+        with override_settings(IMAGE_JOBS_INLINE=True), self.captureOnCommitCallbacks(execute=True):
+            for n, listing in enumerate(self.listings):
+                ListingImage.objects.create(
+                    listing=listing, path=SimpleUploadedFile('photo.jpg', jpeg_bytes(color=(n * 40, 0, 0)))
+                )
+        self.files = [name for image in ListingImage.objects.all() for name in image_files(image)]
+
+    def test_deletes_in_batches_and_queues_the_files(self):
+        doomed = self.listings[:3]
+        with mock.patch('api.recommendations.schedule_refresh') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                deleted = delete_listings(CarsListing.objects.filter(pk__in=[listing.pk for listing in doomed]), batch_size=2)
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(CarsListing.objects.count(), 2)
+        self.assertEqual(ListingImage.objects.count(), 2)
+        self.assertEqual(Make.objects.get(pk=self.jaguar.pk).listings_count, 0)
+        self.assertEqual(Make.objects.get(pk=self.porsche.pk).listings_count, 2)
+        refreshed = set().union(*(call.args[0] for call in refresh.call_args_list))
+        self.assertEqual(refreshed, {listing.pk for listing in doomed})
+
+        # Left for the image worker
+        queued = list(MediaDeletion.objects.values_list('path', flat=True))
+        self.assertTrue(queued)
+        storage = ListingImage._meta.get_field('path').storage
+        self.assertTrue(all(storage.exists(name) for name in queued))
+        jobs.delete_queued_files()
+        self.assertFalse(MediaDeletion.objects.exists())
+        remaining = {name for image in ListingImage.objects.all() for name in image_files(image)}
+        self.assertEqual(set(self.stored_blobs()), remaining)
+        self.assertEqual(set(MediaBlob.objects.values_list('name', flat=True)), remaining)
+
+    def test_queues_a_batch_of_files_with_one_insert(self):
+        few, many = self.listings[3:]
+        ListingImage.objects.bulk_create([
+            ListingImage(listing=many, path=f"listings/{many.pk}/{n}.jpg") for n in range(20)
+        ])
+        files = [name for image in ListingImage.objects.filter(listing__in=[few, many]) for name in image_files(image)]
+
+        counts = []
+        for listing in (few, many):
+            with self.captureOnCommitCallbacks(), CaptureQueriesContext(connection) as queries:
+                delete_listings(CarsListing.objects.filter(pk=listing.pk))
+            inserts = [query['sql'] for query in queries if 'INSERT INTO "api_mediadeletion"' in query['sql']]
+            self.assertEqual(len(inserts), 1)
+            counts.append(len(queries))
+
+        # The cost of a batch doesn't grow with its images
+        self.assertEqual(counts[0], counts[1])
+        self.assertCountEqual(MediaDeletion.objects.values_list('path', flat=True), files)
+
+    @override_settings(IMAGE_JOBS_INLINE=True)
+    def test_inline_mode_removes_files_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_listings(CarsListing.objects.all())
+        self.assertFalse(MediaDeletion.objects.exists())
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self.stored_blobs(), [])
+
+    def stored_blobs(self):
+        return [name for name in self.stored_files() if name.startswith('blobs/')]
+
+
+# ---------- Sitemap and SSR metadata files (api/seo.py) ----------
+
+@override_settings(CACHES=TEST_CACHES, SITE_URL='https://example.com')
+class SeoFileTests(ListingFixtureMixin, MediaRootMixin, TransactionTestCase):
+    # Committed for real, like the saves the files follow
+    def setUp(self):
+        super().setUp()
+        # Two listings per shard
+        shard_size = mock.patch.object(seo, 'SHARD_SIZE', 2)
+        shard_size.start()
+        self.addCleanup(shard_size.stop)
+        seo.rebuild()
+
+    def read(self, *parts):
+        with open(os.path.join(settings.SEO_ROOT, *parts), 'rb') as fh:
+            content = fh.read()
+        return gzip.decompress(content).decode() if parts[-1].endswith('.gz') else content.decode()
+
+    def shard_of(self, listing):
+        return seo.shard_name(listing.pk // 2)
+
+    def test_rebuild_writes_shards_index_and_metadata(self):
+        index = self.read('sitemap.xml')
+        self.assertIn('<loc>https://example.com/sitemaps/pages.xml.gz</loc>', index)
+        for listing in self.listings:
+            self.assertIn(f"<loc>https://example.com/sitemaps/{self.shard_of(listing)}</loc>", index)
+            self.assertIn(
+                f"<loc>https://example.com/listing/jaguar-e-type-{listing.pk}</loc>"
+                if listing.make_id == self.jaguar.pk else
+                f"<loc>https://example.com/listing/porsche-911-{listing.pk}</loc>",
+                self.read('sitemaps', self.shard_of(listing)),
+            )
+        self.assertIn('<loc>https://example.com/contact-us</loc>', self.read('sitemaps', 'pages.xml.gz'))
+
+        listing = self.listings[1]
+        self.assertEqual(json.loads(self.read('listings', f"{listing.pk}.json")), {
+            'id': listing.pk,
+            'slug': f"jaguar-e-type-{listing.pk}",
+            'url': f"https://example.com/listing/jaguar-e-type-{listing.pk}",
+            'title': 'Jaguar E-Type',
+            'description': '',
+            'price': 125000,
+            'image': f"https://example.com/media/listings/{listing.pk}/front.jpg",
+            'updated_at': CarsListing.objects.get(pk=listing.pk).updated_at.replace(microsecond=0).isoformat(),
+        })
+
+    def test_a_save_rewrites_its_shard_and_patches_the_index(self):
+        listing = self.listings[2]
+        listing.title = 'Porsche 911 Carrera RS'
+        with mock.patch.object(seo, '_shard_lastmods') as regroup:
+            listing.save()
+        regroup.assert_not_called()
+
+        self.assertIn(f"porsche-911-carrera-rs-{listing.pk}</loc>", self.read('sitemaps', self.shard_of(listing)))
+        self.assertEqual(json.loads(self.read('listings', f"{listing.pk}.json"))['title'], 'Porsche 911 Carrera RS')
+        lastmod = CarsListing.objects.get(pk=listing.pk).updated_at.replace(microsecond=0).isoformat()
+        self.assertIn(f"{self.shard_of(listing)}</loc><lastmod>{lastmod}</lastmod>", self.read('sitemap.xml'))
+
+    def test_the_index_is_only_rewritten_when_it_changes(self):
+        with mock.patch.object(seo, '_write_index', wraps=seo._write_index) as write_index:
+            seo.refresh_listings([self.listings[0].pk])
+            write_index.assert_not_called()
+
+            # Deleting both listings of a shard drops it
+            shard = self.shard_of(self.listings[4])
+            doomed = [listing for listing in self.listings if self.shard_of(listing) == shard]
+            CarsListing.objects.filter(pk__in=[listing.pk for listing in doomed]).delete()
+            write_index.assert_called_once()
+
+        self.assertNotIn(shard, self.read('sitemap.xml'))
+        self.assertFalse(os.path.exists(os.path.join(settings.SEO_ROOT, 'sitemaps', shard)))
+        for listing in doomed:
+            self.assertFalse(os.path.exists(os.path.join(settings.SEO_ROOT, 'listings', f"{listing.pk}.json")))
+
+
+# ---------- /filters/ snapshot (api/snapshots.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class FiltersSnapshotTests(ListingFixtureMixin, APITestCase):
+    url = '/api/v1/filters/'
+
+    def test_answers_its_etag_with_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual([make['name'] for make in response.json()['makes']], ['Jaguar', 'Porsche'])
+        self.assertEqual([color['name'] for color in response.json()['colors']], ['Red', 'Silver'])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_a_lookup_change_makes_a_new_snapshot(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            green = Color.objects.create(name='British Racing Green')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('British Racing Green', [color['name'] for color in response.json()['colors']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            green.delete()
+            self.jaguar.name = 'Jaguar Cars'
+            self.jaguar.save()
+        payload = self.client.get(self.url).json()
+        self.assertNotIn('British Racing Green', [color['name'] for color in payload['colors']])
+        self.assertIn('Jaguar Cars', [make['name'] for make in payload['makes']])
+
+
+# ---------- Per-make listing counts (signals.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class MakeListingsCountTests(ListingFixtureMixin, APITestCase):
+    def counts(self):
+        return dict(Make.objects.values_list('name', 'listings_count'))
+
+    def test_follows_creates_make_changes_and_deletes(self):
+        self.assertEqual(self.counts(), {'Jaguar': 2, 'Porsche': 3})
+
+        listing = self.listings[4]
+        listing.make, listing.model = self.jaguar, self.e_type
+        listing.save()
+        self.assertEqual(self.counts(), {'Jaguar': 3, 'Porsche': 2})
+        # Saving without a make change leaves them alone
+        listing.save()
+        self.assertEqual(self.counts(), {'Jaguar': 3, 'Porsche': 2})
+
+        self.listings[0].delete()
+        CarsListing.objects.filter(make=self.porsche).delete()
+        self.assertEqual(self.counts(), {'Jaguar': 2, 'Porsche': 0})
+
+        lotus = Make.objects.create(name='Lotus')
+        create_listing(lotus, ModelName.objects.create(make=lotus, name='Elan'), self.lookups)
+        self.assertEqual(self.counts(), {'Jaguar': 2, 'Porsche': 0, 'Lotus': 1})
+
+    def test_top_makes_and_makes_use_the_counts(self):
+        makes = self.client.get('/api/v1/top-makes/').json()
+        self.assertEqual([(make['name'], make['count']) for make in makes], [('Porsche', 3), ('Jaguar', 2)])
+        self.assertEqual(
+            [card['id'] for card in makes[0]['limited_listings']],
+            [listing.pk for listing in reversed(self.listings[2:])],
+        )
+        self.assertEqual(set(makes[0]['limited_listings'][0]), set(CarsListingCardSerializer.Meta.fields))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CarsListing.objects.filter(make=self.jaguar).delete()
+        self.assertEqual([make['name'] for make in self.client.get('/api/v1/makes/').json()], ['Porsche'])
+        self.assertEqual([make['name'] for make in self.client.get('/api/v1/top-makes/').json()], ['Porsche'])
+
+
+# ---------- Listing indexes (manage.py verify_index_plans) ----------
+
+class ListingIndexPlanTests(APITestCase):
+    def test_every_filter_and_sort_uses_an_index(self):
+        out = io.StringIO()
+        call_command('verify_index_plans', rows=5000, stdout=out)
+        self.assertIn("Every combination uses an index", out.getvalue())
+        # The synthetic inventory is rolled back
+        self.assertFalse(CarsListing.objects.exists())
+
+
+# ---------- Image variants (api/images.py) ----------
+
+@override_settings(CACHES=TEST_CACHES, IMAGE_JOBS_INLINE=True)
+class ImageVariantTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    def test_every_size_and_format_is_made_without_upscaling(self):
+        listing = self.listings[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ListingImage.objects.create(listing=listing, path=SimpleUploadedFile('photo.jpg', jpeg_bytes((800, 600))))
+        image.refresh_from_db()
+
+        self.assertEqual(image.processing_status, ListingImage.STATUS_READY)
+        expected = {'thumbnail': (160, 120), 'card': (480, 360), 'gallery': (800, 600), 'full': (800, 600)}
+        self.assertEqual({size: (entry['width'], entry['height']) for size, entry in image.variants.items()}, expected)
+        for size, entry in image.variants.items():
+            for name in supported_formats():
+                with image.path.storage.open(entry[name], 'rb') as fh, Image.open(fh) as picture:
+                    self.assertEqual(picture.size, expected[size])
+                    self.assertEqual(picture.format, VARIANT_FORMATS[name][0])
+
+        srcset = next(
+            entry['srcset'] for entry in self.client.get(f"/api/v1/car-listings/{listing.pk}/").json()['listing_images']
+            if entry['id'] == image.pk
+        )
+        self.assertEqual(
+            srcset['card']['jpeg'], f"http://testserver{image.path.storage.url(image.variants['card']['jpeg'])}"
+        )
+        self.assertEqual(srcset['card']['width'], 480)
+
+    def test_command_fills_in_missing_variants(self):
+        storage = ListingImage._meta.get_field('path').storage
+        name = storage.save('listings/photo.jpg', ContentFile(jpeg_bytes()))
+        # bulk_create sends no signal, like rows from before variants existed
+        ListingImage.objects.all().delete()
+        ListingImage.objects.bulk_create([ListingImage(listing=self.listings[0], path=name)])
+
+        out = io.StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn("Generated variants for 1 images, 0 failed", out.getvalue())
+        image = ListingImage.objects.get()
+        self.assertEqual(set(image.variants), {'thumbnail', 'card', 'gallery', 'full'})
+        self.assertTrue(all(storage.exists(path) for path in image_files(image)))
+
+
+# ---------- Image job queue (api/jobs.py) ----------
+
+@override_settings(CACHES=TEST_CACHES, IMAGE_JOBS_INLINE=False)
+class ImageJobTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        # run_job() starts with it in the worker; here it would close the test's transaction
+        patcher = mock.patch('api.jobs.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ListingImage.objects.create(listing=self.listings[0], path=SimpleUploadedFile('photo.jpg', content))
+        image.refresh_from_db()
+        return image
+
+    def test_uploads_are_queued_and_processed(self):
+        image = self.upload(jpeg_bytes())
+        self.assertEqual(image.processing_status, ListingImage.STATUS_PENDING)
+        self.assertEqual(image.variants, {})
+        job = ImageJob.objects.get(image=image)
+
+        self.assertEqual(jobs.claim(10), [job.pk])
+        self.assertEqual(ImageJob.objects.get(pk=job.pk).status, ImageJob.STATUS_RUNNING)
+        # Another worker doesn't get it again
+        self.assertEqual(jobs.claim(10), [])
+
+        self.assertEqual(jobs.run_job(job.pk), (job.pk, ImageJob.STATUS_DONE))
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, ListingImage.STATUS_READY)
+        self.assertTrue(image.variants and image.placeholder)
+
+    def test_identical_uploads_reuse_the_variants(self):
+        first = self.upload(jpeg_bytes())
+        jobs.run_job(jobs.claim(10)[0])
+        first.refresh_from_db()
+
+        second = self.upload(jpeg_bytes())
+        self.assertFalse(ImageJob.objects.filter(image=second).exists())
+        self.assertEqual(second.processing_status, ListingImage.STATUS_READY)
+        self.assertEqual(second.variants, first.variants)
+
+    def test_failures_are_retried_with_backoff(self):
+        # The fixture's images have no file behind them
+        image = self.listings[1].images.get()
+        job = jobs.enqueue(image)
+
+        for attempt in range(1, jobs.MAX_ATTEMPTS):
+            before = timezone.now()
+            with self.assertLogs('api.jobs', 'ERROR'):
+                self.assertEqual(jobs.run_job(job.pk), (job.pk, ImageJob.STATUS_PENDING))
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('FileNotFoundError', job.last_error)
+            delay = jobs.RETRY_DELAY * 2 ** (attempt - 1)
+            self.assertTrue(before + delay <= job.run_after <= timezone.now() + delay)
+            # Not due yet
+            self.assertEqual(jobs.claim(10), [])
+
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_job(job.pk), (job.pk, ImageJob.STATUS_FAILED))
+        self.assertEqual(ListingImage.objects.get(pk=image.pk).processing_status, ListingImage.STATUS_FAILED)
+
+    def test_jobs_of_a_dead_worker_are_claimed_again(self):
+        job = jobs.enqueue(self.listings[1].images.get())
+        self.assertEqual(jobs.claim(10), [job.pk])
+        ImageJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - jobs.STALE_AFTER - timedelta(seconds=1))
+        self.assertEqual(jobs.claim(10), [job.pk])
+
+
+# ---------- Full-text search (api/search.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class ListingSearchTests(ListingFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.saloon = create_listing(self.jaguar, self.e_type, self.lookups, title='Jaguar Mark 2 Saloon')
+        self.described = create_listing(
+            self.porsche, self.carrera, self.lookups, price=160000, description='Swapped from a saloon body in the seventies.'
+        )
+        search.refresh_documents()
+
+    def search(self, text, **params):
+        response = self.client.get('/api/v1/car-listings/', {'search': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [listing['id'] for listing in response.json()['results']]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('saloon'), [self.saloon.pk, self.described.pk])
+
+    def test_every_term_must_match_and_the_last_is_a_prefix(self):
+        leather = [listing.pk for listing in reversed(self.listings[:3])]
+        self.assertEqual(self.search('leath'), leather)
+        self.assertEqual(self.search('jaguar leather'), leather[1:])
+        self.assertEqual(self.search('porsche leather'), leather[:1])
+
+    def test_an_explicit_sort_wins_over_relevance(self):
+        self.assertEqual(self.search('saloon', sort_date='-price'), [self.described.pk, self.saloon.pk])
+
+    def test_misspellings_fall_back_to_trigrams(self):
+        porsches = {listing.pk for listing in self.listings[2:]} | {self.described.pk}
+        self.assertEqual(set(self.search('porshe')), porsches)
+        self.assertEqual(self.search('qxzv'), [])
+
+
+# ---------- Type-ahead (api/suggest.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class SuggestTests(ListingFixtureMixin, APITestCase):
+    def suggest(self, text, **params):
+        response = self.client.get('/api/v1/suggest/', {'q': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(entry['type'], entry['label']) for entry in response.json()['results']]
+
+    def test_makes_then_models_then_titles(self):
+        self.assertEqual(self.suggest('por'), [
+            ('make', 'Porsche'), ('model', 'Porsche 911'),
+            ('title', 'Porsche 911'), ('title', 'Porsche 911'), ('title', 'Porsche 911'),
+        ])
+        # Short prefixes come from the precomputed lists
+        self.assertEqual(self.suggest('j', limit=2), [('make', 'Jaguar'), ('model', 'Jaguar E-Type')])
+        self.assertEqual(self.suggest('  '), [])
+        self.assertEqual(self.suggest('ferrari'), [])
+
+    def test_any_word_start_and_no_accents(self):
+        self.assertEqual(self.suggest('911')[:1], [('model', 'Porsche 911')])
+        self.assertEqual(self.suggest('e-ty')[:1], [('model', 'Jaguar E-Type')])
+        skoda = Make.objects.create(name='Škoda')
+        create_listing(skoda, ModelName.objects.create(make=skoda, name='Felicia'), self.lookups, title='Škoda Felicia')
+        suggest_index.invalidate()
+        self.assertEqual(self.suggest('skoda fel'), [('model', 'Škoda Felicia'), ('title', 'Škoda Felicia')])
+
+    def test_refresh_patches_the_changed_listings(self):
+        self.assertEqual(len(self.suggest('jag')), 4)
+        listing = self.listings[1]
+        listing.title = 'Jaguar E-Type Roadster'
+        listing.make, listing.model = self.porsche, self.carrera
+        listing.save()
+        with self.assertNumQueries(3):
+            suggest_index.refresh(listings=[listing.pk])
+
+        self.assertEqual(self.suggest('roadster'), [('title', 'Jaguar E-Type Roadster')])
+        self.assertEqual(self.suggest('jag'), [
+            ('make', 'Jaguar'), ('model', 'Jaguar E-Type'), ('title', 'Jaguar E-Type'), ('title', 'Jaguar E-Type Roadster'),
+        ])
+        counts = {(entry['type'], entry['label']): entry['count'] for entry in suggest_index.complete('p', 20)}
+        self.assertEqual(counts[('make', 'Porsche')], 4)
+        self.assertEqual(counts[('model', 'Porsche 911')], 4)
+
+
+# ---------- Response cache (api/response_cache.py) ----------
+
+@override_settings(CACHES=TEST_CACHES, RESPONSE_CACHE_ENABLED=True, RESPONSE_CACHE_SHARED=True)
+class ResponseCacheTests(ListingFixtureMixin, APITestCase):
+    def get(self, url, params=None, **extra):
+        response = self.client.get(url, params or {}, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hit_until_a_tagged_model_changes(self):
+        first = self.get('/api/v1/makes/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.get('/api/v1/makes/')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+        # /makes/ isn't built from conditions
+        with self.captureOnCommitCallbacks(execute=True):
+            Condition.objects.create(type='Barn find')
+        self.assertEqual(self.get('/api/v1/makes/')['X-Cache'], 'HIT')
+
+        self.jaguar.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.jaguar.name = 'Jaguar Cars'
+            self.jaguar.save()
+        third = self.get('/api/v1/makes/')
+        self.assertEqual(third['X-Cache'], 'MISS')
+        self.assertEqual([make['name'] for make in third.json()], ['Jaguar Cars', 'Porsche'])
+
+    def test_equivalent_urls_share_an_entry(self):
+        self.assertEqual(self.get('/api/v1/car-listings/', {'make': self.jaguar.pk, 'color': self.red.pk})['X-Cache'], 'MISS')
+        response = self.get('/api/v1/car-listings/', {'color': self.red.pk, 'price_min': '', 'make': self.jaguar.pk})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_other_workers_hit_the_shared_cache(self):
+        self.get(f"/api/v1/car-listings/{self.listings[0].pk}/")
+        # As seen from a process whose LRU doesn't have it
+        response_cache._local.clear()
+        self.assertEqual(self.get(f"/api/v1/car-listings/{self.listings[0].pk}/")['X-Cache'], 'HIT')
+
+    def test_browsable_api_and_errors_are_not_cached(self):
+        self.get('/api/v1/makes/', HTTP_ACCEPT='text/html')
+        self.assertNotIn('X-Cache', self.get('/api/v1/makes/', HTTP_ACCEPT='text/html'))
+        for _ in range(2):
+            response = self.client.get('/api/v1/car-listings/999999/')
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response['X-Cache'], 'MISS')
+
+
+# ---------- Conditional GET (api/conditional.py) ----------
+
+@override_settings(CACHES=TEST_CACHES)
+class ConditionalGetTests(ListingFixtureMixin, APITestCase):
+    list_url = '/api/v1/car-listings/'
+
+    def detail_url(self, listing):
+        return f"{self.list_url}{listing.pk}/"
+
+    def test_list_answers_its_validators_with_304(self):
+        response = self.client.get(self.list_url)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        since = self.client.get(self.list_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[0].price = 85000
+            self.listings[0].save()
+        changed = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_detail_follows_its_own_listing(self):
+        first, other = self.listings[:2]
+        etag = self.client.get(self.detail_url(first))['ETag']
+        other_etag = self.client.get(self.detail_url(other))['ETag']
+        self.assertEqual(self.client.get(self.detail_url(first), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A feature change counts as an edit of the listing
+        with self.captureOnCommitCallbacks(execute=True):
+            first.features.remove(self.leather)
+        response = self.client.get(self.detail_url(first), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['features'], [])
+        # Listings are versioned by their own row
+        self.assertEqual(self.client.get(self.detail_url(other), HTTP_IF_NONE_MATCH=other_etag).status_code, 304)
+
+        # Everything else a listing is serialized from moves every detail on
+        with self.captureOnCommitCallbacks(execute=True):
+            self.red.name = 'Carmine'
+            self.red.save()
+        self.assertEqual(self.client.get(self.detail_url(other), HTTP_IF_NONE_MATCH=other_etag).status_code, 200)
+
+    def test_missing_listings_have_no_validators(self):
+        response = self.client.get(f"{self.list_url}999999/")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+# ---------- Compiled serializers (api/fast_serializers.py) ----------
+
+class FastSerializerParityMixin(ListingFixtureMixin):
+    """Compares payloads built with FAST_SERIALIZERS_ENABLED off and on."""
+
+    def setUp(self):
+        super().setUp()
+        recommendations.rebuild_all()
+        # One processed image, so srcset and placeholder are filled in
+        ListingImage.objects.filter(listing=self.listings[0]).update(
+            processing_status=ListingImage.STATUS_READY,
+            placeholder='data:image/webp;base64,UklGRg==',
+            variants={
+                'card': {'width': 480, 'height': 360, 'jpeg': f"listings/{self.listings[0].pk}/variants/front_card.jpg"},
+            },
+        )
+
+    def assert_same_payload(self, url, params=None):
+        payloads = []
+        for fast in (False, True):
+            with override_settings(FAST_SERIALIZERS_ENABLED=fast):
+                response = self.client.get(url, params or {})
+            self.assertEqual(response.status_code, 200, url)
+            payloads.append(response.json())
+        self.assertEqual(payloads[0], payloads[1], url)
+        return payloads[1]
+
+
+@override_settings(CACHES=TEST_CACHES, RESPONSE_CACHE_ENABLED=False)
+class FastSerializerTests(FastSerializerParityMixin, APITestCase):
+    def test_list_detail_batch_and_similar_match_the_drf_serializers(self):
+        page = self.assert_same_payload('/api/v1/car-listings/', {'sort_date': '-price'})
+        self.assertEqual(len(page['results']), len(self.listings))
+        self.assert_same_payload('/api/v1/car-listings/', {'paginate': 'cursor', 'make': self.porsche.pk})
+        detail = self.assert_same_payload(f"/api/v1/car-listings/{self.listings[0].pk}/")
+        self.assertEqual(detail['listing_images'][0]['srcset']['card']['width'], 480)
+        self.assert_same_payload('/api/v1/car-listings/batch/', {'ids': ','.join(str(listing.pk) for listing in self.listings)})
+        self.assert_same_payload(f"/api/v1/car-listings/{self.listings[0].pk}/other/")
+
+
+# ---------- ?view= and ?fields= (api/fieldsets.py) ----------
+
+@override_settings(CACHES=TEST_CACHES, RESPONSE_CACHE_ENABLED=False)
+class ListingFieldsetTests(FastSerializerParityMixin, APITestCase):
+    def test_card_view(self):
+        ListingImage.objects.create(listing=self.listings[0], path='listings/back.jpg')
+        page = self.assert_same_payload('/api/v1/car-listings/', {'view': 'card'})
+        card = next(card for card in page['results'] if card['id'] == self.listings[0].pk)
+        self.assertEqual(list(card), CarsListingCardSerializer.Meta.fields)
+        # The first image only
+        self.assertEqual([image['path'] for image in card['listing_images']], [
+            f"http://testserver/media/listings/{self.listings[0].pk}/front.jpg"
+        ])
+        self.assert_same_payload(f"/api/v1/car-listings/{self.listings[0].pk}/", {'view': 'card'})
+        self.assert_same_payload('/api/v1/top-makes/')
+        self.assert_same_payload('/api/v1/top-makes/', {'view': 'full'})
+
+    def test_sparse_fields(self):
+        page = self.assert_same_payload('/api/v1/car-listings/', {'fields': 'price, id,make', 'sort_date': 'price'})
+        self.assertEqual(
+            page['results'][0], {'id': self.listings[2].pk, 'make': {'id': self.porsche.pk, 'name': 'Porsche'}, 'price': 80000}
+        )
+        batch = self.assert_same_payload(
+            '/api/v1/car-listings/batch/', {'ids': self.listings[1].pk, 'view': 'card', 'fields': 'title'}
+        )
+        self.assertEqual(batch['results'], [{'title': 'Jaguar E-Type'}])
+
+    def test_unknown_views_and_fields_are_rejected(self):
+        self.assertEqual(self.client.get('/api/v1/car-listings/', {'view': 'tiny'}).status_code, 400)
+        response = self.client.get('/api/v1/car-listings/', {'view': 'card', 'fields': 'title,vin'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('vin', response.json()['fields'])
+
+
+# ---------- Inline placeholders (api/images.py, manage.py generate_placeholders) ----------
+
+def decode_placeholder(uri):
+    header, data = uri.split(',', 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PlaceholderTests(ListingFixtureMixin, MediaRootMixin, APITestCase):
+    def test_a_tiny_copy_is_stored_and_served_with_the_image(self):
+        with override_settings(IMAGE_JOBS_INLINE=True), self.captureOnCommitCallbacks(execute=True):
+            image = ListingImage.objects.create(
+                listing=self.listings[0], path=SimpleUploadedFile('photo.jpg', jpeg_bytes((800, 400), 'blue'))
+            )
+        image.refresh_from_db()
+
+        header, picture = decode_placeholder(image.placeholder)
+        self.assertIn(header, ('data:image/webp;base64', 'data:image/jpeg;base64'))
+        self.assertEqual(picture.size, (16, 8))
+        red, green, blue = picture.convert('RGB').getpixel((8, 4))
+        self.assertTrue(blue > 200 and red < 50 and green < 50)
+
+        served = self.client.get(f"/api/v1/car-listings/{self.listings[0].pk}/").json()['listing_images']
+        self.assertEqual(next(entry for entry in served if entry['id'] == image.pk)['placeholder'], image.placeholder)
+
+    def test_command_fills_in_missing_placeholders(self):
+        storage = ListingImage._meta.get_field('path').storage
+        name = storage.save('listings/photo.jpg', ContentFile(jpeg_bytes((300, 600))))
+        # bulk_create sends no signal, like rows from before placeholders existed
+        ListingImage.objects.bulk_create([ListingImage(listing=listing, path=name) for listing in self.listings[:2]])
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('generate_placeholders', workers=1, stdout=out, stderr=err)
+        # The fixture's images have no file behind them
+        self.assertIn("6 files, 2 images updated, 5 errors", out.getvalue())
+        self.assertEqual(err.getvalue().count('No such file'), 5)
+
+        placeholders = set(ListingImage.objects.filter(path=name).values_list('placeholder', flat=True))
+        self.assertEqual(len(placeholders), 1)
+        self.assertEqual(decode_placeholder(placeholders.pop())[1].size, (8, 16))
+        self.assertFalse(ListingImage.objects.exclude(path=name).exclude(placeholder='').exists())
@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    CarListingsViewSet, InquiryCreateView, list_makes, list_models, top_makes, list_conditions, list_filters, RandomSimilarListingsView
+    CarListingsViewSet, InquiryCreateView, list_makes, list_models, top_makes, list_conditions, list_filters, RandomSimilarListingsView,
+    suggest, resized_image
 )
 
 
@@ -16,5 +17,7 @@ urlpatterns = [
     path('top-makes/', top_makes, name='top_makes-list'),
     path('conditions/', list_conditions, name='condition-list'),
     path('filters/', list_filters, name='filters-list'),
+    path('suggest/', suggest, name='suggest'),
+    path('img/<int:pk>/', resized_image, name='resized-image'),
     path('car-listings/<int:pk>/other/', RandomSimilarListingsView.as_view(), name='random-similar-listings'),
 ]
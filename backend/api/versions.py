@@ -0,0 +1,49 @@
+import time
+import uuid
+
+from django.core.cache import cache
+
+
+# ---------- Shared version tokens ----------
+#
+# A token per name in the shared cache. Anything derived from the
+# data behind a name (snapshots, indexes, cached counts) is keyed on or
+# checked against the token; bumping it makes every worker drop its copy.
+# Tokens start with the time they were made (hex milliseconds), which
+# serves as Last-Modified for anything derived from them.
+
+def _new_version():
+    return f"{time.time_ns() // 1_000_000:x}-{uuid.uuid4().hex[:16]}"
+
+
+def version_time(version):
+    """Seconds since the epoch at which ``version`` was made, or None for an older token."""
+    stamp, sep, _ = version.partition('-')
+    if not sep:
+        return None
+    try:
+        return int(stamp, 16) / 1000
+    except ValueError:
+        return None
+
+
+def get_version(name):
+    key = f"version:{name}"
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(name):
+    version = _new_version()
+    cache.set(f"version:{name}", version, None)
+    return version
+
+
+def get_versions(names):
+    """``get_version`` for several names in one cache round trip."""
+    found = cache.get_many([f"version:{name}" for name in names])
+    return [found.get(f"version:{name}") or get_version(name) for name in names]
@@ -1,17 +1,42 @@
+import logging
+
 from rest_framework import filters
 import django_filters
 from rest_framework import viewsets, mixins
 from rest_framework.exceptions import MethodNotAllowed
 from rest_framework.permissions import AllowAny
 from rest_framework import generics
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Count, Prefetch
+from django.db.models import prefetch_related_objects
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+from PIL import Image
 from rest_framework.views import APIView
 
+from . import resize
+from .conditional import ConditionalMixin, versions_modified, weak_etag
+from .facets import compute_facets
+from .fieldsets import listing_serializer_class
+from .fast_serializers import fast_serializer
+from .images import supported_formats
+from .listing_index import listing_index
+from .pagination import ListingKeysetPagination, uses_keyset_pagination
+from .query_budget import QueryBudgetMixin, with_query_budget
+from .query_plans import apply_query_plan, build_column_plan, build_query_plan
+from .recommendations import similar_listing_ids
+from .response_cache import CachedResponseMixin, cache_response, tag
+from .search import ListingSearchFilter
+from .snapshots import Snapshot, etag_matches
+from .suggest import suggest_index
+from .sorting import SORT_FIELDS, normalize_sort, sort_ordering
+from .versions import get_versions
 from .models import (
-    CarsListing, ModelName, Inquiry, Make, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature, SafetyFeature
+    CarsListing, ListingImage, ModelName, Inquiry, Make, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature,
+    SafetyFeature
 )
 from .serializers import (
     CarsListingSerializer, MakeSerializer, InquirySerializer, ModelSerializer, ColorSerializer, TransmissionSerializer,
@@ -19,6 +44,14 @@ from .serializers import (
     FeatureSerializer, SafetyFeatureSerializer
 )
 
+logger = logging.getLogger(__name__)
+
+# Everything a serialized listing is built from, for the response cache
+LISTING_MODELS = (
+    CarsListing, ListingImage, Make, ModelName, Color, Transmission, Condition, FuelType, DriveType, CarType, Feature,
+    SafetyFeature
+)
+
 # Inquiery - Views
 class InquiryCreateView(generics.CreateAPIView):
     queryset = Inquiry.objects.all()
@@ -26,18 +59,15 @@ class InquiryCreateView(generics.CreateAPIView):
     permission_classes = [AllowAny]
 
 # Lookup - Views
+@cache_response(Make, CarsListing)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def list_makes(request):
-    makes = (
-        Make.objects
-        .annotate(listings_count=Count('listings'))
-        .filter(listings_count__gt=0)
-        .order_by('name')
-    )
+    makes = Make.objects.filter(listings_count__gt=0).order_by('name')
     serializer = MakeSerializer(makes, many=True)
     return Response(serializer.data)
 
+@cache_response(ModelName, Make)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def list_models(request, make_id):
@@ -45,33 +75,56 @@ def list_models(request, make_id):
     serializer = ModelSerializer(models, many=True)
     return Response(serializer.data)
 
+TOP_MAKES = 4
+TOP_MAKE_LISTINGS = 8
+
+
+@cache_response(*LISTING_MODELS)
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@with_query_budget(TOP_MAKES + 2)
 def top_makes(request):
-    listings_prefetch = Prefetch(
-        'listings',
-        queryset=CarsListing.objects.all()[:8],
-        to_attr='limited_listings'
-    )
-    
-    top_makes = (
+    # Cards unless ?view= / ?fields= ask for something else
+    serializer_class = listing_serializer_class(request.query_params, default='card')
+
+    # listings_count is kept up to date by signals, so no COUNT over listings here
+    top_makes = list(
         Make.objects
-        .prefetch_related(listings_prefetch)
-        .annotate(count=Count('listings'))
-        .filter(count__gt=0)
-        .order_by('-count')[:4]
+        .filter(listings_count__gt=0)
+        .order_by('-listings_count', 'name')[:TOP_MAKES]
     )
 
+    fast = fast_serializer(serializer_class)
+    if fast is None:
+        select, prefetch = build_query_plan(serializer_class)
+        only = build_column_plan(serializer_class)
+        listings = CarsListing.objects.select_related(*select)
+        if only is not None:
+            listings = listings.only(*only)
+        newest = {
+            make.id: list(listings.filter(make=make).order_by('-created_at')[:TOP_MAKE_LISTINGS])
+            for make in top_makes
+        }
+        prefetch_related_objects([listing for listings in newest.values() for listing in listings], *prefetch)
+        cards = {
+            make_id: serializer_class(listings, many=True, context={'request': request}).data
+            for make_id, listings in newest.items()
+        }
+    else:
+        newest = {
+            make.id: list(fast.values(CarsListing.objects.filter(make=make).order_by('-created_at'))[:TOP_MAKE_LISTINGS])
+            for make in top_makes
+        }
+        # One images query for all the makes' cards
+        items = iter(fast.serialize([row for rows in newest.values() for row in rows], request))
+        cards = {make_id: [next(items) for _ in rows] for make_id, rows in newest.items()}
+
     result = [
         {
             'id': make.id,
             'name': make.name,
-            'count': make.count,
-            'limited_listings': CarsListingSerializer(
-                make.limited_listings,
-                many=True,
-                context={'request': request}
-            ).data
+            'count': make.listings_count,
+            'limited_listings': cards[make.id]
         }
         for make in top_makes
     ]
@@ -79,6 +132,7 @@ def top_makes(request):
     return Response(result)
 
 
+@cache_response(Condition)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def list_conditions(request):
@@ -87,11 +141,9 @@ def list_conditions(request):
     return Response(serializer.data)
 
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def list_filters(request):
+def build_filters_payload():
     makes = Make.objects.all().order_by('id')
-    models = ModelName.objects.all().order_by('id')
+    models = apply_query_plan(ModelName.objects.all(), ModelSerializer).order_by('id')
     colors = Color.objects.all().order_by('id')
     transmissions = Transmission.objects.all().order_by('id')
     conditions = Condition.objects.all().order_by('id')
@@ -101,47 +153,117 @@ def list_filters(request):
     features = Feature.objects.all().order_by('id')
     safety_features = SafetyFeature.objects.all().order_by('id')
 
-    makes_serializer = MakeSerializer(makes, many=True)
-    models_serializer = ModelSerializer(models, many=True)
-    colors_serializer = ColorSerializer(colors, many=True)
-    transmissions_serializer = TransmissionSerializer(transmissions, many=True)
-    conditions_serializer = ConditionSerializer(conditions, many=True)
-    fuel_types_serializer = FuelTypeSerializer(fuel_types, many=True)
-    drive_types_serializer = DriveTypeSerializer(drive_types, many=True)
-    car_types_serializer = CarTypeSerializer(car_types, many=True)
-    features_serializer = FeatureSerializer(features, many=True)
-    safety_features_serializer = SafetyFeatureSerializer(safety_features, many=True)
-
-    response_data = {
-        'makes': makes_serializer.data,
-        'models': models_serializer.data,
-        'colors': colors_serializer.data,
-        'transmissions': transmissions_serializer.data,
-        'conditions': conditions_serializer.data,
-        'fuel_types': fuel_types_serializer.data,
-        'drive_types': drive_types_serializer.data,
-        'car_types': car_types_serializer.data,
-        'features': features_serializer.data,
-        'safety_features': safety_features_serializer.data
+    return {
+        'makes': MakeSerializer(makes, many=True).data,
+        'models': ModelSerializer(models, many=True).data,
+        'colors': ColorSerializer(colors, many=True).data,
+        'transmissions': TransmissionSerializer(transmissions, many=True).data,
+        'conditions': ConditionSerializer(conditions, many=True).data,
+        'fuel_types': FuelTypeSerializer(fuel_types, many=True).data,
+        'drive_types': DriveTypeSerializer(drive_types, many=True).data,
+        'car_types': CarTypeSerializer(car_types, many=True).data,
+        'features': FeatureSerializer(features, many=True).data,
+        'safety_features': SafetyFeatureSerializer(safety_features, many=True).data
     }
 
-    return Response(response_data)
 
+# Rebuilt only when a lookup table changes (see signals.py)
+filters_snapshot = Snapshot('filters', build_filters_payload, timeout=60 * 60 * 24)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def list_filters(request):
+    body, etag = filters_snapshot.get()
+
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+SUGGEST_LIMIT = 8
 
-class RandomSimilarListingsView(APIView):
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@with_query_budget(3)
+def suggest(request):
+    # Served from memory; the three queries only run when the index is (re)loaded
+    try:
+        limit = max(1, int(request.query_params.get('limit', SUGGEST_LIMIT)))
+    except ValueError:
+        limit = SUGGEST_LIMIT
+    text = request.query_params.get('q', '')
+    return Response({'query': text, 'results': suggest_index.complete(text, limit)})
+
+
+class RandomSimilarListingsView(CachedResponseMixin, QueryBudgetMixin, APIView):
     permission_classes = [AllowAny]
+    cache_models = LISTING_MODELS
+    # Listings missing from the precomputed table are ranked on the spot
+    query_budget = 10
 
     def get(self, request, pk):
-        get_object_or_404(CarsListing, pk=pk)
+        similar_ids = similar_listing_ids(pk)
+        if similar_ids is None:
+            raise Http404
+
+        fast = fast_serializer(CarsListingSerializer)
+        if fast is not None:
+            by_id = {row['id']: row for row in fast.values(CarsListing.objects.filter(pk__in=similar_ids))}
+            return Response(fast.serialize([by_id[similar] for similar in similar_ids if similar in by_id], request))
 
-        qs = CarsListing.objects.exclude(pk=pk)
-        qs = qs.order_by('?')[:4]
+        qs = apply_query_plan(CarsListing.objects.all(), CarsListingSerializer)
+        by_id = qs.in_bulk(similar_ids)
+        listings = [by_id[similar] for similar in similar_ids if similar in by_id]
 
-        data = CarsListingSerializer(qs, many=True, context={'request': request}).data
+        data = CarsListingSerializer(listings, many=True, context={'request': request}).data
         return Response(data)
     
 
 
+# ---------- On-demand image sizes ----------
+
+@require_GET
+@with_query_budget(1)
+def resized_image(request, pk):
+    # Plain Django: DRF's content negotiation would turn image Accept headers into 406s
+    try:
+        width = int(request.GET.get('w', ''))
+    except ValueError:
+        width = None
+    if width not in resize.WIDTHS:
+        return JsonResponse({'w': [f"Must be one of {', '.join(map(str, resize.WIDTHS))}."]}, status=400)
+    image_format = request.GET.get('fmt') or resize.negotiate_format(request.META.get('HTTP_ACCEPT', ''))
+    if image_format not in supported_formats():
+        return JsonResponse({'fmt': [f"Must be one of {', '.join(supported_formats())}."]}, status=400)
+
+    name = ListingImage.objects.filter(pk=pk).values_list('path', flat=True).first()
+    if not name:
+        raise Http404
+    # Replacing the image's file changes its name, so the key covers its content
+    etag = f'"{resize.cache_key(name, width, image_format)}"'
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        storage = ListingImage._meta.get_field('path').storage
+        try:
+            content = resize.resized(storage, name, width, image_format)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            logger.exception("Could not resize image #%s (%s)", pk, name)
+            raise Http404
+        response = HttpResponse(content, content_type=resize.CONTENT_TYPES[image_format])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'public, max-age=86400'
+    if 'fmt' not in request.GET:
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
 # ---------- Filter class for Car Listings ----------
 
 class CarListingsFilter(django_filters.FilterSet):
@@ -173,17 +295,10 @@ class CarListingsFilter(django_filters.FilterSet):
     ), method='filter_sort')
 
     def filter_sort(self, queryset, name, value):
-        if value == 'created_at':
-            return queryset.order_by('-created_at')
-        if value == 'price':
-            return queryset.order_by('price')
-        if value == 'price_desc':
-            return queryset.order_by('-price')
-        if value == 'mileage':
-            return queryset.order_by('mileage')
-        if value == 'mileage_desc':
-            return queryset.order_by('-mileage')
-        return queryset
+        sort = normalize_sort(value)
+        if sort is None:
+            return queryset
+        return queryset.order_by(*sort_ordering(sort))
 
     class Meta:
         model = CarsListing
@@ -191,17 +306,137 @@ class CarListingsFilter(django_filters.FilterSet):
 
 # ---------- CarListings ViewSet ----------
 
-class CarListingsViewSet(viewsets.ModelViewSet):
+BATCH_MAX_IDS = 50
+
+
+def parse_batch_ids(value):
+    """``?ids=3,1,2`` as a list of ints in request order, without repeats."""
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ValidationError({'ids': "Expected a comma separated list of listing ids."})
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValidationError({'ids': "No listing ids given."})
+    if len(ids) > BATCH_MAX_IDS:
+        raise ValidationError({'ids': f"At most {BATCH_MAX_IDS} ids per request."})
+    return ids
+
+
+class CarListingsViewSet(ConditionalMixin, CachedResponseMixin, QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = CarsListing.objects.all()
+    cache_models = LISTING_MODELS
     serializer_class = CarsListingSerializer
     permission_classes = [AllowAny]
-    filter_backends = (django_filters.rest_framework.DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter)
+    filter_backends = (django_filters.rest_framework.DjangoFilterBackend, filters.OrderingFilter, ListingSearchFilter)
     filterset_class = CarListingsFilter
     ordering_fields = ['created_at', 'price', 'mileage']
-    search_fields = ['title']
+    cache_actions = ('list', 'retrieve', 'batch')
+    query_budget = {'list': 5, 'retrieve': 4, 'batch': 4}
 
     http_method_names = ['get']
 
+    def get_query_budget(self):
+        budget = super().get_query_budget()
+        if self.action == 'list':
+            # Model choice filters validate their value with one query each, facets add two
+            filters = self.filterset_class.base_filters
+            budget += sum(
+                1 for name in self.request.GET
+                if isinstance(filters.get(name), django_filters.ModelChoiceFilter)
+                or isinstance(filters.get(name), django_filters.ModelMultipleChoiceFilter)
+            )
+            if self.request.GET.get('facets') in ('1', 'true'):
+                budget += 2
+            # Search checks for full-text matches before falling back to trigrams
+            if self.request.GET.get('search', '').strip():
+                budget += 1
+            # A stale in-memory index reloads itself with three queries
+            if listing_index.enabled:
+                budget += 3
+        return budget
+
+    def get_serializer_class(self):
+        # ?view=card and ?fields=a,b narrow the payload, and with it the columns and prefetches
+        return listing_serializer_class(self.request.query_params)
+
     def get_queryset(self):
         queryset = super().get_queryset()
-        return queryset
\ No newline at end of file
+        return apply_query_plan(queryset, self.get_serializer_class(), SORT_FIELDS)
+
+    def get_validators(self, request, action, **kwargs):
+        if action in ('list', 'batch'):
+            # Any inventory change moves one of these versions on
+            versions = get_versions([tag(model) for model in LISTING_MODELS])
+            return weak_etag(*versions), versions_modified(versions)
+
+        if action == 'retrieve':
+            # The listing's own row (M2M edits touch updated_at too, see signals.py)
+            # plus everything else it is serialized from
+            updated_at = CarsListing.objects.filter(pk=kwargs.get('pk')).values_list('updated_at', flat=True).first()
+            if updated_at is None:
+                return None
+            versions = get_versions([tag(model) for model in LISTING_MODELS if model is not CarsListing])
+            modified = versions_modified(versions)
+            if modified is not None:
+                modified = max(modified, updated_at.timestamp())
+            return weak_etag(kwargs.get('pk'), updated_at.isoformat(), *versions), modified
+        return None
+
+    @property
+    def paginator(self):
+        # ?paginate=cursor (or a cursor from a previous page) switches to keyset paging
+        if not hasattr(self, '_paginator'):
+            if uses_keyset_pagination(self.request):
+                self._paginator = ListingKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def retrieve(self, request, *args, **kwargs):
+        fast = fast_serializer(self.get_serializer_class())
+        if fast is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(fast.values(self.get_queryset()))
+        row = generics.get_object_or_404(queryset, **{self.lookup_field: kwargs[lookup]})
+        return Response(fast.serialize([row], request)[0])
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """
+        ``?ids=3,1,2``: those listings in that order, in the same few queries
+        however many are asked for, plus the ids that don't exist.
+        """
+        ids = parse_batch_ids(request.query_params.get('ids', ''))
+        queryset = self.get_queryset().filter(pk__in=ids)
+
+        fast = fast_serializer(self.get_serializer_class())
+        if fast is None:
+            by_id = {listing.pk: listing for listing in queryset}
+            found = [by_id[pk] for pk in ids if pk in by_id]
+            results = self.get_serializer(found, many=True).data
+        else:
+            by_id = {row['id']: row for row in fast.values(queryset)}
+            found = [by_id[pk] for pk in ids if pk in by_id]
+            results = fast.serialize(found, request)
+        return Response({'results': results, 'missing': [pk for pk in ids if pk not in by_id]})
+
+    def list(self, request, *args, **kwargs):
+        # With fast serializers enabled the page is fetched as .values() rows
+        fast = fast_serializer(self.get_serializer_class())
+        rows = (lambda queryset: queryset) if fast is None else (lambda queryset: fast.values(queryset, *SORT_FIELDS))
+
+        # The in-memory index answers the query when it can, the ORM otherwise
+        result = listing_index.search(request.query_params, rows(self.get_queryset()))
+        filtered = self.filter_queryset(self.get_queryset()) if result is None else None
+
+        page = self.paginate_queryset(rows(filtered) if result is None else result)
+        data = self.get_serializer(page, many=True).data if fast is None else fast.serialize(page, request)
+        response = self.get_paginated_response(data)
+
+        # ?facets=1 adds per-value counts for the current filter set
+        if request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = compute_facets(filtered) if result is None else result.facets()
+        return response
@@ -2,6 +2,7 @@ from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
 import os
+import sys
 
 DATE_FORMAT = "d.m.Y"
 DATETIME_FORMAT = "d.m.Y - hh:mm"
@@ -19,6 +20,9 @@ SECRET_KEY = os.getenv("DJ_SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
+
+# Views over their query budget raise instead of only logging (see api/query_budget.py)
+QUERY_BUDGET_STRICT = DEBUG or os.getenv("QUERY_BUDGET_STRICT") == "1" or sys.argv[1:2] == ["test"]
 ALLOWED_HOSTS = ["zoom-vintageclassics.com", "www.zoom-vintageclassics.com"]
 CSRF_TRUSTED_ORIGINS = [
     "https://zoom-vintageclassics.com",
@@ -43,6 +47,10 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.IsAuthenticated",
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12,
 }
@@ -65,6 +73,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     "api",
     "rest_framework",
     "rest_framework.authtoken",
@@ -109,15 +118,81 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # django.db.backends.postgresql plus connection metrics (api/db/base.py)
+        'ENGINE': 'api.db',
         'NAME': os.getenv('DB_NAME', 'mydb'),
         'USER': os.getenv('DB_USER', 'myuser'),
         'PASSWORD': os.getenv('DB_PASSWORD', 'mypassword'),
         'HOST': os.getenv('DB_HOST', 'db'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Keep each thread's connection between requests, checked before reuse.
+        # That is one connection per gunicorn thread: see the connection budget
+        # in gunicorn.conf.py
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '300')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': 5,
+        },
     }
 }
 
+# DB_POOL=1: a psycopg pool per worker process instead of one connection per
+# thread, sized to the gunicorn threads by default. Needs psycopg 3, which
+# requirements.txt doesn't install (pip install "psycopg[binary,pool]"; Django
+# then uses it instead of psycopg2); without it every connection attempt fails.
+if os.getenv('DB_POOL') == '1':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', os.getenv('GUNICORN_THREADS', '4'))),
+        # Seconds a request waits for a free connection before failing
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    }
+
+
+# Cache
+# Shared between workers: Redis when REDIS_URL is set, otherwise a file cache. The image
+# job worker bumps versions in it, so it must see the same CACHE_DIR as the web processes.
+
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv("CACHE_DIR", "/tmp/django_cache"),
+        }
+    }
+
+
+# Public read-only API responses (api/response_cache.py): a per-process LRU of
+# RESPONSE_CACHE_LOCAL_SIZE entries in front of the shared cache above
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_SHARED = os.getenv("RESPONSE_CACHE_SHARED", "1") == "1"
+RESPONSE_CACHE_LOCAL_SIZE = int(os.getenv("RESPONSE_CACHE_LOCAL_SIZE", "512"))
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Serialize listing payloads from .values() rows with api/fast_serializers.py
+FAST_SERIALIZERS_ENABLED = os.getenv("FAST_SERIALIZERS", "1") == "1"
+
+
+# Serve /car-listings/ filtering, sorting and paging from an in-process index (api/listing_index.py)
+LISTING_INDEX_ENABLED = os.getenv("LISTING_INDEX") == "1"
+
+
+# Resize uploads in the request instead of queueing them for manage.py process_image_jobs
+IMAGE_JOBS_INLINE = os.getenv("IMAGE_JOBS_INLINE") == "1"
+
+# /api/v1/img/<id>/ resizes on demand into this LRU disk cache (api/resize.py)
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "/tmp/image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -159,6 +234,17 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    # ListingImage files, stored once per distinct content (api/storage.py)
+    "listing_images": {"BACKEND": "api.storage.ContentAddressedStorage"},
+}
+
+# Sitemaps and per-listing <head> metadata (api/seo.py), served by nginx and read by the SSR server
+SITE_URL = os.getenv("SITE_URL", "https://zoom-vintageclassics.com")
+SEO_ROOT = os.getenv("SEO_ROOT", os.path.join(MEDIA_ROOT, 'seo'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -27,5 +27,11 @@ if not User.objects.filter(username='admin').exists():
     )
 "
 
-echo "🚀 Pornesc serverul..."
-exec python manage.py runserver 0.0.0.0:8000
+if [ "$DJANGO_RUNSERVER" = "1" ]; then
+  echo "🚀 Pornesc serverul de dezvoltare..."
+  exec python manage.py runserver 0.0.0.0:8000
+fi
+
+# Workers, threads and recycling are set in gunicorn.conf.py
+echo "🚀 Pornesc gunicorn..."
+exec gunicorn backend.wsgi:application --config gunicorn.conf.py
@@ -0,0 +1,54 @@
+import os
+
+
+# ---------- Gunicorn settings for backend.wsgi ----------
+#
+# Every value can be overridden from the environment (or with
+# GUNICORN_CMD_ARGS). Reload code and workers without dropping requests
+# with `kill -HUP <master pid>`, e.g. `docker compose kill -s HUP backend`.
+
+def _cores():
+    try:
+        # CPUs this container may actually run on, not the host's
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+
+# The views are sync and spend most of their time waiting on Postgres,
+# so threaded workers rather than an async server
+worker_class = "gthread"
+threads = _env_int("GUNICORN_THREADS", 4)
+
+# Each thread keeps its own Postgres connection (CONN_MAX_AGE in
+# settings.py; with DB_POOL=1 each worker's pool holds up to `threads`), so
+# this container uses up to workers * threads connections. Together with
+# the image worker and maintenance sessions that must stay under the
+# server's max_connections (100 by default), so the default worker count
+# keeps workers * threads within GUNICORN_MAX_DB_CONNECTIONS. An explicit
+# WEB_CONCURRENCY is taken as is: raise max_connections to match.
+max_db_connections = _env_int("GUNICORN_MAX_DB_CONNECTIONS", 64)
+workers = _env_int("WEB_CONCURRENCY", max(1, min(2 * _cores() + 1, max_db_connections // threads)))
+
+# Recycle workers to cap memory growth; the jitter keeps them from restarting together
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 2000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 200)
+
+timeout = _env_int("GUNICORN_TIMEOUT", 60)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+
+# Behind nginx: trust its X-Forwarded-* headers
+forwarded_allow_ips = os.getenv("GUNICORN_FORWARDED_ALLOW_IPS", "*")
+
+# nginx already logs every request
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
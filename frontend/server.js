@@ -1,4 +1,5 @@
 import fs from 'node:fs/promises'
+import path from 'node:path'
 import express from 'express'
 import axios from 'axios'
 import 'dotenv/config'
@@ -38,30 +39,85 @@ if (!isProduction) {
   app.use(base, sirv('./dist/client', { extensions: [] }))
 }
 
+// Sitemaps and listing <head> metadata written by the backend's manage.py build_sitemap
+const seoDir = process.env.SEO_DIR || './seo'
+
 // Serve HTML
 app.get('/sitemap.xml', async (req, res) => {
-  res.sendFile(process.cwd() + '/sitemap.xml', {
+  res.sendFile(path.resolve(seoDir, 'sitemap.xml'), {
     headers: {
       'Content-Type': 'application/xml'
     }
   });
 });
 
+// Listing id -> { etag, data }; revalidated with If-None-Match on every render
+const listingCache = new Map()
+const LISTING_CACHE_SIZE = 500
+
 const fetchListingData = async (slug) => {
 
   const parts = slug.split('-');
   const id = parts.pop();
+  const cached = listingCache.get(id)
 
   try {
-    const res = await serverApi.get(`/car-listings/${id}/`)
-    return res.data;
+    const res = await serverApi.get(`/car-listings/${id}/`, {
+      headers: cached ? { 'If-None-Match': cached.etag } : {},
+      validateStatus: (status) => status === 200 || status === 304,
+    })
+    const data = res.status === 304 ? cached.data : res.data
+
+    listingCache.delete(id)
+    if (res.headers.etag) {
+      listingCache.set(id, { etag: res.headers.etag, data })
+      if (listingCache.size > LISTING_CACHE_SIZE) {
+        listingCache.delete(listingCache.keys().next().value)
+      }
+    }
+    return data;
   } catch (error) {
+    listingCache.delete(id)
     console.error("Error fetching listing")
   }
 
   return null
 }
 
+const escapeHtml = (value) => String(value ?? '')
+  .replace(/&/g, '&amp;')
+  .replace(/</g, '&lt;')
+  .replace(/>/g, '&gt;')
+  .replace(/"/g, '&quot;')
+  .replace(/'/g, '&#39;')
+
+// The precomputed metadata file, or the same fields from the API when it is missing
+const fetchListingMeta = async (slug) => {
+  const id = slug.split('-').pop()
+  if (!/^\d+$/.test(id)) {
+    return null
+  }
+
+  try {
+    return JSON.parse(await fs.readFile(path.join(seoDir, 'listings', `${id}.json`), 'utf-8'))
+  } catch (error) {
+    if (error.code !== 'ENOENT') {
+      console.error("Error reading listing metadata")
+    }
+  }
+
+  const listing = await fetchListingData(slug)
+  if (!listing) {
+    return null
+  }
+  return {
+    title: listing.title,
+    description: listing.description,
+    url: `https://zoom-vintageclassics.com/listing/${slug}`,
+    image: listing.listing_images[0]?.path,
+  }
+}
+
 app.use('*all', async (req, res) => {
   try {
     const url = req.originalUrl.replace(base, '')
@@ -83,23 +139,27 @@ app.use('*all', async (req, res) => {
     const m = url.match(/^\/listing\/([^\/?#]+)/)
     if (m && m[1]) {
       const slug = decodeURIComponent(m[1])
-      const listing = await fetchListingData(slug)
+      const listing = await fetchListingMeta(slug)
 
       if (listing) {
+        const title = escapeHtml(`${listing.title} | Zoom Vintage Classics`)
+        const description = escapeHtml(listing.description)
+        const image = escapeHtml(listing.image)
         dynamicHead = `
-          <title>${listing.title} | Zoom Vintage Classics</title>
-          <meta name="description" content="${listing.description}" />
+          <title>${title}</title>
+          <meta name="description" content="${description}" />
+          <link rel="canonical" href="${escapeHtml(listing.url)}" />
 
           <meta property="og:type" content="website" />
-          <meta property="og:url" content="https://zoom-vintageclassics.com/listing/${slug}" />
-          <meta property="og:title" content="${listing.title} | Zoom Vintage Classics" />
-          <meta property="og:description" content="${listing.description}" />
-          <meta property="og:image" content="${listing.listing_images[0].path}" />
+          <meta property="og:url" content="${escapeHtml(listing.url)}" />
+          <meta property="og:title" content="${title}" />
+          <meta property="og:description" content="${description}" />
+          <meta property="og:image" content="${image}" />
 
           <meta name="twitter:card" content="summary_large_image" />
-          <meta name="twitter:title" content="${listing.title} | Zoom Vintage Classics" />
-          <meta name="twitter:description" content="${listing.description}" />
-          <meta name="twitter:image" content="${listing.listing_images[0].path}" />
+          <meta name="twitter:title" content="${title}" />
+          <meta name="twitter:description" content="${description}" />
+          <meta name="twitter:image" content="${image}" />
         `
       }
     }
@@ -3,7 +3,8 @@ import { Link } from 'react-router';
 const ListingCard = ({ listing }) => {
   return (
     <Link to={`/listing/${listing.title.toLowerCase().replace(/\s+/g, '-')}-${listing.id}`} className='shadow-md rounded-md flex flex-col overflow-hidden h-full  w-full group'>
-        <div className="bg-gray-200 min-h-[100px] h-full">
+        <div className="bg-gray-200 bg-cover bg-center min-h-[100px] h-full"
+             style={{ backgroundImage: listing.listing_images[0].placeholder ? `url(${listing.listing_images[0].placeholder})` : undefined }}>
           <img 
                src={listing.listing_images[0].path} 
                alt={`${listing.make.name} ${listing.model.name} ${listing.year}`} 
@@ -26,7 +26,7 @@ const Home = () => {
   useEffect(() => {
     const fetchListings = async () => {
       try {
-        const res = await api.get('/car-listings/');
+        const res = await api.get('/car-listings/?view=card');
         setListings(res.data.results)
       } catch (error) {
         console.error('Error fetching listings');
@@ -106,7 +106,8 @@ const Home = () => {
           {
             listings.length !== 0 &&
             <Link to={`/listing/${listings[0].title.toLowerCase().replace(/\s+/g, '-')}-${listings[0].id}`} className='shadow-md rounded-md flex flex-col overflow-hidden  w-full group col-span-4 row-span-2'>
-              <div className="bg-gray-200 min-h-[100px] h-full">
+              <div className="bg-gray-200 bg-cover bg-center min-h-[100px] h-full"
+                   style={{ backgroundImage: listings[0].listing_images[0].placeholder ? `url(${listings[0].listing_images[0].placeholder})` : undefined }}>
                 <img
                   src={listings[0].listing_images[0].path}
                   alt={`${listings[0].make.name} ${listings[0].model.name} ${listings[0].year}`}
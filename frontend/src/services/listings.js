@@ -2,7 +2,8 @@
 import api from '../api';
 
 export async function fetchListingsWithFilters({ params, featureIds, safetyIds }) {
-  const sp = new URLSearchParams();
+  // only ListingCard fields
+  const sp = new URLSearchParams({ view: 'card' });
 
   // base params (includes `ordering` if provided)
   Object.entries(params).forEach(([k, v]) => {